@@ -0,0 +1,96 @@
+"""Graph analytics time and memory versus edge count.
+
+Builds CSR snapshots of synthetic sparse graphs and times PageRank,
+communities and modularity, and shortest paths between random node pairs
+(no database involved). With --db the graph is loaded into SQLite and the
+full snapshot load, analysis and write-back round trip is timed as well,
+then repeated to show that an unchanged graph writes nothing.
+
+    python -m benchmarks.bench_analytics --scales 100000 500000 --db
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_layout import random_graph
+from benchmarks.common import discard_app, make_app, seed_graph
+from services.graph_analytics import (GraphSnapshot, analyze, modularity, pagerank, shortest_path, stable_labels,
+                                      write_analytics)
+from services.layout_service import label_propagation
+
+
+def seconds(started):
+    return round(time.perf_counter() - started, 3)
+
+
+def run(scale, paths, with_db, seed=0):
+    src, dst, weight = random_graph(scale, seed=seed)
+    ids = np.arange(1, scale + 1, dtype=np.int64)
+    result = {"scale": scale, "edges": len(src)}
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    snapshot = GraphSnapshot(ids, src, dst, weight)
+    result["snapshot_seconds"] = seconds(started)
+    result["snapshot_mb"] = round(snapshot.nbytes / 2 ** 20, 1)
+
+    started = time.perf_counter()
+    pagerank(snapshot)
+    result["pagerank_seconds"] = seconds(started)
+
+    started = time.perf_counter()
+    communities = label_propagation(snapshot.node_count, *snapshot.edges())
+    communities = stable_labels(communities, np.full(scale, np.nan))
+    result["modularity"] = round(modularity(snapshot, communities), 4)
+    result["communities_seconds"] = seconds(started)
+    result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    tracemalloc.stop()
+
+    rng = np.random.default_rng(seed)
+    latencies = []
+    for source, target in rng.integers(1, scale + 1, (paths, 2)):
+        started = time.perf_counter()
+        shortest_path(snapshot, source, target)
+        latencies.append((time.perf_counter() - started) * 1000)
+    result["path_p50_ms"] = round(float(np.percentile(latencies, 50)), 2)
+    result["path_p99_ms"] = round(float(np.percentile(latencies, 99)), 2)
+
+    if with_db:
+        app = make_app()
+        try:
+            with app.app_context():
+                seed_graph(scale)
+                started = time.perf_counter()
+                result["db_updated"] = write_analytics(analyze())
+                result["db_seconds"] = seconds(started)
+                # Cached analysis, unchanged styles: nothing to write
+                started = time.perf_counter()
+                result["db_rerun_updated"] = write_analytics(analyze())
+                result["db_rerun_seconds"] = seconds(started)
+        finally:
+            discard_app(app)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[100000, 500000])
+    parser.add_argument("--paths", type=int, default=20, help="shortest-path queries per scale")
+    parser.add_argument("--db", action="store_true", help="also time the round trip through SQLite")
+    args = parser.parse_args()
+
+    results = [run(scale, args.paths, args.db) for scale in args.scales]
+    for result in results:
+        print(f"{result['scale']:>9} nodes, {result['edges']:>9} edges: snapshot {result['snapshot_seconds']}s "
+              f"({result['snapshot_mb']} MB), pagerank {result['pagerank_seconds']}s, "
+              f"communities {result['communities_seconds']}s, path p50 {result['path_p50_ms']}ms "
+              f"p99 {result['path_p99_ms']}ms, peak {result['peak_mb']} MB"
+              + (f", end-to-end {result['db_seconds']}s ({result['db_updated']} nodes written)" if args.db else ""))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
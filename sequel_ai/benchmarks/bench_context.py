@@ -0,0 +1,107 @@
+"""Conversation context assembly latency and prompt size for long sessions.
+
+Seeds a graph and one session with N turns, then times build_context() for
+the first call (which builds the session summary) and for a sequence of
+follow-up turns, each stored before the next is assembled as in a real
+conversation. Prompt size is reported in estimated tokens next to what
+sending the whole history would cost.
+
+    python -m benchmarks.bench_context --turns 1000 10000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from benchmarks.common import concept_label, discard_app, make_app, seed_graph
+from models.db_model import db
+from services.context_service import TOKEN_BUDGET, build_context, estimate_tokens
+
+SESSION = "bench-session"
+INSERT_TURN = text("INSERT INTO chat (message, response, timestamp, session_id) "
+                   "VALUES (:message, :response, :now, :session)")
+
+
+def turn_text(rng, n_nodes):
+    label = concept_label(rng.randrange(n_nodes))
+    other = concept_label(rng.randrange(n_nodes))
+    message = f"How does {label} compare to {other} in practice?"
+    response = (f"{label} and {other} solve related problems. " * 4 +
+                "The main difference is how each one trades memory for latency under load. " * 6)
+    return message, response
+
+
+def seed_session(turns, n_nodes, rng, chunk=5000):
+    now = datetime.utcnow()
+    history_tokens = 0
+    for start in range(0, turns, chunk):
+        rows = []
+        for _ in range(start, min(turns, start + chunk)):
+            message, response = turn_text(rng, n_nodes)
+            history_tokens += estimate_tokens(message) + estimate_tokens(response)
+            rows.append({"message": message, "response": response, "session": SESSION, "now": now})
+        db.session.execute(INSERT_TURN, rows)
+    db.session.commit()
+    return history_tokens
+
+
+def run(turns, follow_ups, n_nodes=5000, seed=0):
+    rng = random.Random(seed)
+    app = make_app()
+    try:
+        with app.app_context():
+            seed_graph(n_nodes)
+            history_tokens = seed_session(turns, n_nodes, rng)
+
+            message, _ = turn_text(rng, n_nodes)
+            started = time.perf_counter()
+            context = build_context(SESSION, message)
+            db.session.commit()
+            first_ms = (time.perf_counter() - started) * 1000
+
+            latencies = []
+            tokens = [context["tokens"]]
+            for _ in range(follow_ups):
+                message, response = turn_text(rng, n_nodes)
+                started = time.perf_counter()
+                context = build_context(SESSION, message)
+                latencies.append((time.perf_counter() - started) * 1000)
+                tokens.append(context["tokens"])
+                db.session.execute(INSERT_TURN, {"message": message, "response": response,
+                                                 "now": datetime.utcnow(), "session": SESSION})
+                db.session.commit()
+        latencies = np.array(latencies)
+        return {
+            "turns": turns,
+            "first_call_ms": round(first_ms, 2),
+            "assembly_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "assembly_p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            "prompt_tokens_max": max(tokens),
+            "token_budget": TOKEN_BUDGET,
+            "full_history_tokens": history_tokens,
+            "messages": len(context["messages"]),
+        }
+    finally:
+        discard_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--follow-ups", type=int, default=200, help="turns assembled and stored after seeding")
+    args = parser.parse_args()
+
+    results = [run(turns, args.follow_ups) for turns in args.turns]
+    for result in results:
+        print(f"{result['turns']:>7} turns: first call {result['first_call_ms']}ms, "
+              f"p50 {result['assembly_p50_ms']}ms, p99 {result['assembly_p99_ms']}ms, "
+              f"prompt <= {result['prompt_tokens_max']} tokens (full history {result['full_history_tokens']})")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Concept extraction throughput in conversations per second.
+
+Compares the original one-conversation-at-a-time extractor with the
+batch API, and with the process pool used for whole-table backfills.
+No database is involved.
+
+    python -m benchmarks.bench_extract --conversations 50000 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from benchmarks.common import synthetic_conversations
+from services.concept_extractor import extract_parallel, extraction_pool, get_extractor
+
+
+def legacy_find_concepts(message, response):
+    """The extractor before batching, kept here as the baseline"""
+    combined_text = message + " " + response
+    concepts = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', combined_text)
+    stop_words = ["I", "You", "He", "She", "It", "We", "They", "This", "That", "These", "Those"]
+    concepts = [c for c in concepts if c not in stop_words]
+    unique_concepts = []
+    for concept in concepts:
+        if concept not in unique_concepts:
+            unique_concepts.append(concept)
+    return unique_concepts[:5]
+
+
+def rate(count, fn):
+    started = time.perf_counter()
+    fn()
+    return round(count / (time.perf_counter() - started), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    pairs = synthetic_conversations(args.conversations)
+    extractor = get_extractor()
+    count = len(pairs)
+    result = {"conversations": count, "cpus": os.cpu_count(), "conversations_per_second": {}}
+    rates = result["conversations_per_second"]
+
+    rates["legacy_one_at_a_time"] = rate(count, lambda: [legacy_find_concepts(m, r) for m, r in pairs])
+    rates["extract_one_at_a_time"] = rate(count, lambda: [extractor.extract(m, r) for m, r in pairs])
+    extractor.document_frequencies.clear()
+    rates[f"extract_batch_{args.batch_size}"] = rate(count, lambda: [
+        extractor.extract_batch(pairs[start:start + args.batch_size])
+        for start in range(0, count, args.batch_size)])
+    for workers in args.workers:
+        if workers <= 1:
+            continue
+        extractor.document_frequencies.clear()
+        with extraction_pool(workers) as pool:
+            # Start the workers before timing
+            extract_parallel(pairs[:10], pool, chunk_size=1)
+            rates[f"process_pool_{workers}"] = rate(count, lambda: extract_parallel(pairs, pool))
+
+    for name, value in rates.items():
+        print(f"{name:<24} {value:>10} conversations/s")
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Latency and peak memory of the graph query modes at several graph sizes.
+
+    python -m benchmarks.bench_graph_api --scales 10000 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import discard_app, make_app, seed_graph
+from services.graph_query import iter_graph_ndjson, neighborhood, page, top_nodes
+from services.graph_service import get_graph_data
+
+
+def measure(fn):
+    """Run fn once; returns (seconds, peak traced bytes)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(elapsed, 4), peak
+
+
+def drain_ndjson():
+    for _ in iter_graph_ndjson():
+        pass
+
+
+SCENARIOS = {
+    "full_json": lambda: json.dumps(get_graph_data()),
+    "ndjson_stream": drain_ndjson,
+    "neighborhood_2hop": lambda: json.dumps(neighborhood(1, hops=2, limit=500)),
+    "top_100_degree": lambda: json.dumps(top_nodes(100)),
+    "page_1000": lambda: json.dumps(page("nodes", 0, 1000)),
+}
+
+
+def run(scale, scenarios):
+    app = make_app()
+    try:
+        with app.app_context():
+            seed_graph(scale)
+            result = {"scale": scale}
+            for name in scenarios:
+                seconds, peak = measure(SCENARIOS[name])
+                result[name] = {"seconds": seconds, "peak_mb": round(peak / 1e6, 2)}
+            return result
+    finally:
+        discard_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    results = [run(scale, args.scenarios) for scale in args.scales]
+    for result in results:
+        for name in args.scenarios:
+            print(f"{result['scale']:>9} nodes  {name:<18} {result[name]['seconds']:>8}s  "
+                  f"peak {result[name]['peak_mb']:>8} MB")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Knowledge-graph ingestion rate at several graph sizes.
+
+Seeds a throwaway SQLite database with N nodes, then measures how many
+conversations per second the bulk upsert path can fold into the graph.
+
+    python -m benchmarks.bench_ingest --scales 10000 100000 1000000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import discard_app, make_app, seed_graph, synthetic_concept_sets
+from models.db_model import db, Node, Edge
+from services.chat_service import add_concept_sets_to_graph
+
+
+def run(scale, conversations=2000, batch_size=50):
+    app = make_app()
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            seed_graph(scale)
+            seed_seconds = time.perf_counter() - started
+
+            concept_sets = synthetic_concept_sets(conversations, scale)
+            started = time.perf_counter()
+            for start in range(0, conversations, batch_size):
+                add_concept_sets_to_graph(concept_sets[start:start + batch_size])
+                db.session.commit()
+            elapsed = time.perf_counter() - started
+
+            return {
+                "scale": scale,
+                "seed_seconds": round(seed_seconds, 3),
+                "conversations": conversations,
+                "batch_size": batch_size,
+                "seconds": round(elapsed, 3),
+                "conversations_per_second": round(conversations / elapsed, 1),
+                "nodes": Node.query.count(),
+                "edges": Edge.query.count(),
+            }
+    finally:
+        discard_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    results = [run(scale, args.conversations, args.batch_size) for scale in args.scales]
+    for result in results:
+        print(f"{result['scale']:>9} nodes: {result['conversations_per_second']:>8} conversations/s "
+              f"({result['edges']} edges after ingest)")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Server-side layout time versus node count.
+
+Times the vectorised force-directed layout and label-propagation
+communities on synthetic sparse graphs (no database involved), and
+optionally the full compute_layout() round trip through SQLite.
+
+    python -m benchmarks.bench_layout --scales 1000 10000 100000 --db
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.common import discard_app, make_app, seed_graph
+from services.layout_service import compute_layout, force_layout, label_propagation
+
+
+def random_graph(n, avg_degree=4, seed=0):
+    rng = np.random.default_rng(seed)
+    m = n * avg_degree // 2
+    src = rng.integers(0, n, m)
+    dst = rng.integers(0, n, m)
+    keep = src != dst
+    return src[keep], dst[keep], rng.random(int(keep.sum()))
+
+
+def run(scale, iterations, with_db):
+    src, dst, weight = random_graph(scale)
+    result = {"scale": scale, "edges": len(src), "iterations": iterations}
+
+    started = time.perf_counter()
+    force_layout(scale, src, dst, weight, iterations=iterations)
+    result["layout_seconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    communities = label_propagation(scale, src, dst, weight)
+    result["communities_seconds"] = round(time.perf_counter() - started, 3)
+    result["communities"] = int(communities.max()) + 1
+
+    if with_db:
+        app = make_app()
+        try:
+            with app.app_context():
+                seed_graph(scale)
+                started = time.perf_counter()
+                compute_layout(iterations)
+                result["compute_layout_seconds"] = round(time.perf_counter() - started, 3)
+        finally:
+            discard_app(app)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--db", action="store_true", help="also time compute_layout() against SQLite")
+    args = parser.parse_args()
+
+    results = [run(scale, args.iterations, args.db) for scale in args.scales]
+    for result in results:
+        print(f"{result['scale']:>9} nodes: layout {result['layout_seconds']}s, "
+              f"communities {result['communities_seconds']}s ({result['communities']} found)"
+              + (f", end-to-end {result['compute_layout_seconds']}s" if args.db else ""))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
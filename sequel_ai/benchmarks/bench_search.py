@@ -0,0 +1,107 @@
+"""Chat search latency: full-text queries and "conversations mentioning X".
+
+Bulk-loads N synthetic chats (the full-text index is filled by its
+triggers, as in production) linked to a seeded graph, then times ranked and
+newest-first searches for common and rare terms, deep pages, and concept
+lookups for popular and rare concepts.
+
+    python -m benchmarks.bench_search --scales 100000 1000000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from benchmarks.common import WORDS, concept_label, discard_app, make_app, seed_graph
+from models.db_model import db
+from services.search_service import backfill_search, chats_for_concept, search_chats
+
+FILLER = ("latency", "throughput", "memory", "index", "tradeoff", "design", "failure", "scaling")
+
+
+def seed_chats(count, n_nodes, rng, chunk=20000):
+    """Chats mentioning 3 concepts each; concept popularity is skewed like real traffic"""
+    now = datetime.utcnow()
+    loaded = 0
+    for start in range(0, count, chunk):
+        chats, links = [], []
+        for chat_id in range(start + 1, min(count, start + chunk) + 1):
+            nodes = {min(n_nodes, int(rng.paretovariate(1.2))) for _ in range(3)}
+            labels = [concept_label(node - 1) for node in nodes]
+            words = " ".join(rng.choice(FILLER) for _ in range(12))
+            chats.append({"id": chat_id, "now": now, "session": f"s{chat_id // 50}",
+                          "message": f"How does {labels[0]} relate to {' and '.join(labels[1:]) or 'Python'}?",
+                          "response": f"{', '.join(labels)} differ mainly in {words}. Token {chat_id} explains why."})
+            links.extend({"chat": chat_id, "node": node} for node in nodes)
+        db.session.execute(text("INSERT INTO chat (id, message, response, timestamp, session_id) "
+                                "VALUES (:id, :message, :response, :now, :session)"), chats)
+        db.session.execute(text("INSERT INTO chat_concept (chat_id, node_id) VALUES (:chat, :node)"), links)
+        db.session.commit()
+        loaded += len(chats)
+    return loaded
+
+
+def timed(fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies = np.array(latencies)
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2)}
+
+
+def run(scale, n_nodes=20000, repeats=50, seed=0):
+    rng = random.Random(seed)
+    app = make_app()
+    try:
+        with app.app_context():
+            seed_graph(n_nodes)
+            started = time.perf_counter()
+            seed_chats(scale, n_nodes, rng)
+            result = {"scale": scale, "load_seconds": round(time.perf_counter() - started, 2)}
+
+            common, rare = WORDS[0].lower(), f"{scale // 2}"
+            queries = {
+                "rank_common_term": lambda: search_chats(common),
+                "rank_two_terms": lambda: search_chats(f"{common} {FILLER[0]}"),
+                "rank_rare_term": lambda: search_chats(f"token {rare}"),
+                "rank_offset_500": lambda: search_chats(common, offset=500),
+                "recent_common_term": lambda: search_chats(common, sort="recent"),
+                "recent_deep_page": lambda: search_chats(common, sort="recent", before=scale // 10),
+                "recent_in_session": lambda: search_chats(FILLER[1], sort="recent", session_id=f"s{scale // 100}"),
+                "concept_popular": lambda: chats_for_concept(node_id=1),
+                "concept_popular_deep": lambda: chats_for_concept(node_id=1, before=scale // 10),
+                "concept_rare_by_label": lambda: chats_for_concept(label=concept_label(n_nodes - 1)),
+            }
+            result["queries"] = {name: timed(fn, repeats) for name, fn in queries.items()}
+
+            started = time.perf_counter()
+            backfill_search(batch_size=10000)
+            result["backfill_seconds"] = round(time.perf_counter() - started, 2)
+        return result
+    finally:
+        discard_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    results = [run(scale, repeats=args.repeats) for scale in args.scales]
+    for result in results:
+        print(f"{result['scale']} chats (loaded in {result['load_seconds']}s, backfill {result['backfill_seconds']}s)")
+        for name, stats in result["queries"].items():
+            print(f"  {name:<24} p50 {stats['p50_ms']:>8}ms  p99 {stats['p99_ms']:>8}ms")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
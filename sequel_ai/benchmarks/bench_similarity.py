@@ -0,0 +1,85 @@
+"""Concept similarity index build time and k-NN lookup latency.
+
+Indexes N synthetic concept labels in a throwaway directory, then times
+single-concept lookups (the per-concept cost paid at ingest), batched
+k-NN queries and incremental appends. No database is involved.
+
+    python -m benchmarks.bench_similarity --scales 10000 100000 250000
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import concept_label
+from services.similarity_index import SimilarityIndex
+
+
+def run(scale, lookups=200, batch_size=100, k=10, seed=0):
+    path = tempfile.mkdtemp(prefix="sequel_similarity_")
+    rng = random.Random(seed)
+    try:
+        index = SimilarityIndex(path)
+        result = {"scale": scale, "k": k}
+
+        started = time.perf_counter()
+        for start in range(0, scale, 50000):
+            stop = min(scale, start + 50000)
+            index.add(list(range(start + 1, stop + 1)), [concept_label(i) for i in range(start, stop)])
+        result["build_seconds"] = round(time.perf_counter() - started, 3)
+
+        # The first query materialises the weighted matrix; time it separately
+        started = time.perf_counter()
+        index.query([concept_label(scale)], k=k)
+        result["first_query_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        latencies = []
+        for _ in range(lookups):
+            label = concept_label(rng.randrange(scale * 2))
+            started = time.perf_counter()
+            index.query([label], k=k)
+            latencies.append(time.perf_counter() - started)
+        latencies = np.array(latencies) * 1000
+        result["lookup_p50_ms"] = round(float(np.percentile(latencies, 50)), 3)
+        result["lookup_p99_ms"] = round(float(np.percentile(latencies, 99)), 3)
+
+        labels = [concept_label(rng.randrange(scale * 2)) for _ in range(batch_size)]
+        started = time.perf_counter()
+        index.query(labels, k=k)
+        elapsed = time.perf_counter() - started
+        result["batch_size"] = batch_size
+        result["batch_ms"] = round(elapsed * 1000, 2)
+        result["batch_per_concept_ms"] = round(elapsed * 1000 / batch_size, 3)
+
+        # Incremental append of one ingest batch's worth of new concepts, then a lookup
+        started = time.perf_counter()
+        index.add(list(range(scale + 1, scale + 51)), [concept_label(i) for i in range(scale, scale + 50)])
+        index.query([concept_label(scale + 1)], k=k)
+        result["append_50_and_query_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    results = [run(scale, args.lookups, args.batch_size, args.k) for scale in args.scales]
+    for result in results:
+        print(f"{result['scale']:>9} concepts: lookup p50 {result['lookup_p50_ms']}ms "
+              f"p99 {result['lookup_p99_ms']}ms, batch of {result['batch_size']} "
+              f"{result['batch_per_concept_ms']}ms/concept")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
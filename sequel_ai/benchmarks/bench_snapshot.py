@@ -0,0 +1,103 @@
+"""Graph snapshot export/import time and binary versus JSON graph payload size.
+
+Seeds a SQLite graph with N nodes and about 2N edges, exports it to a
+snapshot directory, bulk-imports it into a second database and checks the
+row counts. For comparison, a sample of the nodes is replayed through the
+ORM one flush() per row (as create_sample_graph used to) and extrapolated
+to the full graph. Finally the full-graph payload is built as JSON
+(get_graph_data) and as typed arrays (graph_payload), raw and gzipped.
+
+    python -m benchmarks.bench_snapshot --scales 100000 500000
+"""
+import argparse
+import gzip
+import json
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import concept_label, discard_app, make_app, seed_graph
+from models.db_model import db, Node
+from services.graph_io import export_graph, graph_payload, import_graph
+from services.graph_service import get_graph_data
+
+
+def seconds(started):
+    return round(time.perf_counter() - started, 3)
+
+
+def orm_replay_seconds(count):
+    """Seconds to add count nodes through the ORM with one flush() per node"""
+    app = make_app()
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            for i in range(count):
+                db.session.add(Node(label=concept_label(i)))
+                db.session.flush()
+            db.session.commit()
+            return time.perf_counter() - started
+    finally:
+        discard_app(app)
+
+
+def run(scale, replay_sample):
+    result = {"scale": scale}
+    path = tempfile.mkdtemp(prefix="sequel_snapshot_")
+    source, target = make_app(), make_app()
+    try:
+        with source.app_context():
+            result["nodes"], result["edges"] = seed_graph(scale)
+            started = time.perf_counter()
+            export_graph(path)
+            result["export_seconds"] = seconds(started)
+
+            started = time.perf_counter()
+            payload = json.dumps(get_graph_data()).encode("utf-8")
+            result["json_seconds"] = seconds(started)
+            started = time.perf_counter()
+            binary = graph_payload()
+            result["binary_seconds"] = seconds(started)
+            result["json_mb"] = round(len(payload) / 2 ** 20, 1)
+            result["binary_mb"] = round(len(binary) / 2 ** 20, 1)
+            started = time.perf_counter()
+            result["binary_gzip_mb"] = round(len(gzip.compress(binary, compresslevel=1)) / 2 ** 20, 1)
+            result["gzip_seconds"] = seconds(started)
+            result["json_gzip_mb"] = round(len(gzip.compress(payload, compresslevel=1)) / 2 ** 20, 1)
+
+        with target.app_context():
+            started = time.perf_counter()
+            import_graph(path)
+            result["import_seconds"] = seconds(started)
+            counts = db.session.execute(text("SELECT (SELECT COUNT(*) FROM node), (SELECT COUNT(*) FROM edge)")).first()
+            assert tuple(counts) == (result["nodes"], result["edges"]), counts
+    finally:
+        discard_app(source)
+        discard_app(target)
+        shutil.rmtree(path, ignore_errors=True)
+
+    sample = min(scale, replay_sample)
+    result["orm_replay_nodes_estimate_seconds"] = round(orm_replay_seconds(sample) * scale / sample, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[100000, 500000])
+    parser.add_argument("--replay-sample", type=int, default=5000, help="nodes replayed through the ORM")
+    args = parser.parse_args()
+
+    results = [run(scale, args.replay_sample) for scale in args.scales]
+    for result in results:
+        print(f"{result['nodes']:>9} nodes, {result['edges']:>9} edges: export {result['export_seconds']}s, "
+              f"import {result['import_seconds']}s (ORM replay of the nodes alone ~"
+              f"{result['orm_replay_nodes_estimate_seconds']}s); payload JSON {result['json_mb']} MB "
+              f"in {result['json_seconds']}s, binary {result['binary_mb']} MB in {result['binary_seconds']}s, "
+              f"gzipped {result['binary_gzip_mb']} MB (+{result['gzip_seconds']}s)")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
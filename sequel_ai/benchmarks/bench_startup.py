@@ -0,0 +1,90 @@
+"""Cold-start cost: time to import the app and latency of the first requests.
+
+Each run is a fresh interpreter against a prepared temporary database, so
+the numbers match what a new worker process pays. "lazy" is the default
+start-up; "eager" sets AUTO_INIT_DB=1 to prepare the database on import.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --max-import-ms 400   # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import discard_app, make_app
+from services.graph_service import create_sample_graph
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app as application
+result = {"import_ms": (time.perf_counter() - started) * 1000,
+          "numpy_at_import": "numpy" in sys.modules,
+          "requests_at_import": "requests" in sys.modules}
+client = application.app.test_client()
+for name, method, path, body in [
+    ("index", "get", "/", None),
+    ("graph_data", "get", "/api/graph_data", None),
+    ("chat", "post", "/api/chat", {"message": "What is Python?"}),
+]:
+    started = time.perf_counter()
+    response = getattr(client, method)(path, json=body)
+    result[name + "_ms"] = (time.perf_counter() - started) * 1000
+    result[name + "_status"] = response.status_code
+print(json.dumps(result))
+"""
+
+
+def probe(env):
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(mode, runs, db_url, index_path):
+    env = dict(os.environ, DATABASE_URL=db_url, SIMILARITY_INDEX_PATH=index_path,
+               OPENROUTER_API_KEY="", INGEST_WORKERS="1", AUTO_INIT_DB="1" if mode == "eager" else "0")
+    samples = [probe(env) for _ in range(runs)]
+    result = {"mode": mode, "runs": runs,
+              "numpy_at_import": samples[-1]["numpy_at_import"],
+              "requests_at_import": samples[-1]["requests_at_import"]}
+    for key in ("import_ms", "index_ms", "graph_data_ms", "chat_ms"):
+        result[key] = round(statistics.median(sample[key] for sample in samples), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["lazy", "eager"], choices=["lazy", "eager"])
+    parser.add_argument("--max-import-ms", type=float, help="fail if the lazy import median exceeds this")
+    args = parser.parse_args()
+
+    app = make_app()
+    try:
+        with app.app_context():
+            create_sample_graph()
+        db_url = f"sqlite:///{app.config['BENCH_DB_PATH']}"
+        results = [run(mode, args.runs, db_url, app.config["SIMILARITY_INDEX_PATH"]) for mode in args.modes]
+    finally:
+        discard_app(app)
+
+    for result in results:
+        print(f"{result['mode']:>5}: import {result['import_ms']}ms, first / {result['index_ms']}ms, "
+              f"/api/graph_data {result['graph_data_ms']}ms, /api/chat {result['chat_ms']}ms "
+              f"(numpy at import: {result['numpy_at_import']})")
+    print(json.dumps(results, indent=2))
+
+    lazy = next((result for result in results if result["mode"] == "lazy"), None)
+    if args.max_import_ms is not None and lazy and lazy["import_ms"] > args.max_import_ms:
+        print(f"Import time {lazy['import_ms']}ms exceeds {args.max_import_ms}ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Shared helpers for the offline benchmarks: throwaway apps and graph fixtures."""
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import text
+
+from models.db_model import db, init_db, create_schema
+
+WORDS = [
+    "Graph", "Vector", "Python", "Neural", "Network", "Learning", "Database", "Index",
+    "Query", "Cache", "Stream", "Kernel", "Memory", "Thread", "Process", "Compiler",
+    "Runtime", "Matrix", "Tensor", "Cluster", "Shard", "Replica", "Latency", "Token",
+]
+
+
+def make_app(db_path=None):
+    """Create a minimal Flask app bound to a fresh SQLite file"""
+    if db_path is None:
+        handle, db_path = tempfile.mkstemp(suffix=".db", prefix="sequel_bench_")
+        os.close(handle)
+        os.unlink(db_path)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SIMILARITY_INDEX_PATH"] = db_path + ".index"
+    init_db(app)
+    with app.app_context():
+        create_schema()
+    app.config["BENCH_DB_PATH"] = db_path
+    return app
+
+
+def discard_app(app):
+    """Delete the temporary database and similarity index behind a make_app() app"""
+    # Close pooled connections first so SQLite checkpoints and releases the WAL
+    with app.app_context():
+        db.engine.dispose()
+    path = app.config["BENCH_DB_PATH"]
+    for name in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(name):
+            os.unlink(name)
+    shutil.rmtree(app.config["SIMILARITY_INDEX_PATH"], ignore_errors=True)
+
+
+def concept_label(i):
+    """Deterministic, unique multi-word label for node number i"""
+    return f"{WORDS[i % len(WORDS)]} {WORDS[(i // len(WORDS)) % len(WORDS)]} {i}"
+
+
+def seed_graph(n_nodes, avg_degree=4, seed=0, chunk=50000):
+    """Bulk-load n_nodes nodes and roughly n_nodes * avg_degree / 2 edges"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    conn = db.session.connection()
+    for start in range(0, n_nodes, chunk):
+        conn.execute(
+            text("INSERT INTO node (id, label, size, color, created_at) VALUES (:id, :label, 1.0, '#B290D6', :now)"),
+            [{"id": i + 1, "label": concept_label(i), "now": now} for i in range(start, min(n_nodes, start + chunk))],
+        )
+    n_edges = n_nodes * avg_degree // 2
+    seen = set()
+    rows = []
+    while len(seen) < n_edges and n_nodes > 1:
+        a, b = rng.randrange(1, n_nodes + 1), rng.randrange(1, n_nodes + 1)
+        if a == b:
+            continue
+        key = (a, b) if a < b else (b, a)
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append({"s": key[0], "t": key[1], "w": rng.random(), "now": now})
+        if len(rows) >= chunk:
+            conn.execute(text("INSERT INTO edge (source_id, target_id, weight, cooccurrence, created_at) "
+                              "VALUES (:s, :t, :w, 1, :now)"), rows)
+            rows = []
+    if rows:
+        conn.execute(text("INSERT INTO edge (source_id, target_id, weight, cooccurrence, created_at) "
+                          "VALUES (:s, :t, :w, 1, :now)"), rows)
+    db.session.commit()
+    return n_nodes, len(seen)
+
+
+def synthetic_concept_sets(count, n_existing, new_ratio=0.3, size=5, seed=1):
+    """Concept lists that mix labels already in the graph with brand-new ones"""
+    rng = random.Random(seed)
+    sets = []
+    fresh = n_existing
+    for _ in range(count):
+        concepts = []
+        for _ in range(size):
+            if rng.random() < new_ratio or n_existing == 0:
+                concepts.append(concept_label(fresh))
+                fresh += 1
+            else:
+                concepts.append(concept_label(rng.randrange(n_existing)))
+        sets.append(list(dict.fromkeys(concepts)))
+    return sets
+
+
+SENTENCES = [
+    "This is how {a} works in practice.",
+    "Most teams pair {a} with {b} when latency matters.",
+    "What makes {a} different is the way it handles state.",
+    "In short, {b} trades memory for speed.",
+    "Here the main risk is misusing {a} under load.",
+]
+
+
+def synthetic_conversations(count, n_concepts=5000, seed=0):
+    """(message, response) pairs about concept_label() concepts, with capitalised phrases to extract"""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        a, b = concept_label(rng.randrange(n_concepts)), concept_label(rng.randrange(n_concepts))
+        message = f"How does {a} compare to {rng.choice(WORDS)} {rng.choice(WORDS)}?"
+        response = " ".join(rng.choice(SENTENCES).format(a=a, b=b) for _ in range(8))
+        pairs.append((message, response))
+    return pairs
+
+
+@contextmanager
+def timer(results, key):
+    started = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - started
@@ -0,0 +1,191 @@
+"""Mixed chat + graph load test against a real HTTP server with a stubbed LLM.
+
+Seeds a throwaway SQLite graph, starts the stub OpenRouter server and the
+app (gunicorn when installed, otherwise Werkzeug's threaded server), then
+drives concurrent clients that mix /api/chat writes with graph reads and
+reports requests/s and latency percentiles per endpoint.
+
+    python -m benchmarks.load_test --clients 32 --duration 20 --chat-ratio 0.2
+    python -m benchmarks.load_test --compare          # SQLite rollback journal vs WAL
+    python -m benchmarks.load_test --url http://127.0.0.1:5000   # an already running server
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.common import concept_label, discard_app, make_app, seed_graph
+from benchmarks.stub_openrouter import start_stub_server
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port):
+    """Run the app on Werkzeug's threaded server (used when gunicorn is unavailable)"""
+    from werkzeug.serving import make_server
+    from app import app
+
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def launch_server(kind, port, env, workers):
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+                   "--workers", str(workers), "--access-logfile", os.devnull, "wsgi:app"]
+    else:
+        command = [sys.executable, "-m", "benchmarks.load_test", "--serve", str(port)]
+    process = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited: {process.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            requests.get(f"{url}/api/ingest/stats", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not start within 60s")
+
+
+def client(url, deadline, chat_ratio, n_nodes, seed, samples):
+    rng = random.Random(seed)
+    session = requests.Session()
+    version = None
+    while time.monotonic() < deadline:
+        roll = rng.random()
+        if roll < chat_ratio:
+            name = "chat"
+            label = concept_label(rng.randrange(max(1, n_nodes)))
+            call = lambda: session.post(f"{url}/api/chat", json={"message": f"How does {label} relate to Python {rng.random():.6f}?"}, timeout=60)
+        elif roll < chat_ratio + (1 - chat_ratio) / 3:
+            name = "graph_delta"
+            query = f"?since={version}" if version is not None else ""
+            call = lambda: session.get(f"{url}/api/graph_data{query}", timeout=60)
+        elif roll < chat_ratio + 2 * (1 - chat_ratio) / 3:
+            name = "graph_top"
+            call = lambda: session.get(f"{url}/api/graph_data?mode=top&n=100", timeout=60)
+        else:
+            name = "graph_neighborhood"
+            node = rng.randrange(1, max(2, n_nodes))
+            call = lambda: session.get(f"{url}/api/graph_data?mode=neighborhood&node={node}&hops=2&limit=200", timeout=60)
+
+        started = time.perf_counter()
+        try:
+            resp = call()
+            ok = resp.status_code in (200, 304)
+            if name == "graph_delta" and resp.status_code == 200:
+                version = resp.json().get("version", version)
+        except requests.RequestException:
+            ok = False
+        samples.append((name, time.perf_counter() - started, ok))
+
+
+def drive(url, clients, duration, chat_ratio, n_nodes):
+    samples = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(url, deadline, chat_ratio, n_nodes, i, samples))
+               for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {"clients": clients, "seconds": round(elapsed, 2), "requests": len(samples),
+              "requests_per_second": round(len(samples) / elapsed, 1),
+              "errors": sum(1 for _, _, ok in samples if not ok), "endpoints": {}}
+    for name in sorted({name for name, _, _ in samples}):
+        latencies = np.array([latency for n, latency, _ in samples if n == name]) * 1000
+        result["endpoints"][name] = {
+            "requests": len(latencies),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "errors": sum(1 for n, _, ok in samples if n == name and not ok),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        }
+    return result
+
+
+def run(args, journal_mode):
+    stub, stub_url = start_stub_server(latency=args.llm_latency, jitter=args.llm_latency / 2)
+    # Switching journal modes needs exclusive access, so seed in the mode the server will use
+    os.environ["SQLITE_JOURNAL_MODE"] = journal_mode
+    app = make_app()
+    try:
+        with app.app_context():
+            seed_graph(args.nodes)
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{app.config['BENCH_DB_PATH']}",
+                   SIMILARITY_INDEX_PATH=app.config["SIMILARITY_INDEX_PATH"],
+                   OPENROUTER_URL=stub_url,
+                   OPENROUTER_API_KEY="load-test",
+                   RESPONSE_CACHE="1" if args.cache else "0",
+                   SQLITE_JOURNAL_MODE=journal_mode)
+        process, url = launch_server(args.server, free_port(), env, args.workers)
+        try:
+            result = drive(url, args.clients, args.duration, args.chat_ratio, args.nodes)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        result.update({"server": args.server, "journal_mode": journal_mode, "nodes": args.nodes,
+                       "upstream_requests": stub.config.requests})
+        return result
+    finally:
+        stub.shutdown()
+        discard_app(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--server", choices=["gunicorn", "werkzeug"],
+                        default="gunicorn" if importlib.util.find_spec("gunicorn") and os.name != "nt" else "werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--chat-ratio", type=float, default=0.2, help="fraction of requests that are chats")
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub completion latency, seconds")
+    parser.add_argument("--cache", action="store_true", help="leave the response cache enabled")
+    parser.add_argument("--compare", action="store_true", help="run with journal_mode=DELETE and then WAL")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    if args.url:
+        results = [drive(args.url, args.clients, args.duration, args.chat_ratio, args.nodes)]
+    else:
+        modes = ["DELETE", "WAL"] if args.compare else [os.environ.get("SQLITE_JOURNAL_MODE", "WAL")]
+        results = [run(args, mode) for mode in modes]
+
+    for result in results:
+        print(f"{result.get('server', 'external')} {result.get('journal_mode', '')}: "
+              f"{result['requests_per_second']} req/s, {result['errors']} errors")
+        for name, stats in result["endpoints"].items():
+            print(f"  {name:<20} {stats['requests_per_second']:>8} req/s  p50 {stats['p50_ms']:>7}ms  "
+                  f"p99 {stats['p99_ms']:>8}ms  errors {stats['errors']}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
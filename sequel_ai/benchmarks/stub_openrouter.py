@@ -0,0 +1,159 @@
+"""Local stand-in for the OpenRouter chat completions endpoint.
+
+Mimics the responses the app handles: 200 with a completion (or a
+server-sent event stream when ``stream: true``), 400 for a malformed
+request, 404 for an unknown model and 429 with ``Retry-After`` for rate
+limiting. With ``unicode=True`` replies contain non-ASCII text sent as raw
+UTF-8 (no JSON escapes, no charset on the event stream), as real models
+do. Run it directly and point ``OPENROUTER_URL`` at it:
+
+    python -m benchmarks.stub_openrouter --port 8799 --latency 0.2 --rate-429 0.1
+    OPENROUTER_URL=http://127.0.0.1:8799/api/v1/chat/completions flask run
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/api/v1/chat/completions"
+MISSING_MODEL = "missing/model"
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, rate_429=0.0, retry_after=1, seed=None, unicode=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.unicode = unicode
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+# Appended to replies in unicode mode; clients must get it back unchanged
+UNICODE_SAMPLE = "Café – 日本語 naïve résumé."
+
+
+def make_reply(messages, unicode=False):
+    """Deterministic completion text that contains a few capitalized concepts"""
+    prompt = messages[-1]["content"] if messages else ""
+    reply = (f"Here is an answer about {prompt}. It touches on Machine Learning, "
+             f"Graph Theory and Python Programming.")
+    return f"{reply} {UNICODE_SAMPLE}" if unicode else reply
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=not self.server.config.unicode).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, payload, text, token_delay=0.01):
+        """Relay ``text`` word by word as OpenRouter-style server-sent events"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        for i, word in enumerate(text.split(" ")):
+            delta = word if i == 0 else " " + word
+            chunk = {"model": payload["model"], "choices": [{"index": 0, "delta": {"content": delta}}]}
+            data = json.dumps(chunk, ensure_ascii=not self.server.config.unicode)
+            self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        config = self.server.config
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+
+        if self.path != COMPLETIONS_PATH:
+            return self._send_json(404, {"error": {"message": "Not Found", "code": 404}})
+
+        with config.lock:
+            config.requests += 1
+            limited = config.random.random() < config.rate_429
+            delay = config.latency + config.random.uniform(0, config.jitter)
+
+        try:
+            payload = json.loads(raw or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"message": "Invalid JSON body", "code": 400}})
+        messages = payload.get("messages")
+        if not payload.get("model") or not messages:
+            return self._send_json(400, {"error": {"message": "model and messages are required", "code": 400}})
+        if payload["model"] == MISSING_MODEL:
+            return self._send_json(404, {"error": {"message": f"Model {MISSING_MODEL} not found", "code": 404}})
+        if limited:
+            return self._send_json(
+                429,
+                {"error": {"message": "Rate limit exceeded", "code": 429}},
+                {"Retry-After": str(config.retry_after)},
+            )
+
+        if delay:
+            time.sleep(delay)
+        reply = make_reply(messages, config.unicode)
+        if payload.get("stream"):
+            return self._send_stream(payload, reply)
+        self._send_json(200, {
+            "id": f"stub-{config.requests}",
+            "model": payload["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}}],
+        })
+
+
+def start_stub_server(host="127.0.0.1", port=0, **config):
+    """Start the stub in a daemon thread; returns (server, completions_url)"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = StubConfig(**config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_address[1]}{COMPLETIONS_PATH}"
+    return server, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each 200 reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, seconds")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests rate limited")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--unicode", action="store_true", help="send non-ASCII replies as raw UTF-8")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                    rate_429=args.rate_429, retry_after=args.retry_after,
+                                    unicode=args.unicode)
+    print(f"Stub OpenRouter listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""End-to-end benchmark suite: chat latency, ingestion rate and graph query cost at several graph sizes.
+
+Runs offline against the stub OpenRouter server (configurable latency,
+jitter and 429 rate) and a seeded graph per scale. For each scale it
+measures:
+
+- ingest: a synthetic conversation corpus queued and drained through the
+  ingest worker path (concept extraction plus graph upserts)
+- graph: full JSON, ?since delta, binary payload, neighbourhood and top-N
+  queries, with p50/p99 over repeats and the peak traced memory of one run
+- chat: concurrent process_chat() calls (context assembly, completion,
+  storage and queueing) with p50/p99 latency and upstream retries
+- stream: stream_chat() calls with time to first token; the stub replies
+  in raw UTF-8, and any reply that does not come back intact is an error
+
+Results, including the git commit and library versions, are written as JSON
+and can be compared with an earlier run; a comparison exits 1 when any
+metric is worse by more than the threshold or any scenario has more errors.
+
+    python -m benchmarks.suite --scales 1000 10000 100000 --output bench-results/main.json
+    python -m benchmarks.suite --quick --baseline bench-results/main.json
+    python -m benchmarks.suite --compare bench-results/main.json bench-results/branch.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# The chat services read these on import: answer every chat from the stub, uncached, with no background workers
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ.setdefault("RESPONSE_CACHE", "0")
+os.environ.setdefault("INGEST_WORKERS", "0")
+
+import numpy as np
+import sqlalchemy
+from sqlalchemy import text
+
+from benchmarks.common import discard_app, make_app, seed_graph, synthetic_conversations
+from benchmarks.stub_openrouter import UNICODE_SAMPLE, start_stub_server
+from models.db_model import db
+from services.chat_service import get_concept_index, is_error_response, process_chat, stream_chat
+from services.graph_io import graph_payload
+from services.graph_query import neighborhood, top_nodes
+from services.graph_service import get_graph_data, get_graph_state
+from services.ingest_service import drain
+from services.llm_client import LLMBusy
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Changes smaller than these absolute amounts are noise, whatever the relative change
+# Error counts have no noise floor or threshold: any increase is a regression
+NOISE_FLOOR = {"_ms": 1.0, "_seconds": 0.005, "_mb": 0.5, "_per_second": 0.0, ".errors": 0}
+
+GRAPH_SCENARIOS = {
+    "full_json": lambda since: json.dumps(get_graph_data()),
+    "delta_json": lambda since: json.dumps(get_graph_data(since)),
+    "binary": lambda since: graph_payload(),
+    "neighborhood_2hop": lambda since: json.dumps(neighborhood(1, hops=2, limit=500)),
+    "top_100": lambda since: json.dumps(top_nodes(100)),
+}
+
+
+def latency_stats(seconds):
+    """p50/p99/mean in milliseconds"""
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            "mean_ms": round(float(ms.mean()), 2)}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, where the platform reports it"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def queue_conversations(pairs, chunk=5000):
+    """Store conversations as chats with pending ingest jobs, as save_chat() leaves them"""
+    now = datetime.utcnow()
+    first = db.session.execute(text("SELECT COALESCE(MAX(id), 0) FROM chat")).scalar() + 1
+    for start in range(0, len(pairs), chunk):
+        rows = [{"id": first + start + i, "message": message, "response": response, "now": now}
+                for i, (message, response) in enumerate(pairs[start:start + chunk])]
+        db.session.execute(text("INSERT INTO chat (id, message, response, timestamp) "
+                                "VALUES (:id, :message, :response, :now)"), rows)
+        db.session.execute(text("INSERT INTO ingest_job (chat_id, status, attempts, enqueued_at, available_at) "
+                                "VALUES (:id, 'pending', 0, :now, :now)"), rows)
+    db.session.commit()
+
+
+def run_ingest(scale, conversations, batch_size, seed):
+    queue_conversations(synthetic_conversations(conversations, n_concepts=scale, seed=seed))
+    started = time.perf_counter()
+    ingested = drain(batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    nodes, edges = db.session.execute(text("SELECT (SELECT COUNT(*) FROM node), (SELECT COUNT(*) FROM edge)")).first()
+    return {"conversations": ingested, "seconds": round(elapsed, 3),
+            "conversations_per_second": round(ingested / elapsed, 1), "nodes_after": nodes, "edges_after": edges}
+
+
+def run_graph(since, repeat):
+    results = {}
+    for name, scenario in GRAPH_SCENARIOS.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            scenario(since)
+            timings.append(time.perf_counter() - started)
+            db.session.rollback()
+        # Tracing slows the call down, so memory is measured on a separate run
+        tracemalloc.start()
+        scenario(since)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        db.session.rollback()
+        results[name] = dict(latency_stats(timings), peak_mb=round(peak / 2 ** 20, 2))
+    return results
+
+
+def run_chat(app, stub, chats, clients, scale, seed):
+    pairs = synthetic_conversations(chats, n_concepts=scale, seed=seed + 1)
+    # Unique prompts so that no two requests are coalesced
+    messages = [f"{message} (request {i})" for i, (message, _) in enumerate(pairs)]
+    timings = []
+    errors = []
+    lock = threading.Lock()
+    upstream_before = stub.config.requests
+
+    def client(number):
+        with app.app_context():
+            for message in messages[number::clients]:
+                started = time.perf_counter()
+                try:
+                    failed = is_error_response(process_chat(message, session_id=f"bench-{number}")["response"])
+                except LLMBusy:
+                    # Answered with a 503 by the app
+                    failed = True
+                elapsed = time.perf_counter() - started
+                with lock:
+                    timings.append(elapsed)
+                    errors.append(failed)
+            db.session.remove()
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    result = latency_stats(timings)
+    result.update({"chats": len(timings), "clients": clients, "seconds": round(elapsed, 3),
+                   "chats_per_second": round(len(timings) / elapsed, 1), "errors": sum(errors),
+                   # Rate-limited attempts are retried, so every request above one per chat is a retry
+                   "upstream_requests": stub.config.requests - upstream_before})
+    return result
+
+
+def run_stream(streams, scale, seed):
+    pairs = synthetic_conversations(streams, n_concepts=scale, seed=seed + 2)
+    first_tokens, timings, errors = [], [], 0
+    for i, (message, _) in enumerate(pairs):
+        started = time.perf_counter()
+        first = None
+        response = ""
+        for event, data in stream_chat(f"{message} (stream {i})", session_id="bench-stream"):
+            if event == "token" and first is None:
+                first = time.perf_counter() - started
+            elif event == "done":
+                response = data
+        timings.append(time.perf_counter() - started)
+        first_tokens.append(first if first is not None else timings[-1])
+        # A garbled reply (e.g. UTF-8 decoded as Latin-1) is as much a failure as an error reply
+        errors += is_error_response(response) or UNICODE_SAMPLE not in response
+    result = latency_stats(timings)
+    result.update({"first_token_" + key: value for key, value in latency_stats(first_tokens).items()})
+    result.update({"streams": streams, "errors": errors})
+    return result
+
+
+def run_scale(scale, args, stub):
+    result = {"scale": scale}
+    app = make_app()
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            result["nodes"], result["edges"] = seed_graph(scale, seed=args.seed)
+            # A running server has its similarity index loaded; build it outside the timings
+            get_concept_index()
+            result["fixture_seconds"] = round(time.perf_counter() - started, 3)
+
+            version, _ = get_graph_state()
+            result["ingest"] = run_ingest(scale, args.conversations, args.batch_size, args.seed)
+            # The delta is what a client that was open during ingestion fetches next
+            result["graph"] = run_graph(version, args.repeat)
+            result["chat"] = run_chat(app, stub, args.chats, args.clients, scale, args.seed)
+            result["stream"] = run_stream(args.streams, scale, args.seed)
+        result["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        discard_app(app)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "numpy": np.__version__, "sqlalchemy": sqlalchemy.__version__}
+
+
+def flatten(value, prefix=""):
+    """{"10000": {"chat": {"p99_ms": 5}}} -> {"10000.chat.p99_ms": 5}, numbers only"""
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f"{prefix}{key}."))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix[:-1]: value}
+    return {}
+
+
+def compare(base, new, threshold):
+    """Rows of (metric, base, new, relative change, verdict) for metrics present in both runs"""
+    base_metrics, new_metrics = flatten(base["results"]), flatten(new["results"])
+    rows = []
+    for name in sorted(base_metrics.keys() & new_metrics.keys()):
+        suffix = next((suffix for suffix in NOISE_FLOOR if name.endswith(suffix)), None)
+        if suffix is None:
+            continue
+        old, current = base_metrics[name], new_metrics[name]
+        change = (current - old) / old if old else (float("inf") if current > old else 0.0)
+        # Throughput should go up, everything else down
+        worse = -change if suffix == "_per_second" else change
+        if suffix == ".errors":
+            verdict = "" if current == old else ("REGRESSION" if current > old else "improved")
+        elif abs(current - old) <= NOISE_FLOOR[suffix] or abs(worse) <= threshold:
+            verdict = ""
+        else:
+            verdict = "REGRESSION" if worse > 0 else "improved"
+        rows.append((name, old, current, change, verdict))
+    return rows
+
+
+def print_comparison(rows, base_label, new_label, base=None, new=None):
+    if base is not None and new is not None:
+        # Differently configured runs are still compared, but the difference may explain the numbers
+        ignored = {"quick", "threshold"}
+        changed = [f"{key} {base['config'].get(key)} -> {new['config'].get(key)}"
+                   for key in sorted(base["config"].keys() | new["config"].keys())
+                   if key not in ignored and base["config"].get(key) != new["config"].get(key)]
+        if changed:
+            print("Runs used different settings: " + ", ".join(changed))
+    base_label, new_label = os.path.basename(base_label)[-14:], os.path.basename(new_label)[-14:]
+    print(f"{'metric':<44} {base_label:>14} {new_label:>14} {'change':>8}")
+    for name, old, current, change, verdict in rows:
+        print(f"{name:<44} {old:>14} {current:>14} {change:>+8.1%} {verdict}")
+    regressions = sum(1 for row in rows if row[4] == "REGRESSION")
+    print(f"{regressions} regression(s) in {len(rows)} metrics")
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000], help="seeded graph sizes")
+    parser.add_argument("--quick", action="store_true", help="one small scale and fewer requests, for a smoke run")
+    parser.add_argument("--conversations", type=int, default=2000, help="conversations ingested per scale")
+    parser.add_argument("--batch-size", type=int, default=50, help="ingest batch size")
+    parser.add_argument("--chats", type=int, default=200, help="process_chat() calls per scale")
+    parser.add_argument("--streams", type=int, default=20, help="stream_chat() calls per scale")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent chat callers")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each graph query")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub completion latency, seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.02, help="extra random stub latency, seconds")
+    parser.add_argument("--llm-429", type=float, default=0.02, help="fraction of stub requests rate limited")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="compare this run with an earlier results file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two results files and exit")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        base, new = load_results(args.compare[0]), load_results(args.compare[1])
+        rows = compare(base, new, args.threshold)
+        sys.exit(1 if print_comparison(rows, *args.compare, base, new) else 0)
+
+    if args.quick:
+        args.scales, args.conversations, args.chats, args.streams, args.repeat = [1000], 500, 50, 10, 3
+    stub, url = start_stub_server(latency=args.llm_latency, jitter=args.llm_jitter, rate_429=args.llm_429,
+                                  retry_after=args.retry_after, seed=args.seed, unicode=True)
+    # The shared LLM client is created on the first chat and reads the endpoint then
+    os.environ["OPENROUTER_URL"] = url
+    try:
+        results = {str(scale): run_scale(scale, args, stub) for scale in args.scales}
+    finally:
+        stub.shutdown()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "compare")}
+    run = {"created_at": datetime.utcnow().isoformat(), "environment": environment(), "config": config,
+           "results": results}
+
+    for scale, result in results.items():
+        chat, stream, ingest = result["chat"], result["stream"], result["ingest"]
+        print(f"{int(scale):>9} nodes: ingest {ingest['conversations_per_second']} conversations/s, "
+              f"chat p50 {chat['p50_ms']}ms p99 {chat['p99_ms']}ms ({chat['upstream_requests']} upstream "
+              f"requests for {chat['chats']} chats), stream first token p50 {stream['first_token_p50_ms']}ms "
+              f"({stream['errors']} errors), peak RSS {result['peak_rss_mb']} MB")
+        for name, stats in result["graph"].items():
+            print(f"{'':>16}{name:<18} p50 {stats['p50_ms']:>9}ms  p99 {stats['p99_ms']:>9}ms  "
+                  f"peak {stats['peak_mb']:>8} MB")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(run, indent=2))
+
+    if args.baseline:
+        base = load_results(args.baseline)
+        rows = compare(base, run, args.threshold)
+        sys.exit(1 if print_comparison(rows, args.baseline, args.output or "this run", base, run) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Gunicorn settings for serving Sequel AI in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Chat requests spend most of their time waiting on the LLM API, so each
+worker process runs a pool of threads. Every process starts its own
+ingest worker threads; the ingest queue hands each job to one of them.
+"""
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+
+# SQLite has a single writer, so more processes mostly add lock contention
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 16))
+
+# Streamed chats and /api/graph_events keep connections open for a long time
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Ingest worker threads must be started in each worker, not in the master before fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """With AUTO_INIT_DB=1, prepare the database once in the master so workers do not race on it"""
+    if os.environ.get('AUTO_INIT_DB') != '1':
+        return
+    from flask import Flask
+
+    from models.db_model import db, create_schema, database_url, init_db
+    from services.chat_service import warm_response_cache
+    from services.graph_service import create_sample_graph
+
+    setup = Flask('app')
+    setup.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    setup.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_db(setup)
+    with setup.app_context():
+        create_schema()
+        create_sample_graph()
+        warm_response_cache()
+        # Forked workers must open their own connections
+        db.engine.dispose()
+    # Workers inherit the environment, so they skip the work already done here
+    os.environ['AUTO_INIT_DB'] = '0'
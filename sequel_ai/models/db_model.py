@@ -1,48 +1,162 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+import os
 
 db = SQLAlchemy()
 
+def database_url(default='sqlite:///sequel_ai.db'):
+    """DATABASE_URL from the environment (e.g. postgresql://...), falling back to SQLite"""
+    url = os.environ.get('DATABASE_URL', default)
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def engine_options(url):
+    """Connection pool settings for the configured database"""
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url in ('sqlite://', 'sqlite:///'):
+            return {}
+        # Reuse connections across requests; sqlite3 connections may move between threads
+        # because the pool hands each one to a single thread at a time
+        return {
+            'poolclass': QueuePool,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'connect_args': {
+                'check_same_thread': False,
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)) / 1000,
+            },
+        }
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for concurrent readers and one writer.
+    
+    WAL lets graph reads proceed while ingestion commits, busy_timeout makes
+    writers wait for the lock instead of failing, and synchronous=NORMAL is
+    durable across application crashes in WAL mode with far fewer fsyncs.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))}")
+    cursor.execute(f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.close()
+
 def init_db(app):
+    """Bind the app to its database; this opens no connections"""
+    url = app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_url())
+    options = engine_options(url)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+
+def create_schema():
+    """Create missing tables and upgrade existing ones (``flask db init``); needs an app context"""
+    from models.migrations import upgrade_schema
+    
+    db.create_all()
+    upgrade_schema()
 
 class Chat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.String(1000), nullable=False)
     response = db.Column(db.String(1000), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Conversation this turn belongs to; NULL for chats from before sessions existed
+    session_id = db.Column(db.String(64))
+    
+    # Recent turns of a session are read newest-first by (session_id, id)
+    __table_args__ = (
+        db.Index('ix_chat_session_turn', 'session_id', 'id'),
+    )
 
     def to_dict(self):
         return {
             'id': self.id,
+            'session_id': self.session_id,
             'message': self.message,
             'response': self.response,
             'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+class SessionSummary(db.Model):
+    """Rolling summary of the turns that have scrolled out of a session's context window"""
+    __tablename__ = 'session_summary'
+    
+    session_id = db.Column(db.String(64), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    # Every turn of the session up to this chat id is folded into the summary
+    through_chat_id = db.Column(db.Integer, nullable=False, default=0)
+    turns = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatConcept(db.Model):
+    """Concepts mentioned by a conversation, written when the chat is ingested"""
+    __tablename__ = 'chat_concept'
+    # "Conversations mentioning a concept" are read newest-first by (node_id, chat_id)
+    __table_args__ = (
+        db.Index('ix_chat_concept_node', 'node_id', 'chat_id'),
+    )
+    
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), primary_key=True)
+    node_id = db.Column(db.Integer, db.ForeignKey('node.id'), primary_key=True)
+
 class Node(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    label = db.Column(db.String(255), nullable=False)
+    label = db.Column(db.String(255), nullable=False, unique=True, index=True)
     size = db.Column(db.Float, default=1.0)
     color = db.Column(db.String(20), default="#B290D6")  # Default to purple
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Graph version of the last change to this row (see GraphState)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # Precomputed layout position and community (see services/layout_service.py)
+    x = db.Column(db.Float)
+    y = db.Column(db.Float)
+    community = db.Column(db.Integer, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_node_xy', 'x', 'y'),
+    )
     
     def to_dict(self):
         return {
             'id': str(self.id),
             'label': self.label,
             'size': self.size,
-            'color': self.color
+            'color': self.color,
+            'x': self.x,
+            'y': self.y,
+            'community': self.community
         }
 
 class Edge(db.Model):
+    # Edges are undirected and stored canonically with source_id < target_id,
+    # so one unique index covers both directions
+    __table_args__ = (
+        db.Index('ix_edge_pair', 'source_id', 'target_id', unique=True),
+        db.Index('ix_edge_target_id', 'target_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     source_id = db.Column(db.Integer, db.ForeignKey('node.id'), nullable=False)
     target_id = db.Column(db.Integer, db.ForeignKey('node.id'), nullable=False)
     weight = db.Column(db.Float, default=1.0)
+    # Number of conversations in which the two concepts appeared together
+    cooccurrence = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     
     # Relationships
     source = db.relationship('Node', foreign_keys=[source_id], backref='outgoing_edges')
@@ -53,5 +167,59 @@ class Edge(db.Model):
             'id': str(self.id),
             'source': str(self.source_id),
             'target': str(self.target_id),
-            'weight': self.weight
-        } 
\ No newline at end of file
+            'weight': self.weight,
+            'cooccurrence': self.cooccurrence
+        } 
+
+class GraphState(db.Model):
+    """Single-row table holding the monotonic graph version counter.
+    
+    Every transaction that changes nodes or edges bumps ``version`` and stamps
+    the rows it touches, so clients can ask for changes since a version.
+    ``reset_version`` records the last time rows were deleted, which a delta
+    cannot express.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    reset_version = db.Column(db.Integer, nullable=False, default=0)
+
+class IngestJob(db.Model):
+    """A chat waiting to be folded into the knowledge graph by the ingest worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(64))
+    error = db.Column(db.Text)
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # JSON list of the labels found when the chat was saved; NULL means extract them at ingest
+    concepts = db.Column(db.Text)
+    # Only link the chat to the existing nodes of its concepts (a coalesced repeat of another chat)
+    link_only = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'chat_id': self.chat_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'enqueued_at': self.enqueued_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+class CachedResponse(db.Model):
+    """Persistent tier of the LLM response cache (see services/response_cache.py)"""
+    __tablename__ = 'response_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # sha256 of the normalised prompt, model and temperature
+    key = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    prompt = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    temperature = db.Column(db.Float, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_hit_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,151 @@
+"""In-place upgrades for databases created by older versions of the app.
+
+``db.create_all()`` only creates missing tables, so columns and indexes
+added to existing tables are applied here. Every step checks the live
+schema first and is safe to run on every start.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from models.db_model import db
+
+logger = logging.getLogger(__name__)
+
+# Columns added after the first release: table -> [(column, DDL type)]
+ADDED_COLUMNS = {
+    "chat": [
+        ("session_id", "VARCHAR(64)"),
+    ],
+    "node": [
+        ("version", "INTEGER NOT NULL DEFAULT 0"),
+        ("x", "FLOAT"),
+        ("y", "FLOAT"),
+        ("community", "INTEGER"),
+    ],
+    "edge": [
+        ("cooccurrence", "INTEGER NOT NULL DEFAULT 1"),
+        ("version", "INTEGER NOT NULL DEFAULT 0"),
+    ],
+    "ingest_job": [
+        ("concepts", "TEXT"),
+        ("link_only", "BOOLEAN NOT NULL DEFAULT '0'"),
+    ],
+}
+
+
+def _add_missing_columns(inspector):
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name, ddl in columns:
+            if name not in existing:
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _dedupe_nodes():
+    """Merge nodes that share a label into the lowest id, repointing their edges"""
+    db.session.execute(text(
+        "CREATE TEMPORARY TABLE node_remap AS "
+        "SELECT n.id AS old_id, k.keep_id AS keep_id FROM node n "
+        "JOIN (SELECT label, MIN(id) AS keep_id FROM node GROUP BY label HAVING COUNT(*) > 1) k "
+        "ON n.label = k.label WHERE n.id <> k.keep_id"
+    ))
+    for column in ("source_id", "target_id"):
+        db.session.execute(text(
+            f"UPDATE edge SET {column} = (SELECT keep_id FROM node_remap WHERE old_id = edge.{column}) "
+            f"WHERE {column} IN (SELECT old_id FROM node_remap)"
+        ))
+    db.session.execute(text("DELETE FROM node WHERE id IN (SELECT old_id FROM node_remap)"))
+    db.session.execute(text("DROP TABLE node_remap"))
+
+
+def _canonicalize_edges():
+    """Store every edge as (min, max) and fold duplicates into one weighted row"""
+    db.session.execute(text("DELETE FROM edge WHERE source_id = target_id"))
+    db.session.execute(text(
+        "UPDATE edge SET source_id = target_id, target_id = source_id WHERE source_id > target_id"
+    ))
+    db.session.execute(text(
+        "CREATE TEMPORARY TABLE edge_merge AS "
+        "SELECT source_id, target_id, MIN(id) AS keep_id, SUM(weight) AS weight, "
+        "SUM(cooccurrence) AS cooccurrence FROM edge "
+        "GROUP BY source_id, target_id HAVING COUNT(*) > 1"
+    ))
+    db.session.execute(text(
+        "UPDATE edge SET "
+        "weight = (SELECT m.weight FROM edge_merge m WHERE m.keep_id = edge.id), "
+        "cooccurrence = (SELECT m.cooccurrence FROM edge_merge m WHERE m.keep_id = edge.id) "
+        "WHERE id IN (SELECT keep_id FROM edge_merge)"
+    ))
+    db.session.execute(text(
+        "DELETE FROM edge WHERE id NOT IN (SELECT keep_id FROM edge_merge) AND EXISTS ("
+        "SELECT 1 FROM edge_merge m WHERE m.source_id = edge.source_id AND m.target_id = edge.target_id)"
+    ))
+    db.session.execute(text("DROP TABLE edge_merge"))
+
+
+def _create_indexes(inspector):
+    """Create any model-declared index that the live tables are missing"""
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.session.connection())
+
+
+# External-content FTS5 table over chat, kept in sync by triggers
+CHAT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE chat_fts USING fts5("
+    "message, response, content='chat', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER chat_fts_insert AFTER INSERT ON chat BEGIN "
+    "INSERT INTO chat_fts (rowid, message, response) VALUES (new.id, new.message, new.response); END",
+    "CREATE TRIGGER chat_fts_delete AFTER DELETE ON chat BEGIN "
+    "INSERT INTO chat_fts (chat_fts, rowid, message, response) VALUES ('delete', old.id, old.message, old.response); END",
+    "CREATE TRIGGER chat_fts_update AFTER UPDATE OF message, response ON chat BEGIN "
+    "INSERT INTO chat_fts (chat_fts, rowid, message, response) VALUES ('delete', old.id, old.message, old.response); "
+    "INSERT INTO chat_fts (rowid, message, response) VALUES (new.id, new.message, new.response); END",
+]
+
+# Must match the expression searched by services/search_service.py for PostgreSQL to use the index
+CHAT_TSVECTOR = "to_tsvector('english', message || ' ' || response)"
+
+
+def _create_chat_search(inspector):
+    """Full-text index over chat messages and responses, filled from existing rows"""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        if db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'chat_fts'")).first():
+            return
+        try:
+            # Savepoint so a build of SQLite without FTS5 leaves the rest of the upgrade intact
+            with db.session.begin_nested():
+                for statement in CHAT_FTS_DDL:
+                    db.session.execute(text(statement))
+                db.session.execute(text("INSERT INTO chat_fts (chat_fts) VALUES ('rebuild')"))
+        except OperationalError as e:
+            logger.warning("SQLite FTS5 is unavailable, chat search falls back to LIKE scans: %s", e)
+    elif dialect == "postgresql":
+        if "ix_chat_fts" not in {index["name"] for index in inspector.get_indexes("chat")}:
+            db.session.execute(text(f"CREATE INDEX ix_chat_fts ON chat USING GIN ({CHAT_TSVECTOR})"))
+
+
+def upgrade_schema():
+    """Bring an existing database up to the current model definitions"""
+    inspector = inspect(db.session.connection())
+    _add_missing_columns(inspector)
+
+    index_names = {index["name"] for index in inspector.get_indexes("node")}
+    if "ix_node_label" not in index_names:
+        # Unique indexes cannot be built over duplicate rows, so clean up first
+        _dedupe_nodes()
+        _canonicalize_edges()
+
+    _create_indexes(inspect(db.session.connection()))
+    _create_chat_search(inspect(db.session.connection()))
+
+    if db.session.execute(text("SELECT COUNT(*) FROM graph_state")).scalar() == 0:
+        db.session.execute(text("INSERT INTO graph_state (id, version, reset_version) VALUES (1, 0, 0)"))
+    db.session.commit()
@@ -8,5 +8,8 @@ REM Set Flask environment variables
 set FLASK_APP=app.py
 set FLASK_ENV=development
 
+REM Apply any database schema upgrades
+flask db init
+
 REM Run the Flask application
 flask run 
\ No newline at end of file
@@ -9,5 +9,8 @@ source venv/bin/activate
 export FLASK_APP=app.py
 export FLASK_ENV=development
 
+# Apply any database schema upgrades
+flask db init
+
 # Run the Flask application
 flask run 
\ No newline at end of file
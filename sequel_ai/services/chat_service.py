@@ -1,219 +1,471 @@
-import requests
-import json
+import logging
 import os
-import time
-from flask import current_app, request
-from models.db_model import db, Chat, Node, Edge
-import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from flask import current_app
+from sqlalchemy import event, text
+from models.db_model import db, Chat, ChatConcept
+from services.llm_client import LLMBusy, LLMClient, LLMError
+from services.concurrency import SingleFlight
+from services.context_service import build_context
+from services.concept_extractor import get_extractor, extract_parallel
+from services.ingest_service import enqueue_chat
+from services.graph_service import CHUNK_SIZE, upsert_nodes, upsert_edges, next_graph_version, dialect_insert
+from services.metrics import CONCEPT_DB_SECONDS, CONCEPT_EXTRACT_SECONDS, register_collector
+from services import response_cache
+
+logger = logging.getLogger(__name__)
 
 # Get the OpenRouter API key and model from environment variables
 OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
 MODEL = os.environ.get("MODEL", "openai/gpt-3.5-turbo")  # Changed default model to gpt-3.5-turbo
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+TEMPERATURE = 0.7
+
+# Responses that report a failure instead of answering the user
+ERROR_PREFIXES = ("Error processing request:", "I'm sorry", "API Error")
+
+# Created lazily so the connection pool is shared by every request in the process
+_llm_client = None
+
+# Identical prompts in flight at the same time share one completion and one stored chat
+_in_flight = SingleFlight()
+
+# How many existing nodes anywhere in the graph a brand-new concept is linked to,
+# and how similar they must be to get an edge
+NEIGHBOR_LINKS = int(os.environ.get("SIMILARITY_NEIGHBOR_LINKS", "3"))
+NEIGHBOR_MIN_SIMILARITY = float(os.environ.get("SIMILARITY_NEIGHBOR_MIN", "0.5"))
+
+def get_llm_client():
+    """Return the shared, connection-pooled OpenRouter client"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient.from_env(OPENROUTER_API_KEY)
+    return _llm_client
+
+def error_response(error):
+    """Translate an LLMError into the text stored and shown to the user"""
+    if error.status == 200:
+        # Malformed success payloads already carry a user-facing message
+        return error.message
+    if error.status == 400:
+        return f"API Error (400 Bad Request): {error.message}"
+    if error.status == 404:
+        return f"API Error: {error.message}"
+    if error.retryable:
+        # Retries exhausted (rate limit, timeout or transient upstream failure)
+        return "I'm sorry, but I couldn't process your request at this time. Please try again later."
+    return f"Error processing request: API Error (Status {error.status}): {error.message}"
+
+def is_error_response(response):
+    return response.startswith(ERROR_PREFIXES)
+
+def _flight_key(message, context_key=""):
+    return response_cache.cache_key(response_cache.normalize_prompt(message), MODEL, TEMPERATURE, context_key)
+
+def _prepare_context(message, session_id):
+    context = build_context(session_id, message)
+    if session_id:
+        # Persist the refreshed summary now so no write lock is held while waiting on another request
+        db.session.commit()
+    return context
 
-def process_chat(message, max_retries=3):
-    """Process a chat message using OpenRouter API"""
+def _record_shared_turn(message, result, session_id):
+    """Store a coalesced answer in the follower's own session (the leader already ingested it)"""
+    if session_id and result["session_id"] != session_id:
+        chat = Chat(message=message, response=result["response"], session_id=session_id)
+        db.session.add(chat)
+        if result["concepts"]:
+            db.session.flush()
+            # Only links to the leader's nodes; the graph itself is updated once, by the leader's job
+            enqueue_chat(chat.id, list(result["concepts"]), link_only=True)
+        db.session.commit()
+
+def process_chat(message, session_id=None):
+    """Process a chat message using OpenRouter API, as the next turn of a session if one is given.
     
+    Raises LLMBusy, without storing the chat, when the API could only be
+    reached by blocking this thread for a long backoff.
+    """
+    context = _prepare_context(message, session_id)
+    result, shared = _in_flight.do(_flight_key(message, context["context_key"]),
+                                   lambda: _process_chat(message, session_id, context))
+    if shared:
+        _record_shared_turn(message, result, session_id)
+    return {"response": result["response"], "concepts": list(result["concepts"])}
+
+def _process_chat(message, session_id, context):
     # Check if API key is set
     if not OPENROUTER_API_KEY:
         # For development/testing, return a mock response
-        print("Warning: OPENROUTER_API_KEY is not set. Using mock response.")
+        logger.warning("OPENROUTER_API_KEY is not set. Using mock response.")
         response = f"Mock response to: {message} (Please set OPENROUTER_API_KEY environment variable)"
     else:
-        # Make request to OpenRouter API with proper headers
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost:5000",
-            "X-Title": "Sequel AI"
-        }
-        
-        # Simplified request format following OpenRouter documentation
-        data = {
-            "model": MODEL,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": message
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 500  # Reduced token limit to ensure we're within free tier limits
-        }
-        
-        # Initialize response
-        response = None
-        retries = 0
-        
-        while retries < max_retries:
-            try:
-                print(f"Making request to OpenRouter API: {OPENROUTER_URL}")
-                print(f"Using model: {MODEL}")
-                print(f"API Key (first 5 chars): {OPENROUTER_API_KEY[:5]}...")
-                print(f"Request data: {json.dumps(data)}")
-                
-                # Make the API request
-                resp = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=30)
-                
-                # Print response details for debugging
-                print(f"Response status: {resp.status_code}")
-                print(f"Response body: {resp.text[:300]}")
-                
-                if resp.status_code == 200:
-                    # Parse successful response
-                    response_data = resp.json()
-                    
-                    # Extract content from choices[0].message.content
-                    if "choices" in response_data and len(response_data["choices"]) > 0:
-                        choice = response_data["choices"][0]
-                        if "message" in choice and "content" in choice["message"]:
-                            response = choice["message"]["content"]
-                            print(f"Successfully received response: {response[:100]}...")
-                            break  # Success, exit the retry loop
-                        else:
-                            print("Warning: Unexpected response format - missing message.content")
-                            response = "Error: Unexpected response format from API"
-                            break
-                    else:
-                        print("Warning: No choices in API response")
-                        response = "Error: No response content from API"
-                        break
-                    
-                elif resp.status_code == 400:
-                    # Handle bad request errors
-                    error_data = resp.json()
-                    error_message = error_data.get("error", {}).get("message", "Unknown error")
-                    print(f"Bad request error: {error_message}")
-                    response = f"API Error (400 Bad Request): {error_message}"
-                    break
-                    
-                elif resp.status_code == 404:
-                    # Handle model not found
-                    error_data = resp.json()
-                    error_message = error_data.get("error", {}).get("message", "Model not found or unavailable")
-                    print(f"Model not found error: {error_message}")
-                    response = f"API Error: {error_message}"
-                    break
-                    
-                elif resp.status_code == 429:  # Rate limit exceeded
-                    print("Rate limit exceeded, waiting before retry...")
-                    time.sleep(5)  # Wait 5 seconds before retrying
-                    retries += 1
-                    
-                else:
-                    # Handle other errors
-                    print(f"Error response body: {resp.text}")
-                    error_msg = f"API Error (Status {resp.status_code}): {resp.text}"
-                    response = f"Error processing request: {error_msg}"
-                    break
-                    
-            except requests.exceptions.Timeout:
-                print(f"Request timed out (attempt {retries+1}/{max_retries})")
-                retries += 1
-                time.sleep(2)  # Wait 2 seconds before retrying
-                
-            except Exception as e:
-                print(f"Error in process_chat: {str(e)}")
-                response = f"Error processing request: {str(e)}"
-                break  # Exit on other errors
-        
-        # If all retries failed, provide a fallback response
-        if response is None:
-            response = "I'm sorry, but I couldn't process your request at this time. Please try again later."
+        # Repeated prompts are answered without calling the API at all
+        response = response_cache.lookup(message, MODEL, TEMPERATURE, context["context_key"])
     
-    # Store the chat in the database
-    chat = Chat(message=message, response=response)
-    db.session.add(chat)
-    db.session.commit()
+    if response is None:
+        # Recent turns, a summary of older ones and retrieved context, within the token budget
+        messages = context["messages"]
+        
+        try:
+            response = get_llm_client().complete(messages, MODEL, temperature=TEMPERATURE, max_tokens=500)
+            response_cache.store(message, MODEL, TEMPERATURE, response, context["context_key"])
+        except LLMBusy:
+            # Nothing is stored; the caller tells the client when to try again
+            raise
+        except LLMError as e:
+            logger.warning("LLM request failed (status %s): %s", e.status, e.message)
+            response = error_response(e)
+        except Exception as e:
+            logger.exception("Error in process_chat")
+            response = f"Error processing request: {str(e)}"
     
-    # Extract concepts from the conversation
-    extracted_concepts = extract_concepts(message, response)
+    # Store the chat and update the knowledge graph
+    extracted_concepts = save_chat(message, response, session_id)
     
     # Return both the response and extracted concepts
     return {
         "response": response,
-        "concepts": extracted_concepts
+        "concepts": extracted_concepts,
+        "session_id": session_id
     }
 
-def extract_concepts(message, response):
-    """Extract key concepts from the conversation and build the knowledge graph"""
+def stream_chat(message, session_id=None):
+    """Stream a chat completion as ("token", text) events.
+
+    Once the upstream stream closes a ("done", response) event is emitted,
+    and only then is the chat stored and the graph updated, ending with a
+    ("concepts", labels) event. A request that arrives while an identical
+    prompt is already in flight waits for it and replays its result.
+    """
+    context = _prepare_context(message, session_id)
+    key = _flight_key(message, context["context_key"])
+    call, leader = _in_flight.join(key)
+    if not leader:
+        try:
+            result = _in_flight.wait(call)
+        except Exception:
+            # The first request gave up (e.g. its client disconnected), so answer this one directly
+            yield from _stream_chat(message, session_id, context)
+            return
+        yield "token", result["response"]
+        yield "done", result["response"]
+        _record_shared_turn(message, result, session_id)
+        yield "concepts", list(result["concepts"])
+        return
     
-    # Skip concept extraction for error messages
-    if response.startswith("Error processing request:") or response.startswith("I'm sorry") or response.startswith("API Error"):
-        return []
+    result = None
+    try:
+        response = None
+        for event, data in _stream_chat(message, session_id, context):
+            if event == "done":
+                response = data
+            elif event == "concepts":
+                result = {"response": response, "concepts": data, "session_id": session_id}
+            yield event, data
+    finally:
+        if result is None:
+            _in_flight.finish(key, call, error=LLMError(None, "Streamed request ended early"))
+        else:
+            _in_flight.finish(key, call, result)
+
+def chat_stats():
+    """Request coalescing and local rate limiting counters for this process"""
+    limiter = get_llm_client().rate_limiter
+    return {
+        "in_flight": _in_flight.in_flight(),
+        "executed": _in_flight.executed,
+        "coalesced": _in_flight.shared,
+        "rate_limit": {"rate": limiter.rate, "burst": limiter.burst} if limiter else None,
+    }
+
+def _chat_gauges():
+    stats = chat_stats()
+    return {
+        "sequel_chat_in_flight": ("Distinct prompts waiting on a completion", stats["in_flight"]),
+        "sequel_chat_completions": ("Completions executed by this process", stats["executed"]),
+        "sequel_chat_coalesced": ("Requests answered by an identical in-flight prompt", stats["coalesced"]),
+    }
+
+register_collector(_chat_gauges)
+
+def _stream_chat(message, session_id, context):
+    cached = None
+    if not OPENROUTER_API_KEY:
+        logger.warning("OPENROUTER_API_KEY is not set. Using mock response.")
+        mock = f"Mock response to: {message} (Please set OPENROUTER_API_KEY environment variable)"
+        parts = [mock]
+    else:
+        cached = response_cache.lookup(message, MODEL, TEMPERATURE, context["context_key"])
+    
+    if cached is not None:
+        parts = [cached]
+    elif OPENROUTER_API_KEY:
+        parts = get_llm_client().stream(context["messages"], MODEL, temperature=TEMPERATURE, max_tokens=500)
+    
+    chunks = []
+    failed = False
+    try:
+        for token in parts:
+            chunks.append(token)
+            yield "token", token
+    except LLMError as e:
+        logger.warning("LLM stream failed (status %s): %s", e.status, e.message)
+        failed = True
+        if not chunks:
+            # Nothing relayed yet, so report the failure like the non-streaming path
+            error_text = error_response(e)
+            chunks.append(error_text)
+            yield "token", error_text
+    except Exception as e:
+        logger.exception("Error in stream_chat")
+        failed = True
+        if not chunks:
+            error_text = f"Error processing request: {str(e)}"
+            chunks.append(error_text)
+            yield "token", error_text
     
-    # Combine message and response for concept extraction
-    combined_text = message + " " + response
+    response = "".join(chunks)
+    yield "done", response
     
-    # Simple approach: extract nouns and noun phrases using regex
-    # In a production system, you'd want to use a proper NLP library like spaCy
-    noun_pattern = r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b'  # Matches capitalized words/phrases
-    concepts = re.findall(noun_pattern, combined_text)
+    # Only complete answers from the API are worth replaying
+    if OPENROUTER_API_KEY and cached is None and not failed:
+        response_cache.store(message, MODEL, TEMPERATURE, response, context["context_key"])
     
-    # Filter out common non-concept words
-    stop_words = ["I", "You", "He", "She", "It", "We", "They", "This", "That", "These", "Those"]
-    concepts = [c for c in concepts if c not in stop_words]
+    # Graph work happens after the client already has the full response
+    yield "concepts", save_chat(message, response, session_id)
+
+def save_chat(message, response, session_id=None):
+    """Store a chat exchange and queue it for knowledge-graph ingestion.
+
+    Only the cheap, DB-free concept detection runs here so the labels can be
+    shown to the user; they are stored on the job, and the ingest worker
+    writes exactly those to the graph.
+    """
+    concepts = find_concepts(message, response, learn=True)
+    
+    chat = Chat(message=message, response=response, session_id=session_id)
+    db.session.add(chat)
+    if concepts:
+        db.session.flush()  # Flush to get the chat ID for the job
+        enqueue_chat(chat.id, concepts)
+    db.session.commit()
     
-    # Remove duplicates while preserving order
-    unique_concepts = []
-    for concept in concepts:
-        if concept not in unique_concepts:
-            unique_concepts.append(concept)
+    return concepts
+
+def find_concepts(message, response, learn=False):
+    """Extract the top concept labels from a conversation without touching the database.
     
-    # Limit to the most significant concepts (top 5)
-    top_concepts = unique_concepts[:5] if len(unique_concepts) > 5 else unique_concepts
+    With learn=True the conversation also counts towards the extractor's
+    document frequencies; use it once per stored chat.
+    """
     
-    # Skip if no concepts found
-    if not top_concepts:
+    # Skip concept extraction for error messages
+    if is_error_response(response):
         return []
     
-    # Add nodes for each concept
-    nodes = []
-    for concept in top_concepts:
-        # Check if node already exists
-        existing_node = Node.query.filter(Node.label == concept).first()
-        
-        if existing_node:
-            nodes.append(existing_node)
+    with CONCEPT_EXTRACT_SECONDS.time(mode="single"):
+        return get_extractor().extract(message, response, learn=learn)
+
+def find_concepts_batch(pairs, pool=None):
+    """find_concepts() for many (message, response) pairs at once.
+    
+    Unlike single lookups this also feeds the extractor's document
+    frequencies, so it is meant for chats being ingested. Pass a pool from
+    extraction_pool() to spread very large batches over worker processes.
+    """
+    results = [[] for _ in pairs]
+    kept = [i for i, (_, response) in enumerate(pairs) if not is_error_response(response)]
+    with CONCEPT_EXTRACT_SECONDS.time(mode="batch"):
+        if pool is None:
+            concept_sets = get_extractor().extract_batch([pairs[i] for i in kept])
         else:
-            # Create a new node
-            node = Node(label=concept)
-            db.session.add(node)
-            db.session.flush()  # Flush to get the ID without committing
-            nodes.append(node)
-    
-    # Create edges between related concepts
-    if len(nodes) > 1:
-        # Calculate similarity between concept pairs using TF-IDF and cosine similarity
-        vectorizer = TfidfVectorizer()
-        concept_labels = [node.label for node in nodes]
-        tfidf_matrix = vectorizer.fit_transform(concept_labels)
-        cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
-        
-        # Create edges for related concepts (similarity > 0.1)
-        for i in range(len(nodes)):
-            for j in range(i+1, len(nodes)):
-                similarity = cosine_sim[i][j]
-                if similarity > 0.1:  # Threshold for creating an edge
-                    # Check if edge already exists
-                    existing_edge = Edge.query.filter(
-                        ((Edge.source_id == nodes[i].id) & (Edge.target_id == nodes[j].id)) |
-                        ((Edge.source_id == nodes[j].id) & (Edge.target_id == nodes[i].id))
-                    ).first()
-                    
-                    if not existing_edge:
-                        edge = Edge(
-                            source_id=nodes[i].id,
-                            target_id=nodes[j].id,
-                            weight=float(similarity)
-                        )
-                        db.session.add(edge)
-    
-    # Commit all changes
+            concept_sets = extract_parallel([pairs[i] for i in kept], pool)
+    for i, concepts in zip(kept, concept_sets):
+        results[i] = concepts
+    return results
+
+def warm_response_cache(limit=5000):
+    """Seed an empty response cache from the most recent successful chats"""
+    if not response_cache.CACHE_ENABLED or response_cache.cache_stats()["db_entries"]:
+        return 0
+    # Warmed entries carry no context key, so only turns answered without history qualify:
+    # chats outside a session and the first turn of each session
+    rows = db.session.execute(
+        text("SELECT message, response FROM chat "
+             "WHERE session_id IS NULL OR id IN (SELECT MIN(id) FROM chat GROUP BY session_id) "
+             "ORDER BY id DESC LIMIT :limit"), {"limit": limit}
+    ).all()
+    # Oldest first so the newest answer to a repeated prompt wins
+    entries = [(message, MODEL, TEMPERATURE, response) for message, response in reversed(rows)
+               if response and not is_error_response(response) and not response.startswith("Mock response")]
+    stored = response_cache.store_many(entries)
     db.session.commit()
+    return stored
+
+def _concept_index():
+    # NumPy-backed modules are imported on first use to keep process start-up fast
+    from services.similarity_index import get_similarity_index
+    path = current_app.config.get('SIMILARITY_INDEX_PATH') or os.path.join(current_app.instance_path, 'similarity_index')
+    return get_similarity_index(path)
+
+def get_concept_index():
+    """Return the persistent similarity index for this app, backfilling it from the node table if empty"""
+    index = _concept_index()
+    if len(index) == 0 and not current_app.config.get('_SIMILARITY_INDEX_CHECKED'):
+        current_app.config['_SIMILARITY_INDEX_CHECKED'] = True
+        rebuild_concept_index(index)
+    return index
+
+def reset_concept_index():
+    """Empty the similarity index; this process backfills it from the node table on next use"""
+    _concept_index().reset()
+    current_app.config['_SIMILARITY_INDEX_CHECKED'] = False
+
+def rebuild_concept_index(index=None, batch_size=10000):
+    """Re-index every node in the graph; returns the number of concepts indexed"""
+    if index is None:
+        index = get_concept_index()
+    index.reset()
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            text("SELECT id, label FROM node WHERE id > :after ORDER BY id LIMIT :limit"),
+            {"after": last_id, "limit": batch_size},
+        ).all()
+        if not rows:
+            break
+        index.add([row[0] for row in rows], [row[1] for row in rows])
+        last_id = rows[-1][0]
+    return len(index)
+
+def similar_concepts(labels, k=10):
+    """Batch k-NN lookup: the k most similar existing nodes for each label"""
+    k = max(1, min(k, 100))
+    matches = get_concept_index().query(labels, k=k)
+    ids = {node_id for neighbours in matches for node_id, _ in neighbours}
+    names = {}
+    if ids:
+        names = dict(db.session.execute(
+            text(f"SELECT id, label FROM node WHERE id IN ({','.join(str(i) for i in ids)})")).all())
+    return [
+        {
+            'label': label,
+            'similar': [{'id': str(node_id), 'label': names[node_id], 'similarity': round(score, 4)}
+                        for node_id, score in neighbours if node_id in names and names[node_id] != label]
+        }
+        for label, neighbours in zip(labels, matches)
+    ]
+
+def related_pairs(concepts, index):
+    """Yield (i, j, similarity) for concept pairs whose labels are related"""
+    from services.similarity_index import MIN_SIMILARITY, pairwise_similarity
+    if len(concepts) < 2:
+        return
+    
+    # Cosine similarity under the corpus-wide IDF weights kept by the index
+    similarity = pairwise_similarity(index, concepts)
+    
+    # Create edges for related concepts (similarity > 0.1)
+    for i in range(len(concepts)):
+        for j in range(i+1, len(concepts)):
+            if similarity[i][j] > MIN_SIMILARITY:  # Threshold for creating an edge
+                yield i, j, float(similarity[i][j])
+
+def _index_after_commit(session):
+    """Add concepts created by the committed transaction to the similarity index"""
+    for index, ids, labels in session.info.pop('pending_concepts', []):
+        index.add(ids, labels)
+
+def _discard_pending_concepts(session):
+    session.info.pop('pending_concepts', None)
+
+# Only nodes that actually reached the database may be returned by similarity queries
+event.listen(db.session, 'after_commit', _index_after_commit)
+event.listen(db.session, 'after_rollback', _discard_pending_concepts)
+
+def existing_node_ids(labels):
+    """{label: node id} for the labels that already have a node"""
+    labels = list(labels)
+    node_ids = {}
+    for start in range(0, len(labels), CHUNK_SIZE):
+        chunk = labels[start:start + CHUNK_SIZE]
+        placeholders = ",".join(f":l{i}" for i in range(len(chunk)))
+        node_ids.update(db.session.execute(
+            text(f"SELECT label, id FROM node WHERE label IN ({placeholders})"),
+            {f"l{i}": label for i, label in enumerate(chunk)},
+        ).all())
+    return node_ids
+
+def link_chat_concepts(chat_ids, concept_sets, node_ids):
+    """Record which concepts each chat mentioned; the caller commits"""
+    rows = {(chat_id, node_ids[label]) for chat_id, concepts in zip(chat_ids, concept_sets)
+            for label in concepts if label in node_ids}
+    if not rows:
+        return 0
+    stmt = dialect_insert(ChatConcept).on_conflict_do_nothing(index_elements=['chat_id', 'node_id'])
+    db.session.execute(stmt, [{'chat_id': chat_id, 'node_id': node_id} for chat_id, node_id in rows])
+    return len(rows)
+
+def add_concept_sets_to_graph(concept_sets, chat_ids=None):
+    """Add nodes and edges for many conversations at once; the caller commits.
+    
+    All labels are resolved with a single set-based upsert and all edges are
+    written with one INSERT ... ON CONFLICT statement. Brand-new concepts are
+    also linked to their nearest existing nodes anywhere in the graph. When
+    chat_ids (parallel to concept_sets) are given, each chat is linked to the
+    nodes of its concepts.
+    """
+    from services.layout_service import place_new_nodes
+    all_labels = [label for concepts in concept_sets for label in concepts]
+    if not all_labels:
+        return []
+    
+    index = get_concept_index()
+    
+    # Every row written by this batch is stamped with one new graph version
+    version = next_graph_version()
+    node_ids = upsert_nodes(all_labels, version)
+    if chat_ids is not None:
+        link_chat_concepts(chat_ids, concept_sets, node_ids)
+    
+    pairs = []
+    for concepts in concept_sets:
+        for i, j, similarity in related_pairs(concepts, index):
+            pairs.append((node_ids[concepts[i]], node_ids[concepts[j]], similarity))
+    
+    # Nodes inserted by this batch are the only ones carrying its version
+    new_nodes = db.session.execute(
+        text("SELECT id, label FROM node WHERE version = :version"), {"version": version}
+    ).all()
+    if new_nodes and NEIGHBOR_LINKS > 0:
+        new_ids = [row[0] for row in new_nodes]
+        matches = index.query([row[1] for row in new_nodes], k=NEIGHBOR_LINKS,
+                              min_similarity=NEIGHBOR_MIN_SIMILARITY)
+        for node_id, neighbours in zip(new_ids, matches):
+            for neighbour_id, similarity in neighbours:
+                pairs.append((node_id, neighbour_id, similarity))
+    upsert_edges(pairs, version)
+    
+    # Position new nodes next to their neighbours until the next full layout
+    place_new_nodes(version)
+    
+    if new_nodes:
+        db.session().info.setdefault('pending_concepts', []).append(
+            (index, [row[0] for row in new_nodes], [row[1] for row in new_nodes]))
+    
+    return list(node_ids)
+
+def add_concepts_to_graph(concepts, chat_id=None):
+    """Add nodes and edges for one conversation's concepts; the caller commits"""
+    add_concept_sets_to_graph([concepts], None if chat_id is None else [chat_id])
+    return list(concepts)
+
+def extract_concepts(message, response, chat_id=None):
+    """Extract key concepts from the conversation and build the knowledge graph"""
+    concepts = find_concepts(message, response)
+    with CONCEPT_DB_SECONDS.time(path="extract_concepts"):
+        add_concepts_to_graph(concepts, chat_id)
+        
+        # Commit all changes
+        db.session.commit()
     
-    # Return the list of concept labels that were extracted
-    return [node.label for node in nodes] 
\ No newline at end of file
+    return concepts
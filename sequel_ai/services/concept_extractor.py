@@ -0,0 +1,222 @@
+"""Concept extraction from conversations.
+
+Extraction runs in two phases so that the expensive part parallelises:
+``candidates()`` turns one conversation into candidate phrases with their
+counts and needs no shared state, so it can run in worker processes;
+``rank()`` then scores every conversation's candidates by TF-IDF against
+document frequencies accumulated over the conversations seen so far and
+keeps the best few.
+
+Backends subclass :class:`ConceptExtractor` and are selected with the
+CONCEPT_EXTRACTOR environment variable, either a registered name or a
+``package.module:ClassName`` path, so a heavier NLP library can be swapped
+in without changing callers.
+"""
+import importlib
+import math
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Concepts kept per conversation
+MAX_CONCEPTS = 5
+
+# Distinct phrases tracked for document frequencies before old counts are decayed
+MAX_TRACKED_PHRASES = int(os.environ.get("CONCEPT_DF_SIZE", "200000"))
+
+# Conversations per task handed to a worker process
+POOL_CHUNK_SIZE = 2000
+
+
+def conversation_text(message, response):
+    """Text scanned for one conversation; the question and answer never run into one phrase"""
+    return f"{message}. {response}"
+
+
+class DocumentFrequencies:
+    """Thread-safe running count of how many conversations mentioned each phrase.
+
+    When more than max_phrases are tracked every count is halved and phrases
+    that drop to zero are forgotten, so memory stays bounded while recent
+    vocabulary keeps its weight.
+    """
+
+    def __init__(self, max_phrases=MAX_TRACKED_PHRASES):
+        self.max_phrases = max_phrases
+        self.documents = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, phrase_sets):
+        """Count one document per iterable of distinct phrases"""
+        with self._lock:
+            for phrases in phrase_sets:
+                self.documents += 1
+                # A generator so mappings of phrase -> stats are counted by key
+                self._counts.update(phrase for phrase in phrases)
+            if len(self._counts) > self.max_phrases:
+                self.documents //= 2
+                self._counts = Counter({phrase: count // 2 for phrase, count in self._counts.items() if count > 1})
+
+    def idf(self, phrases):
+        """Smoothed inverse document frequency for each phrase"""
+        with self._lock:
+            total = self.documents
+            counts = [self._counts.get(phrase, 0) for phrase in phrases]
+        return [math.log((1 + total) / (1 + count)) + 1 for count in counts]
+
+    def clear(self):
+        with self._lock:
+            self.documents = 0
+            self._counts.clear()
+
+
+class ConceptExtractor(ABC):
+    """Interface for concept extraction backends.
+
+    Subclasses implement :meth:`candidates`; the default :meth:`rank` scores
+    candidates by term frequency times inverse document frequency.
+    """
+
+    def __init__(self, max_concepts=MAX_CONCEPTS):
+        self.max_concepts = max_concepts
+        self.document_frequencies = DocumentFrequencies()
+
+    @abstractmethod
+    def candidates(self, text):
+        """{phrase: (count, weight)} for one conversation's text, in order of first appearance.
+
+        weight is a backend-specific prior multiplied into the score.
+        """
+
+    def candidates_batch(self, texts):
+        """Candidates for many texts; backends may override with a faster bulk implementation"""
+        return [self.candidates(text) for text in texts]
+
+    def rank(self, candidate_sets, learn=True):
+        """Top concepts for each candidate set by TF-IDF, ties broken by first appearance.
+
+        With learn=True the batch is added to the document frequencies first,
+        so phrases that are common across the batch are ranked down at once.
+        """
+        if learn:
+            self.document_frequencies.add(candidate_sets)
+        phrases = list({phrase for candidates in candidate_sets for phrase in candidates})
+        idf = dict(zip(phrases, self.document_frequencies.idf(phrases)))
+        results = []
+        for candidates in candidate_sets:
+            if len(candidates) <= 1:
+                results.append(list(candidates))
+                continue
+            ordered = list(candidates)
+            scores = [-count * weight * idf[phrase] for phrase, (count, weight) in candidates.items()]
+            # sorted() is stable, so equal scores keep their order of first appearance
+            ranked = sorted(range(len(ordered)), key=scores.__getitem__)
+            results.append([ordered[i] for i in ranked[:self.max_concepts]])
+        return results
+
+    def extract(self, message, response, learn=False):
+        """Concepts for a single conversation"""
+        return self.extract_batch([(message, response)], learn=learn)[0]
+
+    def extract_batch(self, pairs, learn=True):
+        """Concepts for many (message, response) pairs at once"""
+        return self.rank(self.candidates_batch([conversation_text(message, response) for message, response in pairs]),
+                         learn)
+
+
+class RegexConceptExtractor(ConceptExtractor):
+    """Capitalised words and phrases, ranked by TF-IDF.
+
+    Multi-word phrases are preferred over single words, and a word seen only
+    once, capitalised at the start of a sentence, is ranked down since it is
+    usually an ordinary word.
+    """
+
+    PATTERN = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b")
+    STOP_WORDS = frozenset([
+        "I", "You", "He", "She", "It", "We", "They", "This", "That", "These", "Those",
+        "The", "A", "An", "What", "Why", "How", "When", "Where", "Which", "Who", "Here", "There",
+        "Yes", "No", "Please", "Thanks", "Sure", "Also", "However", "If", "In", "On", "For", "And", "But",
+    ])
+    # Score multiplier per extra word in a phrase, and for a word only seen starting a sentence
+    PHRASE_BONUS = 0.5
+    SENTENCE_START_PENALTY = 0.5
+
+    def candidates(self, text):
+        # Matching, counting and stop-word removal all run in C
+        counts = Counter(self.PATTERN.findall(text))
+        for word in self.STOP_WORDS.intersection(counts):
+            del counts[word]
+        return {phrase: (count, self._weight(text, phrase, count)) for phrase, count in counts.items()}
+
+    def _weight(self, text, phrase, count):
+        extra_words = phrase.count(" ")
+        if extra_words:
+            return 1 + self.PHRASE_BONUS * extra_words
+        if count == 1:
+            i = text.find(phrase) - 1
+            while i >= 0 and text[i].isspace():
+                i -= 1
+            if i < 0 or text[i] in ".!?:":
+                return self.SENTENCE_START_PENALTY
+        return 1.0
+
+
+EXTRACTORS = {
+    "regex": RegexConceptExtractor,
+}
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def load_extractor(name):
+    """Instantiate a registered extractor or one given as ``package.module:ClassName``"""
+    if name in EXTRACTORS:
+        return EXTRACTORS[name]()
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown concept extractor {name!r}; use one of {sorted(EXTRACTORS)} or module:Class")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def get_extractor():
+    """The process-wide extractor chosen by CONCEPT_EXTRACTOR (default: regex)"""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = load_extractor(os.environ.get("CONCEPT_EXTRACTOR", "regex"))
+    return _extractor
+
+
+def _candidates_chunk(texts):
+    # Runs in a worker process with that process's own extractor
+    return get_extractor().candidates_batch(texts)
+
+
+def extract_parallel(pairs, pool=None, chunk_size=POOL_CHUNK_SIZE, learn=True):
+    """extract_batch() for large backfills, finding candidates in a ProcessPoolExecutor.
+
+    Ranking stays in the calling process so document frequencies cover the
+    whole batch. Without a pool (or for small batches) everything runs here.
+    """
+    texts = [conversation_text(message, response) for message, response in pairs]
+    if pool is None or len(texts) <= chunk_size:
+        candidate_sets = get_extractor().candidates_batch(texts)
+    else:
+        chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+        candidate_sets = [candidates for chunk in pool.map(_candidates_chunk, chunks) for candidates in chunk]
+    return get_extractor().rank(candidate_sets, learn)
+
+
+def extraction_pool(workers=None):
+    """Worker processes for extract_parallel(); use as a context manager"""
+    return ProcessPoolExecutor(max_workers=workers)
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` calls per second with bursts of up to ``burst``.
+
+    Callers that find the bucket empty reserve a future token and sleep until
+    it is due, so waiting requests are released in arrival order at the
+    configured rate instead of all retrying at once.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self, max_wait=None):
+        """Take a token and return how long to wait before using it.
+
+        Returns None without taking a token if the wait would exceed max_wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._updated - now)
+            if self._tokens < 1:
+                wait += (1 - self._tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def delay(self):
+        """Seconds until a token would be available, without taking one"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._updated - now)
+            if self._tokens < 1:
+                wait += (1 - self._tokens) / self.rate
+            return wait
+
+    def acquire(self, timeout=None):
+        """Block until a token is available; False if that would take longer than timeout"""
+        wait = self.reserve(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, timeout=None):
+        """Asyncio variant of :meth:`acquire`"""
+        wait = self.reserve(timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next ``seconds`` (e.g. after an upstream 429)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + seconds)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) does the work; callers arriving
+    while it is in flight wait and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def join(self, key):
+        """Return (call, is_leader); the leader must call :meth:`finish`"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.shared += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.executed += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    @staticmethod
+    def wait(call, timeout=None):
+        """Wait for the leader and return its result, re-raising its exception"""
+        if not call.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for an in-flight call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn):
+        """Run fn() unless an identical call is in flight; returns (result, shared)"""
+        call, leader = self.join(key)
+        if not leader:
+            return self.wait(call), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
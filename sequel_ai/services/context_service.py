@@ -0,0 +1,261 @@
+import hashlib
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models.db_model import db, SessionSummary
+from services.graph_service import dialect_insert
+
+# Prompt tokens (estimated) a single request may spend on history, summary and retrieval
+TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+# Most recent turns sent verbatim; older turns are folded into the session summary
+RECENT_TURNS = int(os.environ.get("CONTEXT_RECENT_TURNS", "20"))
+SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", "400"))
+# Graph concepts and older turns of the session retrieved for the current message
+RETRIEVED_CONCEPTS = int(os.environ.get("CONTEXT_CONCEPTS", "10"))
+RETRIEVED_CHATS = int(os.environ.get("CONTEXT_CHATS", "3"))
+# How many older turns a retrieval search looks through, so it stays cheap in long sessions
+RETRIEVAL_SCAN = int(os.environ.get("CONTEXT_RETRIEVAL_SCAN", "2000"))
+
+# Chat APIs add a few tokens of framing to every message
+MESSAGE_OVERHEAD = 4
+# Character limits for one turn's line in the summary
+SUMMARY_LINE_CHARS = 240
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+WHITESPACE = re.compile(r"\s+")
+
+
+def estimate_tokens(content):
+    """Rough token count (~4 characters per token for English text under BPE tokenizers)"""
+    return (len(content) + 3) // 4
+
+
+def truncate_tokens(content, tokens):
+    """Cut text to roughly the given number of tokens, preferring a word boundary"""
+    limit = max(0, tokens) * 4
+    if len(content) <= limit:
+        return content
+    if limit == 0:
+        return ""
+    cut = content[:limit]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def _message(role, content):
+    return {"role": role, "content": content}
+
+
+def _message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def _recent_turns(session_id, limit):
+    """The session's newest turns, newest first"""
+    return db.session.execute(
+        text("SELECT id, message, response FROM chat WHERE session_id = :session "
+             "ORDER BY id DESC LIMIT :limit"),
+        {"session": session_id, "limit": limit},
+    ).all()
+
+
+def _summary_line(message, response):
+    """One line per turn: the question and the first sentence of the answer"""
+    answer = SENTENCE_END.split(WHITESPACE.sub(" ", response).strip(), 1)[0]
+    line = f"User: {WHITESPACE.sub(' ', message).strip()} | Assistant: {answer}"
+    return line if len(line) <= SUMMARY_LINE_CHARS else line[:SUMMARY_LINE_CHARS - 1].rstrip() + "…"
+
+
+def _trim_summary(lines):
+    """Keep the newest lines that fit in SUMMARY_TOKENS"""
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > SUMMARY_TOKENS:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def session_summary(session_id, before_id):
+    """Summary of every turn of the session older than before_id; the caller commits.
+
+    The summary is stored per session and only the turns that scrolled out of
+    the recent window since the last call are folded in, so the cost does not
+    grow with the length of the conversation.
+    """
+    from services.chat_service import is_error_response
+    row = db.session.get(SessionSummary, session_id)
+    through = row.through_chat_id if row else 0
+
+    # Only the newest turns can survive trimming, so older unsummarized ones are never read
+    max_lines = SUMMARY_TOKENS // 8 + 1
+    turns = db.session.execute(
+        text("SELECT id, message, response FROM chat WHERE session_id = :session "
+             "AND id > :after AND id < :before ORDER BY id DESC LIMIT :limit"),
+        {"session": session_id, "after": through, "before": before_id, "limit": max_lines},
+    ).all()
+    if not turns:
+        return row.summary if row else ""
+
+    lines = row.summary.splitlines() if row and row.summary else []
+    lines.extend(_summary_line(message, response) for _, message, response in reversed(turns)
+                 if not is_error_response(response))
+    summary = "\n".join(_trim_summary(lines))
+
+    values = {"session_id": session_id, "summary": summary, "through_chat_id": turns[0][0],
+              "turns": (row.turns if row else 0) + len(turns), "updated_at": datetime.utcnow()}
+    stmt = dialect_insert(SessionSummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["session_id"],
+        set_={name: getattr(stmt.excluded, name) for name in ("summary", "through_chat_id", "turns", "updated_at")},
+    )
+    db.session.execute(stmt, values)
+    if row is not None:
+        # The upsert bypassed the ORM, so reload the row next time it is read
+        db.session.expire(row)
+    return summary
+
+
+def related_concepts(labels, limit=RETRIEVED_CONCEPTS):
+    """Graph nodes mentioned in the message followed by their strongest neighbours"""
+    labels = list(dict.fromkeys(labels))[:20]
+    if not labels or limit <= 0:
+        return []
+    placeholders = ",".join(f":l{i}" for i in range(len(labels)))
+    params = {f"l{i}": label for i, label in enumerate(labels)}
+    known = db.session.execute(text(f"SELECT id, label FROM node WHERE label IN ({placeholders})"), params).all()
+    if not known:
+        return []
+    ids = ",".join(str(row[0]) for row in known)
+    neighbours = db.session.execute(
+        text(f"SELECT n.label, e.weight FROM edge e JOIN node n ON n.id = e.target_id WHERE e.source_id IN ({ids}) "
+             f"UNION ALL SELECT n.label, e.weight FROM edge e JOIN node n ON n.id = e.source_id WHERE e.target_id IN ({ids}) "
+             "ORDER BY 2 DESC LIMIT :limit"),
+        {"limit": limit * 2},
+    ).all()
+    return list(dict.fromkeys([row[1] for row in known] + [row[0] for row in neighbours]))[:limit]
+
+
+def related_turns(session_id, labels, before_id, limit=RETRIEVED_CHATS):
+    """Older turns of the session that mention any of the labels, newest first"""
+    labels = list(dict.fromkeys(labels))[:5]
+    if not labels or limit <= 0:
+        return []
+    conditions = " OR ".join(f"message LIKE :p{i} OR response LIKE :p{i}" for i in range(len(labels)))
+    params = {f"p{i}": f"%{label}%" for i, label in enumerate(labels)}
+    params.update({"session": session_id, "before": before_id, "scan": RETRIEVAL_SCAN, "limit": limit})
+    return db.session.execute(
+        text("SELECT id, message, response FROM (SELECT id, message, response FROM chat "
+             "WHERE session_id = :session AND id < :before ORDER BY id DESC LIMIT :scan) AS older "
+             f"WHERE {conditions} LIMIT :limit"),
+        params,
+    ).all()
+
+
+def build_context(session_id, message, budget=None):
+    """Assemble the messages sent upstream for one turn of a conversation.
+
+    In priority order: the new message, the most recent turns verbatim, a
+    rolling summary of older turns, then retrieved graph concepts and older
+    turns related to the message, all within ``budget`` estimated tokens.
+    Returns a dict with ``messages``, the estimated ``tokens`` and a
+    ``context_key`` that changes whenever the conversation history does.
+    May write the session summary; the caller commits.
+    """
+    from services.chat_service import find_concepts, is_error_response
+    budget = TOKEN_BUDGET if budget is None else budget
+    user = _message("user", truncate_tokens(message, budget // 2))
+    if not session_id:
+        return {"messages": [user], "tokens": _message_tokens(user), "context_key": "", "turns": 0}
+    remaining = budget - _message_tokens(user)
+
+    # Recent turns, newest first, until they use up their share of the budget
+    recent = []
+    dropped = []
+    recent_budget = remaining * 3 // 5
+    turns = _recent_turns(session_id, RECENT_TURNS)
+    for _, question, answer in turns:
+        if is_error_response(answer):
+            continue
+        pair = [_message("user", question), _message("assistant", answer)]
+        cost = sum(_message_tokens(m) for m in pair)
+        if dropped or cost > recent_budget:
+            # Window turns that do not fit verbatim still get a summary line
+            dropped.append(_summary_line(question, answer))
+            continue
+        recent.append(pair)
+        recent_budget -= cost
+        remaining -= cost
+
+    # Everything older than the recent window is summarized
+    lines = []
+    oldest = turns[-1][0] if turns else None
+    if oldest is not None and len(turns) == RECENT_TURNS:
+        stored = session_summary(session_id, oldest)
+        lines = stored.splitlines() if stored else []
+    lines.extend(reversed(dropped))
+    summary = truncate_tokens("\n".join(_trim_summary(lines)), remaining)
+    remaining -= estimate_tokens(summary)
+
+    # Retrieval fills what is left
+    sections = []
+    labels = find_concepts(message, "")
+    concepts = related_concepts(labels) if labels else []
+    if concepts and remaining > 0:
+        sections.append(truncate_tokens("Related concepts from the knowledge graph: " + ", ".join(concepts), remaining))
+        remaining -= estimate_tokens(sections[-1])
+    if labels and oldest is not None and remaining > 0:
+        # Turns already in the summary are skipped, so look at a few more than are used
+        found = 0
+        for _, question, answer in related_turns(session_id, labels, oldest, RETRIEVED_CHATS * 4):
+            line = _summary_line(question, answer)
+            if line in summary:
+                continue
+            if found == RETRIEVED_CHATS:
+                break
+            found += 1
+            line = truncate_tokens(line, remaining)
+            if not line:
+                break
+            sections.append("Earlier: " + line)
+            remaining -= estimate_tokens(line) + 2
+
+    parts = []
+    if summary:
+        parts.append("Summary of the earlier conversation:\n" + summary)
+    parts.extend(sections)
+    messages = [_message("system", "\n\n".join(parts))] if parts else []
+    for pair in reversed(recent):
+        messages.extend(pair)
+    messages.append(user)
+
+    # Retrieval is derived from the message and the graph, so only the history identifies the context
+    history = summary + "".join(f"\x00{m['content']}" for pair in recent for m in pair)
+    return {
+        "messages": messages,
+        "tokens": sum(_message_tokens(m) for m in messages),
+        "context_key": hashlib.sha256(history.encode("utf-8")).hexdigest() if history else "",
+        "turns": len(recent),
+    }
+
+
+def session_history(session_id, limit=50, before=None):
+    """A page of a session's turns, oldest first"""
+    params = {"session": session_id, "limit": max(1, min(limit, 200))}
+    where = "session_id = :session"
+    if before:
+        where += " AND id < :before"
+        params["before"] = before
+    rows = db.session.execute(
+        text(f"SELECT id, message, response, timestamp FROM chat WHERE {where} ORDER BY id DESC LIMIT :limit"), params
+    ).all()
+    return [{"id": row[0], "message": row[1], "response": row[2], "timestamp": str(row[3])} for row in reversed(rows)]
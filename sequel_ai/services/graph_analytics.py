@@ -0,0 +1,379 @@
+"""Graph analytics on an in-memory CSR snapshot of the node and edge tables.
+
+The snapshot holds each undirected edge twice (once per endpoint) in
+compressed sparse row form: ``indptr`` offsets into ``indices`` and
+``weights``, so memory grows with the edge count and every algorithm here is
+a handful of vectorised passes over those arrays. Results are cached until
+the graph's topology changes and can be written back to the nodes' size,
+colour and community columns.
+"""
+import heapq
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from models.db_model import db
+from services.graph_service import CHUNK_SIZE, get_graph_state, next_graph_version
+from services.layout_service import FETCH_BATCH, fetch_arrays, label_propagation, stable_labels
+
+# Node sizes written back, scaled by PageRank (the graph page multiplies them by 10)
+MIN_NODE_SIZE = 1.0
+MAX_NODE_SIZE = 4.0
+
+# Community colours, reused round-robin
+COMMUNITY_COLORS = [
+    "#7ED1B8", "#7C9FDF", "#F0A86C", "#A98BDB", "#E57FA8", "#8CC084",
+    "#E0C35A", "#5FB7C9", "#C98F6B", "#9AA5E0", "#D3849B", "#6FC3A0",
+]
+
+SCORES = ("pagerank", "degree", "strength")
+
+_snapshot = None
+_analysis = None
+# One thread builds the snapshot and runs the algorithms; others wait for its result
+_analysis_lock = threading.Lock()
+
+
+class GraphSnapshot:
+    """Undirected weighted graph in CSR form over the node ids sorted ascending"""
+
+    def __init__(self, ids, src, dst, weight):
+        n = len(ids)
+        self.ids = ids
+        # Both directions of every edge, grouped by their first endpoint
+        rows = np.concatenate([src, dst])
+        order = np.argsort(rows, kind="stable")
+        self.indices = np.concatenate([dst, src])[order].astype(np.int32)
+        self.weights = np.concatenate([weight, weight])[order].astype(np.float32)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.indptr[1:])
+
+    @property
+    def node_count(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.indices) // 2
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    def index_of(self, node_ids):
+        """Positions of node ids in the snapshot, -1 where a node is missing"""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, node_ids), max(0, self.node_count - 1))
+        found = self.ids[positions] == node_ids if self.node_count else np.zeros(len(node_ids), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def row_sums(self, values):
+        """Sum of values (one per stored edge entry) for every node"""
+        totals = np.zeros(len(values) + 1)
+        np.cumsum(values, out=totals[1:])
+        return totals[self.indptr[1:]] - totals[self.indptr[:-1]]
+
+    def strength(self):
+        """Weighted degree"""
+        return self.row_sums(self.weights)
+
+    def rows(self):
+        """Source node of every stored edge entry"""
+        return np.repeat(np.arange(self.node_count, dtype=np.int32), self.degree())
+
+    def edges(self):
+        """(src, dst, weight) with each undirected edge once"""
+        rows = self.rows()
+        once = rows < self.indices
+        return rows[once], self.indices[once], self.weights[once].astype(np.float64)
+
+
+def topology_key():
+    """Changes whenever nodes or edges are added, removed or reweighted, but not for size/colour updates"""
+    _, reset_version = get_graph_state()
+    edge_id, edge_version = db.session.execute(text("SELECT MAX(id), MAX(version) FROM edge")).first()
+    node_id = db.session.execute(text("SELECT MAX(id) FROM node")).scalar()
+    return reset_version, edge_id, edge_version, node_id
+
+
+def load_snapshot():
+    """Read the node and edge tables into a GraphSnapshot"""
+    ids, = fetch_arrays("SELECT id FROM node ORDER BY id", [np.int64])
+    src, dst, weight = fetch_arrays("SELECT source_id, target_id, weight FROM edge",
+                                    [np.int64, np.int64, np.float64])
+    # Edge weights are strengths; missing or non-positive ones count as 1
+    weight = np.where(weight > 0, weight, 1.0)
+    return GraphSnapshot(ids, np.searchsorted(ids, src), np.searchsorted(ids, dst), weight)
+
+
+def pagerank(snapshot, damping=0.85, tol=1e-8, max_iterations=100):
+    """Weighted PageRank by power iteration; the scores sum to 1.
+
+    A walker leaves a node along an edge with probability proportional to
+    the edge weight, and isolated nodes spread their rank evenly. Two buffers
+    the size of the edge list are reused across iterations.
+    """
+    n = snapshot.node_count
+    if n == 0:
+        return np.zeros(0)
+    strength = snapshot.strength()
+    inverse = np.divide(1.0, strength, out=np.zeros(n), where=strength > 0)
+    isolated = strength == 0
+    flow = np.empty(len(snapshot.indices))
+    totals = np.zeros(len(flow) + 1)
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iterations):
+        np.take(rank * inverse, snapshot.indices, out=flow)
+        flow *= snapshot.weights
+        np.cumsum(flow, out=totals[1:])
+        incoming = totals[snapshot.indptr[1:]] - totals[snapshot.indptr[:-1]]
+        updated = damping * (incoming + rank[isolated].sum() / n) + (1.0 - damping) / n
+        change = np.abs(updated - rank).sum()
+        rank = updated
+        if change < tol:
+            break
+    return rank
+
+
+def degree_centrality(snapshot):
+    """Degree divided by the largest possible degree"""
+    return snapshot.degree() / max(1, snapshot.node_count - 1)
+
+
+def modularity(snapshot, labels):
+    """Weighted Newman modularity of a community assignment"""
+    total = float(snapshot.weights.sum())
+    if total == 0:
+        return 0.0
+    inside = labels[snapshot.rows()] == labels[snapshot.indices]
+    community_strength = np.bincount(labels, weights=snapshot.strength())
+    return float(snapshot.weights[inside].sum() / total - ((community_strength / total) ** 2).sum())
+
+
+def shortest_path(snapshot, source_id, target_id):
+    """Cheapest path between two nodes by bidirectional Dijkstra, where an edge costs 1 / weight.
+
+    Strongly related concepts are therefore close. Returns
+    {"cost", "hops", "path": [node ids]} or None when either node is missing
+    or they are not connected. Searches grow from both ends, each settled
+    node relaxes all its edges in one vectorised step, and the search stops
+    once the two frontiers cannot improve on the best meeting found.
+    """
+    source, target = (int(position) for position in snapshot.index_of([source_id, target_id]))
+    if source < 0 or target < 0:
+        return None
+    n = snapshot.node_count
+    indptr, indices = snapshot.indptr, snapshot.indices
+    costs = 1.0 / snapshot.weights.astype(np.float64)
+    # Index 0 searches forward from the source, index 1 backward from the target
+    distance = [np.full(n, np.inf), np.full(n, np.inf)]
+    previous = [np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64)]
+    settled = [np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)]
+    heaps = [[(0.0, source)], [(0.0, target)]]
+    distance[0][source] = distance[1][target] = 0.0
+    best, meeting = (0.0, (source, source)) if source == target else (np.inf, None)
+    while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < best:
+        # Grow the smaller frontier
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        cost, node = heapq.heappop(heaps[side])
+        if settled[side][node]:
+            continue
+        settled[side][node] = True
+        start, end = indptr[node], indptr[node + 1]
+        neighbours = indices[start:end]
+        if not len(neighbours):
+            continue
+        reached = cost + costs[start:end]
+        through = reached + distance[1 - side][neighbours]
+        closest = int(np.argmin(through))
+        if through[closest] < best:
+            best = float(through[closest])
+            meeting = (node, int(neighbours[closest])) if side == 0 else (int(neighbours[closest]), node)
+        better = reached < distance[side][neighbours]
+        if better.any():
+            # Largest first, so with parallel edges the cheapest assignment is applied last
+            order = np.flatnonzero(better)[np.argsort(-reached[better])]
+            neighbours, reached = neighbours[order], reached[order]
+            distance[side][neighbours] = reached
+            previous[side][neighbours] = node
+            for candidate, candidate_cost in zip(neighbours.tolist(), reached.tolist()):
+                heapq.heappush(heaps[side], (candidate_cost, candidate))
+    if meeting is None:
+        return None
+    forward, backward = meeting
+    path = [forward]
+    while path[-1] != source:
+        path.append(int(previous[0][path[-1]]))
+    path.reverse()
+    if backward != forward:
+        path.append(backward)
+        while path[-1] != target:
+            path.append(int(previous[1][path[-1]]))
+    return {
+        "cost": round(best, 6),
+        "hops": len(path) - 1,
+        "path": [str(node_id) for node_id in snapshot.ids[path]],
+    }
+
+
+def get_snapshot():
+    """The CSR snapshot for the current topology, rebuilt only when nodes or edges changed"""
+    global _snapshot
+    key = topology_key()
+    with _analysis_lock:
+        if _snapshot is None or _snapshot[0] != key:
+            _snapshot = (key, load_snapshot())
+        return _snapshot[1]
+
+
+def analyze():
+    """PageRank, degree and communities for the current graph, cached until its topology changes"""
+    global _analysis
+    snapshot = get_snapshot()
+    with _analysis_lock:
+        if _analysis is not None and _analysis["snapshot"] is snapshot:
+            return _analysis
+        started = time.perf_counter()
+        ids, community = fetch_arrays("SELECT id, community FROM node ORDER BY id", [np.int64, np.float64])
+        # Nodes added after the snapshot was taken are not part of it
+        previous = np.full(snapshot.node_count, np.nan)
+        positions = snapshot.index_of(ids)
+        previous[positions[positions >= 0]] = community[positions >= 0]
+        src, dst, weight = snapshot.edges()
+        communities = stable_labels(label_propagation(snapshot.node_count, src, dst, weight), previous)
+        _analysis = {
+            "snapshot": snapshot,
+            "pagerank": pagerank(snapshot),
+            "degree": degree_centrality(snapshot),
+            "strength": snapshot.strength(),
+            "community": communities,
+            "modularity": modularity(snapshot, np.unique(communities, return_inverse=True)[1]),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        return _analysis
+
+
+def node_styles(analysis):
+    """Sizes (by PageRank) and colours (by community) for every node in the snapshot"""
+    rank = analysis["pagerank"]
+    scale = np.sqrt(rank / rank.max()) if len(rank) and rank.max() > 0 else rank
+    sizes = np.round(MIN_NODE_SIZE + (MAX_NODE_SIZE - MIN_NODE_SIZE) * scale, 2)
+    colors = np.array(COMMUNITY_COLORS, dtype=object)[analysis["community"] % len(COMMUNITY_COLORS)]
+    return sizes, colors
+
+
+def write_analytics(analysis):
+    """Store sizes, colours and communities on the nodes; returns how many changed.
+
+    Only rows whose values differ are updated, in batches that each commit
+    with their own graph version, so clients following ``since`` receive
+    just the restyled nodes and ingestion is never blocked for long.
+    """
+    snapshot = analysis["snapshot"]
+    sizes, colors = node_styles(analysis)
+    ids, size, color, community = fetch_arrays("SELECT id, size, color, community FROM node ORDER BY id",
+                                               [np.int64, np.float64, object, np.float64])
+    positions = snapshot.index_of(ids)
+    present = positions >= 0
+    ids, size, color, community, positions = (ids[present], size[present], color[present],
+                                              community[present], positions[present])
+    changed = ((np.abs(np.nan_to_num(size, nan=-1.0) - sizes[positions]) > 1e-6)
+               | (color != colors[positions])
+               | (community != analysis["community"][positions]))
+    changed_ids = ids[changed]
+    positions = positions[changed]
+    for start in range(0, len(changed_ids), FETCH_BATCH):
+        end = start + FETCH_BATCH
+        version = next_graph_version()
+        db.session.execute(
+            text("UPDATE node SET size = :size, color = :color, community = :community, version = :version "
+                 "WHERE id = :id"),
+            [{"id": int(node_id), "size": float(sizes[i]), "color": colors[i],
+              "community": int(analysis["community"][i]), "version": version}
+             for node_id, i in zip(changed_ids[start:end], positions[start:end])],
+        )
+        db.session.commit()
+    return len(changed_ids)
+
+
+def _labels(node_ids):
+    labels = {}
+    node_ids = [int(node_id) for node_id in node_ids]
+    for start in range(0, len(node_ids), CHUNK_SIZE):
+        chunk = ",".join(str(node_id) for node_id in node_ids[start:start + CHUNK_SIZE])
+        labels.update(db.session.execute(text(f"SELECT id, label FROM node WHERE id IN ({chunk})")).all())
+    return labels
+
+
+def _node_scores(analysis, positions, labels):
+    return [
+        {
+            "id": str(analysis["snapshot"].ids[i]),
+            "label": labels.get(int(analysis["snapshot"].ids[i])),
+            "pagerank": round(float(analysis["pagerank"][i]), 8),
+            "degree": int(analysis["snapshot"].indptr[i + 1] - analysis["snapshot"].indptr[i]),
+            "degree_centrality": round(float(analysis["degree"][i]), 8),
+            "strength": round(float(analysis["strength"][i]), 4),
+            "community": int(analysis["community"][i]),
+        }
+        for i in positions
+    ]
+
+
+def analytics_summary(n=20, by="pagerank"):
+    """Graph-wide statistics and the top n nodes by pagerank, degree or strength"""
+    analysis = analyze()
+    snapshot = analysis["snapshot"]
+    n = max(0, min(n, 1000))
+    scores = analysis[by]
+    if n < len(scores):
+        top = np.argpartition(-scores, n)[:n]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    version, _ = get_graph_state()
+    return {
+        "version": version,
+        "nodes": snapshot.node_count,
+        "edges": snapshot.edge_count,
+        "communities": int(len(np.unique(analysis["community"]))),
+        "modularity": round(analysis["modularity"], 4),
+        "snapshot_bytes": snapshot.nbytes,
+        "compute_seconds": analysis["seconds"],
+        "by": by,
+        "top": _node_scores(analysis, top.tolist(), _labels(snapshot.ids[top])),
+    }
+
+
+def node_analytics(node_id):
+    """Scores for one node plus its community's size, or None if the node is not in the graph"""
+    analysis = analyze()
+    position = int(analysis["snapshot"].index_of([node_id])[0])
+    if position < 0:
+        return None
+    result = _node_scores(analysis, [position], _labels([node_id]))[0]
+    result["community_size"] = int((analysis["community"] == analysis["community"][position]).sum())
+    result["pagerank_rank"] = int((analysis["pagerank"] > analysis["pagerank"][position]).sum()) + 1
+    return result
+
+
+def path_between(source_id, target_id):
+    """shortest_path() on the current snapshot, with node labels"""
+    result = shortest_path(get_snapshot(), source_id, target_id)
+    if result is not None:
+        labels = _labels(result["path"])
+        result["labels"] = [labels.get(int(node_id)) for node_id in result["path"]]
+    return result
+
+
+def run_analytics(write=True):
+    """Recompute analytics and, with write=True, store them on the nodes"""
+    updated = write_analytics(analyze()) if write else 0
+    result = analytics_summary(n=0)
+    result["updated"] = updated
+    return result
@@ -0,0 +1,302 @@
+"""Graph snapshots in a columnar binary format, and a binary graph payload for the browser.
+
+export_graph() writes the node and edge tables, layout and analytics
+columns included, as one .npy file per column plus a manifest.json, so a
+snapshot can be memory-mapped and read back without parsing anything.
+import_graph() bulk-loads a snapshot with executemany on the driver
+connection instead of ORM inserts, dropping the node and edge indexes for
+the load and rebuilding them once at the end. graph_payload() packs the
+graph (or the changes after a version) as little-endian typed arrays that
+the graph page wraps in TypedArray views.
+"""
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import inspect, text
+
+from models.db_model import db, Edge, Node
+from services.graph_service import display_color, get_graph_state, next_graph_version, notify_graph_changed
+from services.layout_service import FETCH_BATCH, fetch_arrays
+
+SNAPSHOT_FORMAT = "sequel-graph-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+
+# Nullable numeric columns are stored as float64 with NaN for NULL
+NODE_FILES = ("node_id", "node_label_offsets", "node_label", "node_size", "node_color", "node_x", "node_y",
+              "node_community", "node_created_at")
+EDGE_FILES = ("edge_id", "edge_source_id", "edge_target_id", "edge_weight", "edge_cooccurrence",
+              "edge_created_at")
+
+PAYLOAD_MAGIC = b"SQGB"
+
+
+def encode_strings(values):
+    """UTF-8 encode strings into (offsets, bytes); string i is bytes[offsets[i]:offsets[i + 1]]"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], dtype=np.int64, out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def decode_strings(offsets, data):
+    data = bytes(data)
+    offsets = np.asarray(offsets).tolist()
+    return [data[start:stop].decode("utf-8") for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def _dictionary(values):
+    """Dictionary-encode a column with few distinct values: (palette, codes)"""
+    palette = list(dict.fromkeys(values))
+    lookup = {value: code for code, value in enumerate(palette)}
+    return palette, np.array([lookup[value] for value in values], dtype=np.uint32)
+
+
+def _nullable(array):
+    """A float column as a list with None where it is NaN"""
+    column = np.asarray(array).astype(object)
+    column[np.isnan(array)] = None
+    return column.tolist()
+
+
+def _timestamps(array):
+    """A datetime64 column as strings in the format SQLAlchemy stores, with None for NaT"""
+    column = np.datetime_as_string(array, unit="us").astype(object)
+    column[np.isnat(array)] = None
+    return [value.replace("T", " ") if value else None for value in column.tolist()]
+
+
+def export_graph(path):
+    """Write every node and edge to the snapshot directory path; returns the manifest"""
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST)
+    # Without a manifest a half-written directory cannot be mistaken for a snapshot
+    if os.path.exists(manifest_path):
+        os.unlink(manifest_path)
+
+    version, _ = get_graph_state()
+    ids, labels, sizes, colors, xs, ys, communities, created = fetch_arrays(
+        "SELECT id, label, size, color, x, y, community, created_at FROM node ORDER BY id",
+        [np.int64, object, np.float64, object, np.float64, np.float64, np.float64, "datetime64[us]"])
+    edge_ids, sources, targets, weights, counts, edge_created = fetch_arrays(
+        "SELECT id, source_id, target_id, weight, cooccurrence, created_at FROM edge ORDER BY id",
+        [np.int64, np.int64, np.int64, np.float64, np.int64, "datetime64[us]"])
+    # Edges committed after the node query may point at nodes that were not read
+    keep = np.isin(sources, ids) & np.isin(targets, ids)
+
+    label_offsets, label_bytes = encode_strings(labels)
+    palette, color_codes = _dictionary(colors.tolist())
+    columns = {
+        "node_id": ids, "node_label_offsets": label_offsets, "node_label": label_bytes, "node_size": sizes,
+        "node_color": color_codes, "node_x": xs, "node_y": ys, "node_community": communities,
+        "node_created_at": created,
+        "edge_id": edge_ids[keep], "edge_source_id": sources[keep], "edge_target_id": targets[keep],
+        "edge_weight": weights[keep], "edge_cooccurrence": counts[keep], "edge_created_at": edge_created[keep],
+    }
+    for name, array in columns.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "format_version": SNAPSHOT_VERSION,
+        "graph_version": version,
+        "exported_at": datetime.utcnow().isoformat(),
+        "nodes": len(ids),
+        "edges": int(keep.sum()),
+        "colors": palette,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_snapshot(path):
+    """Return (manifest, {column: memory-mapped array}) for a snapshot written by export_graph"""
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{path} has no {MANIFEST}; is it a complete graph snapshot?")
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("format_version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} graph snapshot")
+    columns = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in NODE_FILES + EDGE_FILES}
+    expected = {name: manifest["nodes"] for name in NODE_FILES}
+    expected.update({name: manifest["edges"] for name in EDGE_FILES})
+    expected["node_label_offsets"] = manifest["nodes"] + 1
+    expected["node_label"] = int(columns["node_label_offsets"][-1])
+    for name, length in expected.items():
+        if len(columns[name]) != length:
+            raise ValueError(f"{name}.npy has {len(columns[name])} values, expected {length}")
+    return manifest, columns
+
+
+def _insert_sql(table, names):
+    """INSERT for executemany on the driver connection, in the driver's parameter style"""
+    paramstyle = db.engine.dialect.paramstyle
+    marker = "?" if paramstyle == "qmark" else "%s"
+    if paramstyle not in ("qmark", "format", "pyformat"):
+        raise ValueError(f"Bulk import does not support the {paramstyle} parameter style")
+    return f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join([marker] * len(names))})"
+
+
+def _graph_indexes(conn):
+    """The node and edge indexes declared on the models that exist in the database"""
+    inspector = inspect(conn)
+    indexes = []
+    for table in (Node.__table__, Edge.__table__):
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        indexes.extend(index for index in table.indexes if index.name in existing)
+    return indexes
+
+
+def import_graph(path, replace=False, batch_size=FETCH_BATCH):
+    """Bulk-load a snapshot into an empty graph (or over the current one with replace=True).
+
+    Node and edge ids are kept, every row is stamped with a new graph
+    version and clients are told to reload from scratch. The load runs in
+    one transaction, so a failed import leaves the old graph in place.
+    With replace=True chat-to-concept links are dropped because they refer
+    to the old node ids; ``flask backfill-search`` recreates them. Returns
+    (nodes, edges) imported.
+    """
+    manifest, columns = read_snapshot(path)
+    if not replace and db.session.execute(text("SELECT 1 FROM node LIMIT 1")).first() is not None:
+        raise ValueError("The graph is not empty; import with replace=True (--replace) to overwrite it")
+
+    conn = db.session.connection()
+    try:
+        version = next_graph_version(reset=True)
+        # Maintaining the indexes row by row costs more than the inserts; rebuild them once instead
+        indexes = _graph_indexes(conn)
+        for index in indexes:
+            index.drop(conn)
+        if replace:
+            conn.execute(text("DELETE FROM chat_concept"))
+            conn.execute(text("DELETE FROM edge"))
+            conn.execute(text("DELETE FROM node"))
+
+        palette = manifest["colors"]
+        sql = _insert_sql("node", ["id", "label", "size", "color", "x", "y", "community", "created_at", "version"])
+        for start in range(0, manifest["nodes"], batch_size):
+            stop = min(manifest["nodes"], start + batch_size)
+            offsets = columns["node_label_offsets"][start:stop + 1]
+            labels = decode_strings(offsets - offsets[0], columns["node_label"][offsets[0]:offsets[-1]])
+            communities = [None if value is None else int(value)
+                           for value in _nullable(columns["node_community"][start:stop])]
+            rows = zip(columns["node_id"][start:stop].tolist(), labels,
+                       _nullable(columns["node_size"][start:stop]),
+                       [palette[code] for code in columns["node_color"][start:stop].tolist()],
+                       _nullable(columns["node_x"][start:stop]), _nullable(columns["node_y"][start:stop]),
+                       communities, _timestamps(columns["node_created_at"][start:stop]),
+                       [version] * (stop - start))
+            conn.exec_driver_sql(sql, list(rows))
+
+        sql = _insert_sql("edge", ["id", "source_id", "target_id", "weight", "cooccurrence", "created_at",
+                                   "version"])
+        for start in range(0, manifest["edges"], batch_size):
+            stop = min(manifest["edges"], start + batch_size)
+            rows = zip(columns["edge_id"][start:stop].tolist(), columns["edge_source_id"][start:stop].tolist(),
+                       columns["edge_target_id"][start:stop].tolist(),
+                       _nullable(columns["edge_weight"][start:stop]),
+                       columns["edge_cooccurrence"][start:stop].tolist(),
+                       _timestamps(columns["edge_created_at"][start:stop]), [version] * (stop - start))
+            conn.exec_driver_sql(sql, list(rows))
+
+        for index in indexes:
+            index.create(conn)
+        if db.engine.dialect.name == "postgresql":
+            # Explicit ids do not advance the serial sequences
+            for table in ("node", "edge"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                  f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # The similarity index still holds the old labels; it is rebuilt from the node table on next use
+    from services.chat_service import reset_concept_index
+    reset_concept_index()
+    notify_graph_changed()
+    return manifest["nodes"], manifest["edges"]
+
+
+def _id_dtype(*arrays):
+    """uint32 ids unless one does not fit, in which case float64 (exact up to 2**53)"""
+    largest = max((int(array.max()) for array in arrays if len(array)), default=0)
+    return "<u4" if largest < 2 ** 32 else "<f8"
+
+
+def _aligned(size):
+    return -(-size // 8) * 8
+
+
+def graph_payload(since=None):
+    """The graph (or the changes after ``since``, as in get_graph_data) packed as typed arrays.
+
+    Layout: b"SQGB", a little-endian uint32 header length and the JSON
+    header, padded to a multiple of 8 bytes, then the arrays, each padded
+    to 8 bytes. The header gives the version, whether the payload is full,
+    the node and edge counts, the colour palette and [name, type, offset,
+    length] for every array, with offsets counted from the first array.
+    Nodes carry their display colour as a palette index, NaN x/y for
+    unplaced nodes and -1 for no community.
+    """
+    version, reset_version = get_graph_state()
+    full = since is None or since < reset_version
+    where = "" if full else " WHERE version > :since"
+    params = None if full else {"since": since}
+    ids, labels, sizes, colors, xs, ys, communities = fetch_arrays(
+        f"SELECT id, label, size, color, x, y, community FROM node{where} ORDER BY id",
+        [np.int64, object, np.float64, object, np.float64, np.float64, np.float64], params)
+    edge_ids, sources, targets, weights, counts = fetch_arrays(
+        f"SELECT id, source_id, target_id, weight, cooccurrence FROM edge{where} ORDER BY id",
+        [np.int64, np.int64, np.int64, np.float64, np.int64], params)
+
+    palette, color_codes = _dictionary([display_color(label, color) for label, color in zip(labels, colors)])
+    label_offsets, label_bytes = encode_strings(labels)
+    id_dtype = _id_dtype(ids, edge_ids, sources, targets)
+    arrays = [
+        ("node_id", ids.astype(id_dtype)),
+        ("size", np.nan_to_num(sizes, nan=1.0).astype("<f4")),
+        ("x", xs.astype("<f4")),
+        ("y", ys.astype("<f4")),
+        ("community", np.nan_to_num(communities, nan=-1).astype("<i4")),
+        ("color", color_codes.astype("<u2")),
+        ("label_offsets", label_offsets.astype("<u4")),
+        ("label", label_bytes),
+        ("edge_id", edge_ids.astype(id_dtype)),
+        ("source", sources.astype(id_dtype)),
+        ("target", targets.astype(id_dtype)),
+        ("weight", np.nan_to_num(weights, nan=1.0).astype("<f4")),
+        ("cooccurrence", counts.astype("<u4")),
+    ]
+
+    header = {"version": version, "full": full, "nodes": len(ids), "edges": len(edge_ids), "colors": palette,
+              "arrays": []}
+    offset = 0
+    for name, array in arrays:
+        header["arrays"].append([name, array.dtype.name, offset, len(array)])
+        offset += _aligned(array.nbytes)
+    encoded = json.dumps(header).encode("utf-8")
+    padding = _aligned(8 + len(encoded)) - 8 - len(encoded)
+    parts = [PAYLOAD_MAGIC, struct.pack("<I", len(encoded)), encoded, b" " * padding]
+    for name, array in arrays:
+        parts.append(array.tobytes())
+        parts.append(b"\0" * (_aligned(array.nbytes) - array.nbytes))
+    return b"".join(parts)
+
+
+def decode_graph_payload(data):
+    """Read a graph_payload() back into its header and a dict of arrays (used by the benchmarks)"""
+    if data[:4] != PAYLOAD_MAGIC:
+        raise ValueError("Not a graph payload")
+    header_size, = struct.unpack_from("<I", data, 4)
+    header = json.loads(data[8:8 + header_size])
+    base = _aligned(8 + header_size)
+    arrays = {name: np.frombuffer(data, dtype=np.dtype(dtype).newbyteorder("<"), count=length, offset=base + offset)
+              for name, dtype, offset, length in header["arrays"]}
+    return header, arrays
@@ -0,0 +1,195 @@
+import json
+
+from sqlalchemy import text
+
+from models.db_model import db
+from services.graph_service import CHUNK_SIZE, get_graph_state, node_row_to_dict
+
+# Upper bounds so a single request cannot pull the whole graph into memory
+MAX_LIMIT = 5000
+MAX_HOPS = 3
+
+NODE_COLUMNS = "id, label, size, color, x, y, community"
+EDGE_COLUMNS = "id, source_id, target_id, weight, cooccurrence"
+
+
+def edge_row_to_dict(row):
+    return {
+        'id': str(row[0]),
+        'source': str(row[1]),
+        'target': str(row[2]),
+        'weight': row[3],
+        'cooccurrence': row[4]
+    }
+
+
+def _in_clause(ids):
+    """Inline an integer id list; ids always come from the database or int()"""
+    return ",".join(str(int(i)) for i in ids)
+
+
+def _fetch_nodes(ids):
+    rows = []
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = _in_clause(ids[start:start + CHUNK_SIZE])
+        rows.extend(db.session.execute(text(f"SELECT {NODE_COLUMNS} FROM node WHERE id IN ({chunk})")))
+    return [node_row_to_dict(row) for row in rows]
+
+
+def _edges_within(ids):
+    """Edges whose both endpoints are in ids"""
+    ids = list(ids)
+    id_set = set(ids)
+    edges = []
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = _in_clause(ids[start:start + CHUNK_SIZE])
+        for row in db.session.execute(text(f"SELECT {EDGE_COLUMNS} FROM edge WHERE source_id IN ({chunk})")):
+            if row[2] in id_set:
+                edges.append(edge_row_to_dict(row))
+    return edges
+
+
+def _result(node_ids, **extra):
+    version, _ = get_graph_state()
+    result = {
+        "version": version,
+        "full": False,
+        "nodes": _fetch_nodes(node_ids),
+        "edges": _edges_within(node_ids),
+    }
+    result.update(extra)
+    return result
+
+
+def neighborhood(node_id, hops=1, limit=500):
+    """Nodes within ``hops`` edges of node_id (breadth-first, capped at limit) and the edges between them"""
+    hops = max(1, min(hops, MAX_HOPS))
+    limit = max(1, min(limit, MAX_LIMIT))
+    if not db.session.execute(text("SELECT 1 FROM node WHERE id = :id"), {"id": node_id}).first():
+        return None
+
+    seen = {node_id}
+    frontier = [node_id]
+    truncated = False
+    for _ in range(hops):
+        if not frontier:
+            break
+        next_frontier = []
+        for start in range(0, len(frontier), CHUNK_SIZE):
+            chunk = _in_clause(frontier[start:start + CHUNK_SIZE])
+            rows = db.session.execute(text(
+                f"SELECT target_id FROM edge WHERE source_id IN ({chunk}) "
+                f"UNION SELECT source_id FROM edge WHERE target_id IN ({chunk})"
+            ))
+            for (neighbor,) in rows:
+                if neighbor in seen:
+                    continue
+                if len(seen) >= limit:
+                    truncated = True
+                    break
+                seen.add(neighbor)
+                next_frontier.append(neighbor)
+            if truncated:
+                break
+        if truncated:
+            break
+        frontier = next_frontier
+
+    return _result(seen, mode="neighborhood", center=str(node_id), hops=hops, truncated=truncated)
+
+
+def top_nodes(n=100, by="degree"):
+    """The n best-connected nodes by edge count ("degree") or summed edge weight ("weight")"""
+    n = max(1, min(n, MAX_LIMIT))
+    by = "degree" if by == "degree" else "weight"
+    order = "degree" if by == "degree" else "strength"
+    rows = db.session.execute(text(
+        "SELECT node_id, COUNT(*) AS degree, SUM(weight) AS strength FROM ("
+        "SELECT source_id AS node_id, weight FROM edge UNION ALL "
+        "SELECT target_id AS node_id, weight FROM edge) "
+        f"GROUP BY node_id ORDER BY {order} DESC, node_id LIMIT :n"
+    ), {"n": n}).all()
+
+    result = _result([row[0] for row in rows], mode="top", by=by)
+    scores = {str(row[0]): {"degree": row[1], "strength": row[2]} for row in rows}
+    for node in result["nodes"]:
+        node.update(scores.get(node["id"], {}))
+    return result
+
+
+def viewport(x0, y0, x1, y1, limit=1000):
+    """Laid-out nodes inside a bounding box (largest first) and the edges between them"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    rows = db.session.execute(text(
+        "SELECT id FROM node WHERE x BETWEEN :x0 AND :x1 AND y BETWEEN :y0 AND :y1 "
+        "ORDER BY size DESC, id LIMIT :limit"
+    ), {"x0": min(x0, x1), "x1": max(x0, x1), "y0": min(y0, y1), "y1": max(y0, y1), "limit": limit}).all()
+    return _result([row[0] for row in rows], mode="viewport", truncated=len(rows) == limit)
+
+
+def page(kind="nodes", after=0, limit=1000):
+    """One keyset-paginated page of nodes or edges ordered by id.
+
+    ``next`` is the cursor for the following page, or None on the last one.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    if kind == "edges":
+        rows = db.session.execute(text(
+            f"SELECT {EDGE_COLUMNS} FROM edge WHERE id > :after ORDER BY id LIMIT :limit"
+        ), {"after": after, "limit": limit}).all()
+        items = [edge_row_to_dict(row) for row in rows]
+    else:
+        rows = db.session.execute(text(
+            f"SELECT {NODE_COLUMNS} FROM node WHERE id > :after ORDER BY id LIMIT :limit"
+        ), {"after": after, "limit": limit}).all()
+        items = [node_row_to_dict(row) for row in rows]
+
+    version, _ = get_graph_state()
+    return {
+        "version": version,
+        "full": False,
+        "mode": "page",
+        "kind": kind,
+        "nodes": items if kind != "edges" else [],
+        "edges": items if kind == "edges" else [],
+        "next": rows[-1][0] if len(rows) == limit else None,
+    }
+
+
+def iter_graph_ndjson(since=None, batch_size=1000):
+    """Stream the graph as newline-delimited JSON straight from a database cursor.
+
+    Rows are fetched in batches and encoded one at a time without building
+    ORM objects, so memory use does not grow with the size of the graph.
+    The first line carries the graph version, then every node, then every edge.
+    """
+    with db.engine.connect() as conn:
+        row = conn.execute(text("SELECT version, reset_version FROM graph_state WHERE id = 1")).first()
+        version, reset_version = (row[0], row[1]) if row else (0, 0)
+        full = since is None or since < reset_version
+        where = "" if full else " WHERE version > :since"
+        params = {} if full else {"since": since}
+        yield json.dumps({"type": "meta", "version": version, "full": full}) + "\n"
+
+        streaming = conn.execution_options(stream_results=True)
+        nodes = streaming.execute(text(f"SELECT {NODE_COLUMNS} FROM node{where}"), params)
+        for row in _iter_batches(nodes, batch_size):
+            node = node_row_to_dict(row)
+            node["type"] = "node"
+            yield json.dumps(node) + "\n"
+        edges = streaming.execute(text(f"SELECT {EDGE_COLUMNS} FROM edge{where}"), params)
+        for row in _iter_batches(edges, batch_size):
+            edge = edge_row_to_dict(row)
+            edge["type"] = "edge"
+            yield json.dumps(edge) + "\n"
+
+
+def _iter_batches(result, batch_size):
+    """Iterate a streaming result fetchmany() batch by batch"""
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
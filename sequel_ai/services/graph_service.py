@@ -1,64 +1,193 @@
 from models.db_model import db, Node, Edge
+from datetime import datetime
+from sqlalchemy import text
 import random
+import threading
+from services.metrics import GRAPH_SERIALIZE_SECONDS
 
-def get_graph_data():
-    """Retrieve nodes and edges from the database for graph visualization"""
+# Keep IN lists and multi-row statements under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+def dialect_insert(model):
+    """Dialect-specific INSERT that supports ON CONFLICT clauses"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model.__table__)
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def upsert_nodes(labels, version=0):
+    """Make sure a node exists for every label; returns {label: node_id}.
+
+    New labels are inserted with ON CONFLICT DO NOTHING so concurrent writers
+    cannot create duplicates, then every id is resolved with IN queries.
+    """
+    labels = list(dict.fromkeys(labels))
+    if not labels:
+        return {}
     
-    # Get all nodes and edges
-    nodes = Node.query.all()
-    edges = Edge.query.all()
+    ids = {}
+    for chunk in _chunks(labels):
+        ids.update(db.session.query(Node.label, Node.id).filter(Node.label.in_(chunk)).all())
     
-    # Define sample/system nodes that should be filtered out for the UI
-    # These are the nodes created by create_sample_graph function
-    sample_node_labels = [
-        "Runtime Polymorphism",
-        "Compile time polymorphism",
-        "Method Overloading",
-        "Overriding",
-        "Memory allocation",
-        "Accessing through heap stack"
-    ]
+    missing = [label for label in labels if label not in ids]
+    if missing:
+        now = datetime.utcnow()
+        stmt = dialect_insert(Node).on_conflict_do_nothing(index_elements=['label'])
+        db.session.execute(stmt, [{'label': label, 'size': 1.0, 'color': '#B290D6', 'created_at': now,
+                                   'version': version} for label in missing])
+        for chunk in _chunks(missing):
+            ids.update(db.session.query(Node.label, Node.id).filter(Node.label.in_(chunk)).all())
+    return ids
+
+def upsert_edges(weighted_pairs, version=0):
+    """Insert or reinforce undirected edges given (node_id, node_id, weight) triples.
+
+    Pairs are canonicalised to (min, max) and merged in memory first; repeats
+    of an existing edge add to its weight and co-occurrence count.
+    """
+    merged = {}
+    for a, b, weight in weighted_pairs:
+        if a == b:
+            continue
+        key = (a, b) if a < b else (b, a)
+        total, count = merged.get(key, (0.0, 0))
+        merged[key] = (total + weight, count + 1)
+    if not merged:
+        return 0
     
-    # Assign colors based on node type
-    colors = {
-        "user_query": "#7C9FDF",      # Blue
-        "response": "#B290D6",        # Purple
-        "concept": "#7ED1B8",         # Green
-        "location": "#F0E98C",        # Yellow
-        "error": "#D67E7E"            # Red
-    }
+    now = datetime.utcnow()
+    stmt = dialect_insert(Edge)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['source_id', 'target_id'],
+        set_={
+            'weight': Edge.__table__.c.weight + stmt.excluded.weight,
+            'cooccurrence': Edge.__table__.c.cooccurrence + stmt.excluded.cooccurrence,
+            'version': stmt.excluded.version,
+        }
+    )
+    rows = [{'source_id': a, 'target_id': b, 'weight': weight, 'cooccurrence': count, 'created_at': now,
+             'version': version} for (a, b), (weight, count) in merged.items()]
+    db.session.execute(stmt, rows)
+    return len(rows)
+
+# Sample/system nodes that should be filtered out for the UI
+# These are the nodes created by create_sample_graph function
+SAMPLE_NODE_LABELS = frozenset([
+    "Runtime Polymorphism",
+    "Compile time polymorphism",
+    "Method Overloading",
+    "Overriding",
+    "Memory allocation",
+    "Accessing through heap stack"
+])
+
+LOCATION_LABELS = frozenset(["India", "New Delhi", "Not Found"])
+
+# Assign colors based on node type
+NODE_COLORS = {
+    "user_query": "#7C9FDF",      # Blue
+    "response": "#B290D6",        # Purple
+    "concept": "#7ED1B8",         # Green
+    "location": "#F0E98C",        # Yellow
+    "error": "#D67E7E"            # Red
+}
+
+# Colour stored on new nodes; concepts keep the category colour until analytics restyle them
+DEFAULT_NODE_COLOR = "#B290D6"
+
+# Woken whenever an ingestion commit changes the graph in this process
+_graph_changed = threading.Condition()
+
+def notify_graph_changed():
+    """Wake any request waiting in wait_for_graph_change"""
+    with _graph_changed:
+        _graph_changed.notify_all()
+
+def wait_for_graph_change(timeout):
+    """Block until notify_graph_changed is called or timeout seconds pass"""
+    with _graph_changed:
+        _graph_changed.wait(timeout)
+
+def get_graph_state():
+    """Return (version, reset_version) for the graph"""
+    row = db.session.execute(text("SELECT version, reset_version FROM graph_state WHERE id = 1")).first()
+    return (row[0], row[1]) if row else (0, 0)
+
+def next_graph_version(reset=False):
+    """Bump the graph version inside the current transaction and return it.
     
-    # Format data for Sigma.js
-    nodes_data = []
-    for i, node in enumerate(nodes):
-        node_data = node.to_dict()
-        
-        # Determine node type/category for coloring
-        if node.label in sample_node_labels:
-            node_type = "system"
-        elif "Error" in node.label or "error" in node.label:
-            node_type = "error"
-        elif node.label in ["India", "New Delhi", "Not Found"]:
-            node_type = "location"
-        else:
-            # Alternate between user query and response for other nodes
-            node_type = "concept"
-        
-        # Assign a color based on node type
-        node_data["color"] = colors.get(node_type, colors["concept"])
-        
+    The UPDATE takes the row's write lock, so concurrent writers are stamped
+    in commit order. With reset=True clients holding an older cursor are told
+    to reload everything (used when rows are deleted).
+    """
+    if reset:
+        db.session.execute(text("UPDATE graph_state SET version = version + 1, reset_version = version + 1 WHERE id = 1"))
+    else:
+        db.session.execute(text("UPDATE graph_state SET version = version + 1 WHERE id = 1"))
+    return get_graph_state()[0]
+
+def display_color(label, color):
+    """Colour a node by category; concepts show the community colour stored by graph analytics"""
+    if label in SAMPLE_NODE_LABELS:
+        node_type = "system"
+    elif "Error" in label or "error" in label:
+        node_type = "error"
+    elif label in LOCATION_LABELS:
+        node_type = "location"
+    else:
+        node_type = "concept"
+    if node_type == "concept" and color and color != DEFAULT_NODE_COLOR:
+        return color
+    return NODE_COLORS.get(node_type, NODE_COLORS["concept"])
+
+def node_row_to_dict(row):
+    """Format an (id, label, size, color, x, y, community) row for Sigma.js, colouring it by category"""
+    node_id, label, size, color, x, y, community = row
+    return {
+        'id': str(node_id),
+        'label': label,
+        'size': size,
+        'color': display_color(label, color),
         # Add additional metadata for UI filtering
-        node_data["is_sample"] = node.label in sample_node_labels
-        
-        nodes_data.append(node_data)
+        'is_sample': label in SAMPLE_NODE_LABELS,
+        # Precomputed layout, when available
+        'x': x,
+        'y': y,
+        'community': community
+    }
+
+def node_to_graph_dict(node):
+    return node_row_to_dict((node.id, node.label, node.size, node.color, node.x, node.y, node.community))
+
+def get_graph_data(since=None):
+    """Retrieve nodes and edges from the database for graph visualization.
+    
+    With ``since`` set to a version previously returned by this function, only
+    nodes and edges added or changed after it are returned (``full`` is False).
+    If rows were deleted after ``since`` a full graph is returned instead.
+    """
+    version, reset_version = get_graph_state()
     
-    edges_data = [edge.to_dict() for edge in edges]
+    nodes_query = Node.query
+    edges_query = Edge.query
+    full = since is None or since < reset_version
+    if not full:
+        nodes_query = nodes_query.filter(Node.version > since)
+        edges_query = edges_query.filter(Edge.version > since)
     
     # Return formatted graph data
-    return {
-        "nodes": nodes_data,
-        "edges": edges_data
-    }
+    with GRAPH_SERIALIZE_SECONDS.time(full=str(full).lower()):
+        return {
+            "version": version,
+            "full": full,
+            "nodes": [node_to_graph_dict(node) for node in nodes_query.all()],
+            "edges": [edge.to_dict() for edge in edges_query.all()]
+        }
 
 def create_sample_graph():
     """Create a sample graph for demonstration purposes"""
@@ -77,15 +206,12 @@ def create_sample_graph():
         "Accessing through heap stack"
     ]
     
-    # Create nodes
-    nodes = []
-    for concept in concepts:
-        node = Node(label=concept)
-        db.session.add(node)
-        db.session.flush()
-        nodes.append(node)
+    version = next_graph_version()
     
-    # Create edges (connections between concepts)
+    # Create nodes and edges with set-based inserts
+    ids = upsert_nodes(concepts, version)
+    
+    # Connections between concepts
     edges = [
         (0, 1, 0.8),  # Runtime Polymorphism - Compile time polymorphism
         (1, 2, 0.7),  # Compile time polymorphism - Method Overloading
@@ -93,14 +219,8 @@ def create_sample_graph():
         (0, 4, 0.5),  # Runtime Polymorphism - Memory allocation
         (4, 5, 0.4),  # Memory allocation - Accessing through heap stack
     ]
-    
-    for source_idx, target_idx, weight in edges:
-        edge = Edge(
-            source_id=nodes[source_idx].id,
-            target_id=nodes[target_idx].id,
-            weight=weight
-        )
-        db.session.add(edge)
+    upsert_edges([(ids[concepts[source_idx]], ids[concepts[target_idx]], weight)
+                  for source_idx, target_idx, weight in edges], version)
     
     # Commit changes
-    db.session.commit() 
\ No newline at end of file
+    db.session.commit()
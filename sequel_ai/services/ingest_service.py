@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, text
+
+from models.db_model import db, Chat, ChatConcept, Node, Edge, IngestJob
+from services.graph_service import next_graph_version, notify_graph_changed
+from services.metrics import CONCEPT_DB_SECONDS, INGEST_BATCH_SECONDS, register_collector
+
+logger = logging.getLogger(__name__)
+
+# Wakes the in-process worker as soon as a chat is queued instead of waiting for the next poll
+_job_available = threading.Event()
+
+# Running totals for the stats endpoint (per process)
+_stats = {
+    "processed": 0,
+    "failed": 0,
+    "retried": 0,
+    "batches": 0,
+    "last_batch_size": 0,
+    "last_batch_seconds": 0.0,
+    "last_ingest_lag_seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def enqueue_chat(chat_id, concepts=None, link_only=False):
+    """Queue a stored chat for ingestion; committed together with the caller's transaction.
+
+    concepts are the labels already shown to the user, so the graph gets
+    exactly those rather than a second extraction against different state.
+    A link_only job just links the chat to the nodes of its concepts.
+    """
+    db.session.add(IngestJob(chat_id=chat_id, concepts=None if concepts is None else json.dumps(concepts),
+                             link_only=link_only))
+    # Workers are woken once the job is committed and visible to them
+    db.session().info['ingest_job_queued'] = True
+
+
+def _wake_after_commit(session):
+    if session.info.pop('ingest_job_queued', False):
+        _job_available.set()
+
+
+def _forget_queued(session):
+    session.info.pop('ingest_job_queued', None)
+
+
+event.listen(db.session, 'after_commit', _wake_after_commit)
+event.listen(db.session, 'after_rollback', _forget_queued)
+
+
+def claim_batch(worker_id, batch_size):
+    """Atomically mark up to batch_size pending jobs as running for this worker"""
+    now = datetime.utcnow()
+    db.session.execute(
+        text(
+            "UPDATE ingest_job SET status = 'running', worker = :worker, started_at = :now, "
+            "attempts = attempts + 1 "
+            "WHERE id IN (SELECT id FROM ingest_job WHERE status = 'pending' AND available_at <= :now "
+            "ORDER BY id LIMIT :limit) AND status = 'pending'"
+        ),
+        {"worker": worker_id, "now": now, "limit": batch_size},
+    )
+    db.session.commit()
+    return (IngestJob.query
+            .filter(IngestJob.status == 'running', IngestJob.worker == worker_id)
+            .order_by(IngestJob.id)
+            .all())
+
+
+def _ingest_chats(jobs):
+    """Fold the chats behind jobs into the graph inside the current transaction"""
+    from services.chat_service import find_concepts_batch, add_concept_sets_to_graph
+
+    # Coalesced repeats are linked after the batch's graph writes, which may create their nodes
+    shared = [job for job in jobs if job.link_only]
+    stored = {job.chat_id: job.concepts for job in jobs if not job.link_only}
+    chats = Chat.query.filter(Chat.id.in_(list(stored))).all()
+    # Only chats queued without concepts (e.g. by rebuild_graph) are extracted here
+    missing = [chat for chat in chats if stored[chat.id] is None]
+    extracted = {}
+    if missing:
+        extracted = dict(zip((chat.id for chat in missing),
+                             find_concepts_batch([(chat.message, chat.response) for chat in missing])))
+    concept_sets = [extracted[chat.id] if chat.id in extracted else json.loads(stored[chat.id]) for chat in chats]
+    with CONCEPT_DB_SECONDS.time(path="ingest"):
+        add_concept_sets_to_graph(concept_sets, [chat.id for chat in chats])
+        if shared:
+            _link_shared_chats(shared)
+
+
+def _link_shared_chats(jobs):
+    """Link coalesced chats to the nodes their leader's ingestion already resolved"""
+    from services.chat_service import existing_node_ids, link_chat_concepts
+
+    concepts = {job.chat_id: json.loads(job.concepts) for job in jobs}
+    chat_ids = [chat_id for chat_id, in db.session.query(Chat.id).filter(Chat.id.in_(list(concepts)))]
+    concept_sets = [concepts[chat_id] for chat_id in chat_ids]
+    link_chat_concepts(chat_ids, concept_sets,
+                       existing_node_ids({label for concepts in concept_sets for label in concepts}))
+
+
+def _finish(jobs):
+    """Delete completed jobs and record how long they waited"""
+    now = datetime.utcnow()
+    lag = max((now - job.enqueued_at).total_seconds() for job in jobs)
+    for job in jobs:
+        db.session.delete(job)
+    db.session.commit()
+    notify_graph_changed()
+    with _stats_lock:
+        _stats["processed"] += len(jobs)
+        _stats["last_ingest_lag_seconds"] = lag
+
+
+def _fail(job, error, max_attempts, retry_delay):
+    """Put a job back in the queue with backoff, or park it once out of attempts"""
+    job.error = str(error)[:1000]
+    job.worker = None
+    if job.attempts >= max_attempts:
+        job.status = 'failed'
+        key = "failed"
+    else:
+        job.status = 'pending'
+        job.available_at = datetime.utcnow() + timedelta(seconds=retry_delay * (2 ** (job.attempts - 1)))
+        key = "retried"
+    db.session.commit()
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def process_batch(worker_id, batch_size=50, max_attempts=5, retry_delay=2.0):
+    """Claim and ingest one batch of chats; returns the number of jobs handled"""
+    jobs = claim_batch(worker_id, batch_size)
+    if not jobs:
+        return 0
+
+    # Ids are read now; after a rollback the job objects are expired and may no longer exist
+    job_ids = [job.id for job in jobs]
+    started = time.perf_counter()
+    try:
+        # Happy path: every chat in the batch lands in a single transaction
+        _ingest_chats(jobs)
+        _finish(jobs)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Ingest batch of %d failed, retrying jobs one by one: %s", len(jobs), e)
+        # Isolate the failing chats so one bad row does not hold back the rest
+        for job_id in job_ids:
+            job = db.session.get(IngestJob, job_id)
+            if job is None:
+                # Reclaimed or deleted (e.g. by rebuild_graph) since the batch was claimed
+                continue
+            try:
+                _ingest_chats([job])
+                _finish([job])
+            except Exception as job_error:
+                db.session.rollback()
+                job = db.session.get(IngestJob, job_id)
+                if job is None:
+                    continue
+                logger.warning("Ingesting chat %s failed (attempt %d): %s", job.chat_id, job.attempts, job_error)
+                _fail(job, job_error, max_attempts, retry_delay)
+
+    seconds = time.perf_counter() - started
+    INGEST_BATCH_SECONDS.observe(seconds)
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["last_batch_size"] = len(jobs)
+        _stats["last_batch_seconds"] = seconds
+    return len(jobs)
+
+
+def requeue_stale(timeout_seconds=300):
+    """Return jobs left 'running' by a crashed worker to the queue"""
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    count = (IngestJob.query
+             .filter(IngestJob.status == 'running', IngestJob.started_at < cutoff)
+             .update({"status": 'pending', "worker": None}, synchronize_session=False))
+    db.session.commit()
+    return count
+
+
+def queue_stats():
+    """Queue depth and lag, plus this process's worker counters"""
+    counts = dict(db.session.query(IngestJob.status, func.count(IngestJob.id))
+                  .group_by(IngestJob.status).all())
+    oldest = (db.session.query(func.min(IngestJob.enqueued_at))
+              .filter(IngestJob.status.in_(['pending', 'running'])).scalar())
+    with _stats_lock:
+        worker_stats = dict(_stats)
+    return {
+        "depth": counts.get('pending', 0) + counts.get('running', 0),
+        "pending": counts.get('pending', 0),
+        "running": counts.get('running', 0),
+        "failed": counts.get('failed', 0),
+        "lag_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+        "workers": len(_workers),
+        "worker": worker_stats,
+    }
+
+
+def _queue_gauges():
+    stats = queue_stats()
+    worker = stats["worker"]
+    return {
+        "sequel_ingest_queue_jobs": ("Ingest jobs by status", [({"status": status}, stats[status])
+                                                               for status in ("pending", "running", "failed")]),
+        "sequel_ingest_lag_seconds": ("Age of the oldest queued ingest job", stats["lag_seconds"]),
+        "sequel_ingest_workers": ("Ingest worker threads in this process", stats["workers"]),
+        "sequel_ingest_jobs_processed": ("Jobs ingested by this process", worker["processed"]),
+        "sequel_ingest_jobs_retried": ("Jobs put back for a retry by this process", worker["retried"]),
+        "sequel_ingest_jobs_failed": ("Jobs given up on by this process", worker["failed"]),
+    }
+
+
+register_collector(_queue_gauges)
+
+
+def rebuild_graph():
+    """Drop every node and edge and queue all stored chats for re-ingestion"""
+    from services.chat_service import get_concept_index
+    from services.concept_extractor import get_extractor
+    IngestJob.query.delete()
+    ChatConcept.query.delete()
+    Edge.query.delete()
+    Node.query.delete()
+    # Deletions cannot be sent as a delta, so clients must reload from scratch
+    next_graph_version(reset=True)
+    now = datetime.utcnow()
+    db.session.execute(
+        text(
+            "INSERT INTO ingest_job (chat_id, status, attempts, enqueued_at, available_at) "
+            "SELECT id, 'pending', 0, :now, :now FROM chat ORDER BY id"
+        ),
+        {"now": now},
+    )
+    db.session.commit()
+    get_concept_index().reset()
+    # Every chat is extracted again, so start counting document frequencies afresh
+    get_extractor().document_frequencies.clear()
+    notify_graph_changed()
+    _job_available.set()
+    return IngestJob.query.count()
+
+
+def drain(worker_id="drain", batch_size=200):
+    """Process the queue in the calling thread until it is empty"""
+    total = 0
+    while True:
+        handled = process_batch(worker_id, batch_size)
+        if not handled:
+            return total
+        total += handled
+
+
+class IngestWorker(threading.Thread):
+    """Daemon thread that pulls batches from the ingest_job table"""
+
+    def __init__(self, app, batch_size=50, poll_interval=1.0, max_attempts=5, retry_delay=2.0):
+        super().__init__(daemon=True)
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        _job_available.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            handled = 0
+            try:
+                with self.app.app_context():
+                    handled = process_batch(self.worker_id, self.batch_size, self.max_attempts, self.retry_delay)
+            except Exception:
+                logger.exception("Ingest worker error")
+            if not handled:
+                _job_available.wait(self.poll_interval)
+                _job_available.clear()
+
+
+def start_ingest_workers(app):
+    """Start the configured number of ingest worker threads for this process"""
+    count = app.config.get('INGEST_WORKERS', 1)
+    if count <= 0 or _workers:
+        return _workers
+    with _workers_lock:
+        if _workers:
+            return _workers
+        with app.app_context():
+            requeue_stale(app.config.get('INGEST_STALE_SECONDS', 300))
+        for _ in range(count):
+            worker = IngestWorker(
+                app,
+                batch_size=app.config.get('INGEST_BATCH_SIZE', 50),
+                poll_interval=app.config.get('INGEST_POLL_INTERVAL', 1.0),
+                max_attempts=app.config.get('INGEST_MAX_ATTEMPTS', 5),
+            )
+            worker.start()
+            _workers.append(worker)
+    return _workers
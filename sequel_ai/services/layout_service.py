@@ -0,0 +1,372 @@
+import random
+import threading
+
+import numpy as np
+from sqlalchemy import text
+
+from models.db_model import db
+from services.graph_service import CHUNK_SIZE, get_graph_state, next_graph_version
+
+# Rows fetched per round trip when loading the graph into arrays
+FETCH_BATCH = 50000
+
+# Community summaries keyed by graph version, so repeated LOD requests are free
+_summary_cache = {}
+_summary_lock = threading.Lock()
+
+# Bounding box of the last full layout, used to place nodes without placed neighbours
+_extent = None
+
+
+def fetch_arrays(sql, dtypes, params=None):
+    """Run sql and return one NumPy array per column, filled fetchmany() batch by batch"""
+    result = db.session.execute(text(sql), params or {})
+    columns = [[] for _ in dtypes]
+    while True:
+        rows = result.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        for i, column in enumerate(zip(*rows)):
+            columns[i].append(np.array(column, dtype=dtypes[i]))
+    return [np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+            for parts, dtype in zip(columns, dtypes)]
+
+
+def load_graph_arrays():
+    """Load the graph as sorted node ids plus edge endpoint indices into that array,
+    with each node's stored position and community (NaN where unset)"""
+    ids, xs, ys, communities = fetch_arrays("SELECT id, x, y, community FROM node ORDER BY id",
+                                            [np.int64, np.float64, np.float64, np.float64])
+    src, dst, weight = fetch_arrays("SELECT source_id, target_id, weight FROM edge",
+                                     [np.int64, np.int64, np.float64])
+    positions = np.column_stack([xs, ys]) if len(ids) else np.empty((0, 2))
+    return (ids, np.searchsorted(ids, src), np.searchsorted(ids, dst), np.nan_to_num(weight, nan=1.0), positions,
+            communities)
+
+
+def force_layout(n, src, dst, weight, positions=None, iterations=50, scaling=2.0, gravity=1.0,
+                 seed=0, chunk=4096):
+    """ForceAtlas2-style layout vectorised over a sparse edge list.
+
+    Attraction is linear along edges and accumulated with ``np.bincount``.
+    Repulsion between all pairs would be O(n^2), so each node is instead
+    repelled by the centres of mass of a coarse grid of cells (a flat
+    Barnes-Hut approximation), processed in chunks to bound memory.
+    Existing positions are used as the starting point when given, so a
+    re-layout after small changes converges quickly.
+    """
+    rng = np.random.default_rng(seed)
+    spread = max(1.0, np.sqrt(n))
+    if positions is None:
+        positions = rng.uniform(-spread, spread, (n, 2))
+    else:
+        positions = np.array(positions, dtype=np.float64, copy=True)
+        missing = np.isnan(positions).any(axis=1)
+        positions[missing] = rng.uniform(-spread, spread, (int(missing.sum()), 2))
+    if n == 0:
+        return positions
+
+    mass = 1.0 + np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+    grid = int(np.clip(np.sqrt(n) / 4, 4, 16))
+    temperature = 0.1 * (np.ptp(positions, axis=0).max() + 1.0)
+
+    for iteration in range(iterations):
+        force = np.zeros((n, 2))
+
+        # Repulsion from grid cell centres of mass
+        low = positions.min(axis=0)
+        span = np.ptp(positions, axis=0) + 1e-9
+        cells = np.minimum(((positions - low) / span * grid).astype(np.int64), grid - 1)
+        cell_id = cells[:, 0] * grid + cells[:, 1]
+        cell_mass = np.bincount(cell_id, weights=mass, minlength=grid * grid)
+        occupied = cell_mass > 0
+        centres = np.column_stack([
+            np.bincount(cell_id, weights=mass * positions[:, 0], minlength=grid * grid)[occupied],
+            np.bincount(cell_id, weights=mass * positions[:, 1], minlength=grid * grid)[occupied],
+        ]) / cell_mass[occupied][:, None]
+        cell_mass = cell_mass[occupied]
+        for start in range(0, n, chunk):
+            px = positions[start:start + chunk, 0]
+            py = positions[start:start + chunk, 1]
+            dist2 = (px[:, None] - centres[None, :, 0]) ** 2
+            dist2 += (py[:, None] - centres[None, :, 1]) ** 2
+            dist2 += 0.01
+            # sum_j m_j (p_i - c_j) / d_ij^2, expanded so the only (chunk, cells) temporary is dist2
+            np.divide(cell_mass[None, :], dist2, out=dist2)
+            total = dist2.sum(axis=1)
+            repulsion = scaling * mass[start:start + chunk]
+            force[start:start + chunk, 0] += repulsion * (px * total - dist2 @ centres[:, 0])
+            force[start:start + chunk, 1] += repulsion * (py * total - dist2 @ centres[:, 1])
+
+        # Linear attraction along edges
+        if len(src):
+            pull = weight[:, None] * (positions[src] - positions[dst])
+            for axis in range(2):
+                force[:, axis] -= np.bincount(src, weights=pull[:, axis], minlength=n)
+                force[:, axis] += np.bincount(dst, weights=pull[:, axis], minlength=n)
+
+        # Gravity keeps disconnected components from drifting away
+        norm = np.sqrt((positions ** 2).sum(axis=1)) + 1e-9
+        force -= gravity * mass[:, None] * positions / norm[:, None]
+
+        # Move along the force, capping the step length as the layout cools
+        step = force / mass[:, None]
+        length = np.sqrt((step ** 2).sum(axis=1)) + 1e-9
+        limit = temperature * (1.0 - iteration / iterations) + 1e-3
+        positions += step * np.minimum(1.0, limit / length)[:, None]
+
+    return positions
+
+
+def label_propagation(n, src, dst, weight, iterations=10, seed=0):
+    """Weighted label propagation communities; returns compact labels 0..k-1.
+
+    Each round, every node's (node, neighbour label) weights are summed with
+    one ``np.unique``/``np.bincount`` pass and a random half of the nodes
+    adopt their heaviest label, which avoids the oscillation of fully
+    synchronous updates.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n, dtype=np.int64)
+    if n == 0 or len(src) == 0:
+        return labels
+
+    node = np.concatenate([src, dst]).astype(np.int64)
+    neighbour = np.concatenate([dst, src]).astype(np.int64)
+    w = np.concatenate([weight, weight])
+
+    for _ in range(iterations):
+        keys = node * n + labels[neighbour]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=w) + rng.random(len(unique_keys)) * 1e-9
+        key_node = unique_keys // n
+        key_label = unique_keys % n
+
+        # Heaviest label per node: unique keys are already grouped by node, so take each
+        # group's maximum and keep its first (lowest) label reaching it, without sorting
+        starts = np.flatnonzero(np.concatenate([[True], key_node[1:] != key_node[:-1]]))
+        best_total = np.repeat(np.maximum.reduceat(totals, starts), np.diff(np.append(starts, len(totals))))
+        best = np.flatnonzero(totals == best_total)
+        first = np.ones(len(best), dtype=bool)
+        first[1:] = key_node[best][1:] != key_node[best][:-1]
+        best_node = key_node[best][first]
+        best_label = key_label[best][first]
+
+        update = rng.random(len(best_node)) < 0.5
+        changed = labels[best_node[update]] != best_label[update]
+        labels[best_node[update]] = best_label[update]
+        if not changed.any():
+            break
+
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def stable_labels(labels, previous):
+    """Renumber communities so they keep the label most of their members had before.
+
+    Each previous label goes to the new community holding most of its nodes;
+    communities left without one get fresh labels above every previous one.
+    Keeping labels stable means a write-back only touches nodes that moved.
+    """
+    count = int(labels.max()) + 1 if len(labels) else 0
+    mapping = np.full(count, -1, dtype=np.int64)
+    known = ~np.isnan(previous)
+    next_label = 0
+    if known.any():
+        old_values, old = np.unique(previous[known].astype(np.int64), return_inverse=True)
+        new = labels[known]
+        pairs, overlap = np.unique(new * len(old_values) + old, return_counts=True)
+        pair_new, pair_old = pairs // len(old_values), pairs % len(old_values)
+        # Largest overlap first for every previous label
+        order = np.lexsort((-overlap, pair_old))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_old[order][1:] != pair_old[order][:-1]
+        winners = order[first]
+        # A new community can win several previous labels; it keeps its largest overlap
+        order = winners[np.lexsort((-overlap[winners], pair_new[winners]))]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_new[order][1:] != pair_new[order][:-1]
+        mapping[pair_new[order][first]] = old_values[pair_old[order][first]]
+        next_label = int(old_values.max()) + 1
+    fresh = mapping < 0
+    mapping[fresh] = next_label + np.arange(int(fresh.sum()))
+    return mapping[labels]
+
+
+def needs_layout():
+    """True when the graph has nodes but none of them has a position yet"""
+    row = db.session.execute(text("SELECT COUNT(*), COUNT(x) FROM node")).first()
+    return row[0] > 0 and row[1] == 0
+
+
+def compute_layout(iterations=50, seed=0):
+    """Lay out the whole graph, detect communities and store both on the nodes"""
+    global _extent
+
+    ids, src, dst, weight, positions, previous = load_graph_arrays()
+    n = len(ids)
+    if n == 0:
+        return 0
+
+    has_layout = not np.isnan(positions).all()
+    positions = force_layout(n, src, dst, weight, positions if has_layout else None, iterations, seed=seed)
+    # Keep the numbers write_analytics (or an earlier layout) stored, so colours stay meaningful
+    communities = stable_labels(label_propagation(n, src, dst, weight, seed=seed), previous)
+
+    version = next_graph_version()
+    for start in range(0, n, FETCH_BATCH):
+        end = start + FETCH_BATCH
+        db.session.execute(
+            text("UPDATE node SET x = :x, y = :y, community = :community, version = :version WHERE id = :id"),
+            [{"id": int(node_id), "x": float(x), "y": float(y), "community": int(community), "version": version}
+             for node_id, (x, y), community in zip(ids[start:end], positions[start:end], communities[start:end])],
+        )
+    db.session.commit()
+
+    _extent = (positions.min(axis=0), positions.max(axis=0))
+    return n
+
+
+def _layout_extent():
+    global _extent
+    if _extent is None:
+        row = db.session.execute(text("SELECT MIN(x), MAX(x), MIN(y), MAX(y) FROM node")).first()
+        if row is None or row[0] is None:
+            return None
+        _extent = (np.array([row[0], row[2]]), np.array([row[1], row[3]]))
+    return _extent
+
+
+def place_new_nodes(version):
+    """Give unplaced nodes written at ``version`` a position and community.
+
+    New nodes go to the weighted centre of their already placed neighbours
+    (plus a little jitter) and join their heaviest neighbouring community,
+    so the stored layout stays usable between full ``compute_layout`` runs.
+    Runs in the caller's transaction.
+    """
+    global _extent
+
+    new_ids = [row[0] for row in db.session.execute(
+        text("SELECT id FROM node WHERE version = :version AND x IS NULL"), {"version": version})]
+    if not new_ids:
+        return 0
+
+    extent = _layout_extent()
+    if extent is None:
+        if db.session.execute(text("SELECT COUNT(*) FROM node WHERE x IS NULL")).scalar() > len(new_ids):
+            # Older nodes have never been laid out either; leave positions to compute_layout
+            return 0
+        # First nodes of an empty graph: start the layout in a box sized like force_layout's
+        spread = max(1.0, float(np.sqrt(len(new_ids))))
+        extent = _extent = (np.array([-spread, -spread]), np.array([spread, spread]))
+    low, high = extent
+    jitter = 0.02 * float((high - low).max() + 1.0)
+
+    neighbours = {node_id: [] for node_id in new_ids}
+    for start in range(0, len(new_ids), CHUNK_SIZE):
+        chunk = ",".join(str(int(i)) for i in new_ids[start:start + CHUNK_SIZE])
+        for source, target, weight in db.session.execute(text(
+                f"SELECT source_id, target_id, weight FROM edge WHERE source_id IN ({chunk}) "
+                f"UNION ALL SELECT source_id, target_id, weight FROM edge WHERE target_id IN ({chunk})")):
+            if source in neighbours:
+                neighbours[source].append((target, weight or 1.0))
+            if target in neighbours:
+                neighbours[target].append((source, weight or 1.0))
+
+    neighbour_ids = sorted({other for links in neighbours.values() for other, _ in links})
+    placed = {}
+    for start in range(0, len(neighbour_ids), CHUNK_SIZE):
+        chunk = ",".join(str(int(i)) for i in neighbour_ids[start:start + CHUNK_SIZE])
+        for node_id, x, y, community in db.session.execute(text(
+                f"SELECT id, x, y, community FROM node WHERE id IN ({chunk}) AND x IS NOT NULL")):
+            placed[node_id] = (x, y, community)
+
+    # Nodes with no placed neighbours start out as singleton communities
+    next_community = (db.session.execute(text("SELECT MAX(community) FROM node")).scalar() or 0) + 1
+
+    updates = []
+    # Two passes so nodes linked only to other new nodes can follow them
+    for _ in range(2):
+        for node_id in new_ids:
+            if node_id in placed:
+                continue
+            links = [(placed[other], weight) for other, weight in neighbours[node_id] if other in placed]
+            if links:
+                total = sum(weight for _, weight in links)
+                x = sum(p[0] * weight for p, weight in links) / total + random.uniform(-jitter, jitter)
+                y = sum(p[1] * weight for p, weight in links) / total + random.uniform(-jitter, jitter)
+                votes = {}
+                for p, weight in links:
+                    if p[2] is not None:
+                        votes[p[2]] = votes.get(p[2], 0.0) + weight
+                community = max(votes, key=votes.get) if votes else None
+            else:
+                x = random.uniform(low[0], high[0])
+                y = random.uniform(low[1], high[1])
+                community = None
+            if community is None:
+                community = next_community
+                next_community += 1
+            placed[node_id] = (x, y, community)
+            updates.append({"id": node_id, "x": x, "y": y, "community": community})
+
+    db.session.execute(text("UPDATE node SET x = :x, y = :y, community = :community WHERE id = :id"), updates)
+    return len(updates)
+
+
+def community_summary(max_communities=200):
+    """Level-of-detail view: one super-node per community and aggregated edges between them"""
+    version, _ = get_graph_state()
+    with _summary_lock:
+        cached = _summary_cache.get(version)
+    if cached is not None and cached["max_communities"] == max_communities:
+        return cached["data"]
+
+    node_count = db.session.execute(text("SELECT COUNT(*) FROM node")).scalar()
+    rows = db.session.execute(text(
+        "SELECT community, COUNT(*) AS members, AVG(x), AVG(y), MIN(x), MAX(x), MIN(y), MAX(y), MIN(id) "
+        "FROM node WHERE community IS NOT NULL AND x IS NOT NULL "
+        "GROUP BY community ORDER BY members DESC LIMIT :limit"
+    ), {"limit": max_communities}).all()
+
+    representative_ids = ",".join(str(int(row[8])) for row in rows) or "NULL"
+    labels = dict(db.session.execute(text(f"SELECT id, label FROM node WHERE id IN ({representative_ids})")).all())
+
+    communities = []
+    for community, members, x, y, min_x, max_x, min_y, max_y, first_id in rows:
+        label = labels.get(first_id, f"Cluster {community}")
+        communities.append({
+            "id": f"c{community}",
+            "community": community,
+            "label": f"{label} (+{members - 1})" if members > 1 else label,
+            "size": float(members),
+            "x": x,
+            "y": y,
+            "bbox": [min_x, min_y, max_x, max_y],
+        })
+
+    shown = {c["community"] for c in communities}
+    merged = {}
+    for a, b, weight, count in db.session.execute(text(
+            "SELECT s.community, t.community, SUM(e.weight), COUNT(*) FROM edge e "
+            "JOIN node s ON s.id = e.source_id JOIN node t ON t.id = e.target_id "
+            "WHERE s.community IS NOT NULL AND t.community IS NOT NULL AND s.community <> t.community "
+            "GROUP BY s.community, t.community")):
+        if a not in shown or b not in shown:
+            continue
+        key = (a, b) if a < b else (b, a)
+        total_weight, total_count = merged.get(key, (0.0, 0))
+        merged[key] = (total_weight + (weight or 0.0), total_count + count)
+
+    data = {
+        "version": version,
+        "node_count": node_count,
+        "communities": communities,
+        "edges": [{"id": f"c{a}-c{b}", "source": f"c{a}", "target": f"c{b}", "weight": weight, "count": count}
+                  for (a, b), (weight, count) in merged.items()],
+    }
+    with _summary_lock:
+        _summary_cache.clear()
+        _summary_cache[version] = {"max_communities": max_communities, "data": data}
+    return data
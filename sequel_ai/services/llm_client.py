@@ -0,0 +1,431 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+from services.concurrency import TokenBucket
+from services.metrics import LLM_REQUEST_SECONDS, LLM_RETRIES, LLM_STREAM_SECONDS, LLM_THROTTLE_SECONDS
+
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Status codes that are worth retrying (rate limits and transient upstream failures)
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when the upstream completion API does not return usable content"""
+
+    def __init__(self, status, message, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retryable = retryable
+
+
+class LLMBusy(LLMError):
+    """Raised by the synchronous client instead of blocking its thread for longer than max_blocking_wait.
+
+    retry_after is the number of seconds after which the request is likely to
+    succeed, for a ``Retry-After`` header.
+    """
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(status, message, retryable=True)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def compute_backoff(attempt, base=0.5, cap=8.0, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def extract_content(response_data):
+    """Pull choices[0].message.content out of a completion response"""
+    choices = response_data.get("choices") or []
+    if not choices:
+        raise LLMError(200, "Error: No response content from API")
+    message = choices[0].get("message") or {}
+    if "content" not in message:
+        raise LLMError(200, "Error: Unexpected response format from API")
+    return message["content"]
+
+
+def iter_sse_deltas(lines):
+    """Turn OpenRouter's server-sent event lines into content strings"""
+    for line in lines:
+        # Blank keep-alives and ": OPENROUTER PROCESSING" comments carry no data
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        if "error" in chunk:
+            error = chunk["error"]
+            raise LLMError(error.get("code"), error.get("message", "Stream error"))
+        choices = chunk.get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def _outcome(error):
+    """Metric label for a failed attempt: its HTTP status, or timeout"""
+    return "timeout" if error.status is None else str(error.status)
+
+
+def _error_message(status, body, default):
+    """Best-effort extraction of error.message from an OpenRouter error body"""
+    if isinstance(body, dict):
+        return (body.get("error") or {}).get("message", default)
+    return default
+
+
+class LLMClient:
+    """Pooled OpenRouter client with bounded concurrency and jittered retries.
+
+    The synchronous path shares one keep-alive ``requests.Session`` across
+    threads; the asyncio path shares one ``aiohttp.ClientSession`` per event
+    loop so a single process can keep many completions in flight.
+
+    The synchronous path runs in web worker threads, so it only sleeps for
+    short backoffs (``max_blocking_wait`` seconds in total, never while
+    holding a concurrency slot) and raises :class:`LLMBusy` with the time to
+    retry after when a longer wait would be needed.
+    """
+
+    def __init__(self, api_key, url=OPENROUTER_URL, timeout=30, max_retries=3,
+                 pool_size=20, max_concurrency=16, backoff_base=0.5, backoff_cap=8.0,
+                 retry_budget=20.0, max_blocking_wait=1.0, rate_limiter=None,
+                 referer="http://localhost:5000", title="Sequel AI"):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # Total seconds a single call may spend waiting between retries
+        self.retry_budget = retry_budget
+        # Total seconds a synchronous call may sleep in its thread before raising LLMBusy
+        self.max_blocking_wait = max_blocking_wait
+        # Optional TokenBucket matching the upstream rate limit; requests queue here instead of getting 429s
+        self.rate_limiter = rate_limiter
+        self.referer = referer
+        self.title = title
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        self._async_session = None
+        self._async_loop = None
+        self._async_semaphore = None
+
+    @classmethod
+    def from_env(cls, api_key):
+        """Build a client using the LLM_* environment variables for tuning"""
+        rate = float(os.environ.get("LLM_RATE_LIMIT", 0))
+        rate_limiter = TokenBucket(rate, float(os.environ.get("LLM_RATE_BURST", 0))) if rate > 0 else None
+        return cls(
+            api_key,
+            url=os.environ.get("OPENROUTER_URL", OPENROUTER_URL),
+            timeout=float(os.environ.get("LLM_TIMEOUT", 30)),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+            pool_size=int(os.environ.get("LLM_POOL_SIZE", 20)),
+            max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 16)),
+            retry_budget=float(os.environ.get("LLM_RETRY_BUDGET", 20)),
+            max_blocking_wait=float(os.environ.get("LLM_MAX_BLOCKING_WAIT", 1)),
+            rate_limiter=rate_limiter,
+        )
+
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": self.referer,
+            "X-Title": self.title,
+        }
+
+    @staticmethod
+    def build_payload(messages, model, temperature=0.7, max_tokens=500, stream=False):
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    # Synchronous path
+
+    @property
+    def session(self):
+        # requests is imported on first use so that importing the app stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers())
+                    self._session = session
+        return self._session
+
+    def _retry_wait(self, attempt, retry_after, deadline):
+        """Return how long to sleep before the next attempt, or None to give up"""
+        if attempt + 1 >= self.max_retries:
+            return None
+        delay = compute_backoff(attempt, self.backoff_base, self.backoff_cap, retry_after)
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
+
+    def _throttle_wait(self, deadline):
+        """Reserve a rate-limit token and return how long to wait for it"""
+        if self.rate_limiter is None:
+            return 0.0
+        wait = self.rate_limiter.reserve(max(0.0, deadline - time.monotonic()))
+        if wait is None:
+            raise LLMError(429, "Local rate limit queue is full", retryable=True)
+        return wait
+
+    def _throttle(self, blocking_deadline):
+        """Wait for a rate-limit token if it is due before blocking_deadline, recording how long that took"""
+        if self.rate_limiter is None:
+            return
+        wait = self.rate_limiter.reserve(max(0.0, blocking_deadline - time.monotonic()))
+        if wait is None:
+            raise LLMBusy(429, "Local rate limit queue is full", self.rate_limiter.delay())
+        if wait:
+            LLM_THROTTLE_SECONDS.observe(wait)
+            time.sleep(wait)
+
+    def _acquire_slot(self, blocking_deadline):
+        """Take one of the max_concurrency slots, waiting no later than blocking_deadline"""
+        if not self._semaphore.acquire(timeout=max(0.0, blocking_deadline - time.monotonic())):
+            # Slots free up as completions finish, usually within a second or two
+            raise LLMBusy(None, "Too many concurrent LLM requests", 1.0)
+
+    def _backoff(self, error, attempt, retry_after, deadline, blocking_deadline):
+        """Sleep before the next synchronous attempt, or raise if retrying is pointless or would block too long"""
+        delay = self._retry_wait(attempt, retry_after, deadline)
+        if delay is None:
+            raise error
+        self._rate_limited(error, delay)
+        if time.monotonic() + delay > blocking_deadline:
+            raise LLMBusy(error.status, error.message, delay)
+        LLM_RETRIES.inc(reason=_outcome(error))
+        time.sleep(delay)
+
+    def _rate_limited(self, error, delay):
+        """Hold every queued request back while the upstream rate limit recovers"""
+        if self.rate_limiter is not None and error.status == 429:
+            self.rate_limiter.pause(delay)
+
+    def complete(self, messages, model, temperature=0.7, max_tokens=500):
+        """Send a chat completion and return the assistant message content"""
+        import requests
+
+        payload = self.build_payload(messages, model, temperature, max_tokens)
+        now = time.monotonic()
+        deadline, blocking_deadline = now + self.retry_budget, now + self.max_blocking_wait
+
+        attempt = 0
+        while True:
+            self._throttle(blocking_deadline)
+            self._acquire_slot(blocking_deadline)
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except requests.exceptions.Timeout:
+                error = LLMError(None, "Request to LLM API timed out", retryable=True)
+                retry_after = None
+            else:
+                if resp.status_code == 200:
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="complete", outcome="ok")
+                    return extract_content(resp.json())
+                error = self._status_error(resp.status_code, self._json_or_text(resp), resp.text)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            finally:
+                self._semaphore.release()
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="complete", outcome=_outcome(error))
+
+            if not error.retryable:
+                raise error
+            self._backoff(error, attempt, retry_after, deadline, blocking_deadline)
+            attempt += 1
+
+    def stream(self, messages, model, temperature=0.7, max_tokens=500):
+        """Yield content deltas from a ``stream: true`` completion as they arrive.
+
+        Retries only happen before the first byte of a 200 response; once
+        tokens have been relayed a failure is raised to the caller.
+        """
+        import requests
+
+        payload = self.build_payload(messages, model, temperature, max_tokens, stream=True)
+        now = time.monotonic()
+        deadline, blocking_deadline = now + self.retry_budget, now + self.max_blocking_wait
+
+        attempt = 0
+        while True:
+            self._throttle(blocking_deadline)
+            self._acquire_slot(blocking_deadline)
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(self.url, json=payload, timeout=self.timeout, stream=True)
+            except requests.exceptions.Timeout:
+                error = LLMError(None, "Request to LLM API timed out", retryable=True)
+                retry_after = None
+            except BaseException:
+                self._semaphore.release()
+                raise
+            else:
+                if resp.status_code == 200:
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="stream", outcome="ok")
+                    # The slot stays taken until the body has been relayed
+                    break
+                error = self._status_error(resp.status_code, self._json_or_text(resp), resp.text)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                resp.close()
+            self._semaphore.release()
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="stream", outcome=_outcome(error))
+
+            if not error.retryable:
+                raise error
+            self._backoff(error, attempt, retry_after, deadline, blocking_deadline)
+            attempt += 1
+
+        try:
+            with resp, LLM_STREAM_SECONDS.time():
+                # SSE is always UTF-8, but without a charset requests would decode it as ISO-8859-1
+                resp.encoding = "utf-8"
+                for delta in iter_sse_deltas(resp.iter_lines(decode_unicode=True)):
+                    yield delta
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    def _json_or_text(resp):
+        try:
+            return resp.json()
+        except ValueError:
+            return resp.text
+
+    @staticmethod
+    def _status_error(status, body, text):
+        if status == 400:
+            return LLMError(400, _error_message(status, body, "Unknown error"))
+        if status == 404:
+            return LLMError(404, _error_message(status, body, "Model not found or unavailable"))
+        if status == 429:
+            return LLMError(429, "Rate limit exceeded", retryable=True)
+        return LLMError(status, text, retryable=status in RETRYABLE_STATUSES)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    # Asyncio path
+
+    def _ensure_async_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_loop is not loop or self._async_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._async_session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+        return self._async_session
+
+    async def acomplete(self, messages, model, temperature=0.7, max_tokens=500):
+        """Asyncio variant of :meth:`complete`; retries wait with ``asyncio.sleep``"""
+        session = self._ensure_async_session()
+        payload = self.build_payload(messages, model, temperature, max_tokens)
+        deadline = time.monotonic() + self.retry_budget
+
+        async with self._async_semaphore:
+            attempt = 0
+            while True:
+                wait = self._throttle_wait(deadline)
+                if wait:
+                    LLM_THROTTLE_SECONDS.observe(wait)
+                    await asyncio.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    async with session.post(self.url, json=payload) as resp:
+                        text = await resp.text()
+                        if resp.status == 200:
+                            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="async", outcome="ok")
+                            return extract_content(await resp.json(content_type=None))
+                        try:
+                            body = await resp.json(content_type=None)
+                        except ValueError:
+                            body = text
+                        error = self._status_error(resp.status, body, text)
+                        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                except asyncio.TimeoutError:
+                    error = LLMError(None, "Request to LLM API timed out", retryable=True)
+                    retry_after = None
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="async", outcome=_outcome(error))
+
+                if not error.retryable:
+                    raise error
+                delay = self._retry_wait(attempt, retry_after, deadline)
+                if delay is None:
+                    raise error
+                self._rate_limited(error, delay)
+                LLM_RETRIES.inc(reason=_outcome(error))
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def acomplete_many(self, conversations, model, temperature=0.7, max_tokens=500):
+        """Run many completions concurrently; failures are returned as LLMError instances"""
+        tasks = [self.acomplete(messages, model, temperature, max_tokens) for messages in conversations]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
@@ -0,0 +1,182 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are updated on the hot path under a per-metric
+lock; gauges that mirror existing stats (response cache, ingest queue,
+request coalescing) are read from collector callbacks only when /metrics is
+scraped. Each process keeps its own values, so with several gunicorn
+workers each one is a separate scrape target (or set WEB_CONCURRENCY=1).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; wide enough for both sub-millisecond DB work and slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][slot] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock seconds spent in the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state else 0
+
+    def _render_samples(self, items):
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}"
+
+
+def register_collector(collect):
+    """Add a callback returning gauge samples at scrape time.
+
+    ``collect()`` returns {name: (description, value)} or
+    {name: (description, [(labels_dict, value), ...])}; it may raise, in
+    which case its gauges are skipped for that scrape.
+    """
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+def render():
+    """Every metric and collected gauge as Prometheus text"""
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        try:
+            gauges = collect()
+        except Exception as e:
+            lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {_escape(e)}")
+            continue
+        for name, (description, samples) in gauges.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            if not isinstance(samples, list):
+                samples = [({}, samples)]
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared across services
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "sequel_http_request_seconds", "HTTP request latency by endpoint", ("method", "endpoint", "status"))
+LLM_REQUEST_SECONDS = Histogram(
+    "sequel_llm_request_seconds", "Upstream completion latency per attempt, until the response headers",
+    ("mode", "outcome"))
+LLM_STREAM_SECONDS = Histogram(
+    "sequel_llm_stream_seconds", "Time from the first streamed response byte to the end of the stream")
+LLM_RETRIES = Counter("sequel_llm_retries_total", "Upstream attempts that were retried", ("reason",))
+LLM_THROTTLE_SECONDS = Histogram(
+    "sequel_llm_throttle_seconds", "Time requests waited for the local rate limiter")
+CONCEPT_EXTRACT_SECONDS = Histogram(
+    "sequel_concept_extract_seconds", "Concept extraction time per call (no database work)", ("mode",))
+CONCEPT_DB_SECONDS = Histogram(
+    "sequel_concept_db_seconds", "Database time spent adding extracted concepts to the graph", ("path",))
+GRAPH_SERIALIZE_SECONDS = Histogram(
+    "sequel_graph_serialize_seconds", "Time get_graph_data spends loading and serializing nodes and edges",
+    ("full",))
+INGEST_BATCH_SECONDS = Histogram(
+    "sequel_ingest_batch_seconds", "Time to fold one claimed batch of chats into the graph")
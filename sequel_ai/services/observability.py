@@ -0,0 +1,222 @@
+"""Logging set-up, per-request instrumentation and an on-demand sampling profiler.
+
+configure_logging() sends leveled records to stderr as text or, with
+LOG_FORMAT=json, as one JSON object per line; records logged while a
+request is being handled carry its request id. instrument_app() times
+every request into the HTTP latency histogram and, when PROFILE_REQUESTS
+is enabled, profiles the requests that ask for it with an X-Profile
+header.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, has_request_context, request
+
+from services.metrics import HTTP_REQUEST_SECONDS
+
+# Requests slower than this are logged at WARNING
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "2"))
+
+# Profiling is off unless enabled; PROFILE_TOKEN, if set, must be sent as the X-Profile value
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS") == "1"
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+
+# Incoming X-Request-ID values are reused only if they look like an id (they end up in file names)
+REQUEST_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has; anything else was passed with extra= and goes into JSON output
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request's id (or "-") to records that were not given one"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id", "-") if has_request_context() else "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with ``extra=``"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, fmt=None):
+    """Install one stderr handler on the root logger; safe to call more than once.
+
+    level and fmt default to the LOG_LEVEL (INFO) and LOG_FORMAT (text or
+    json) environment variables.
+    """
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.environ.get("LOG_FORMAT", "text")
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if getattr(handler, "_sequel_handler", False):
+            root.removeHandler(handler)
+    handler = logging.StreamHandler()
+    handler._sequel_handler = True
+    handler.addFilter(RequestIdFilter())
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of selected threads from one background thread.
+
+    Sampling reads ``sys._current_frames()`` every ``interval`` seconds, so
+    profiled requests pay nothing beyond the GIL the sampler briefly holds
+    and unprofiled requests are not touched at all. Stacks are counted in
+    the collapsed ``root;caller;callee`` format read by flamegraph.pl and
+    speedscope.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        """Begin sampling a thread (the calling one by default)"""
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id=None):
+        """Stop sampling a thread and return its Counter of collapsed stacks"""
+        with self._lock:
+            return self._targets.pop(thread_id or threading.get_ident(), Counter())
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                targets = list(self._targets.items())
+            frames = sys._current_frames()
+            for thread_id, stacks in targets:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks[";".join(reversed(names))] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+profiler = SamplingProfiler()
+
+
+def _profile_requested():
+    if not PROFILE_REQUESTS:
+        return False
+    value = request.headers.get("X-Profile", "")
+    return bool(value) and (not PROFILE_TOKEN or value == PROFILE_TOKEN)
+
+
+def _save_profile(app, request_id, endpoint, stacks, seconds):
+    """Write collapsed stacks to PROFILE_DIR (default instance/profiles) and log the hottest frames"""
+    if not stacks:
+        return
+    directory = PROFILE_DIR or os.path.join(app.instance_path, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{request_id}.folded")
+    with open(path, "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    # Self time of the innermost frames gives a quick view without a flame graph
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    logger.info("Profiled %s: %d samples in %.3fs, written to %s", endpoint, sum(stacks.values()), seconds, path,
+                extra={"request_id": request_id, "profile": path, "hot_frames": leaves.most_common(5)})
+
+
+def instrument_app(app):
+    """Register request ids, latency metrics, slow-request logging and the profiler hook"""
+
+    @app.before_request
+    def _start_request():
+        request_id = request.headers.get("X-Request-ID", "")
+        g.request_id = request_id if REQUEST_ID.match(request_id) else uuid.uuid4().hex[:16]
+        g.request_started = time.perf_counter()
+        g.profiling = _profile_requested()
+        if g.profiling:
+            profiler.start()
+
+    @app.after_request
+    def _finish_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        # The request context is gone by the time the response closes, so capture what is logged now
+        fields = {"request_id": g.request_id, "method": request.method, "path": request.path,
+                  "endpoint": request.endpoint or "unmatched", "status": response.status_code}
+        response.headers["X-Request-ID"] = g.request_id
+        thread_id = threading.get_ident()
+        profiling = g.profiling
+        g.profiling = False
+
+        def finished():
+            # Streaming bodies are produced after after_request, so measure when the response closes
+            seconds = time.perf_counter() - started
+            HTTP_REQUEST_SECONDS.observe(seconds, method=fields["method"], endpoint=fields["endpoint"],
+                                         status=fields["status"])
+            fields["duration_ms"] = round(seconds * 1000, 1)
+            if seconds >= SLOW_REQUEST_SECONDS:
+                logger.warning("Slow request %s %s took %.2fs", fields["method"], fields["path"], seconds,
+                               extra=fields)
+            else:
+                logger.debug("%s %s %s", fields["method"], fields["path"], fields["status"], extra=fields)
+            if profiling:
+                _save_profile(app, fields["request_id"], fields["endpoint"], profiler.stop(thread_id), seconds)
+
+        response.call_on_close(finished)
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(error):
+        # The request failed before a response was made; stop sampling its thread
+        if g.get("profiling"):
+            profiler.stop()
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, text
+
+from models.db_model import db, CachedResponse
+from services.graph_service import CHUNK_SIZE, dialect_insert
+from services.metrics import register_collector
+
+# Set RESPONSE_CACHE=0 to send every message to the API
+CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") != "0"
+MEMORY_ENTRIES = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+MAX_ROWS = int(os.environ.get("RESPONSE_CACHE_MAX_ROWS", "50000"))
+TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Cosine similarity at which a differently worded prompt reuses a cached answer; 0 disables
+NEAR_DUPLICATE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0"))
+PROMPT_INDEX_DIM = 512
+
+# Expired and least recently hit rows are pruned once every this many stores
+PRUNE_EVERY = 100
+
+WHITESPACE = re.compile(r"\s+")
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU map whose entries expire after ttl seconds"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_memory = LRUCache(MEMORY_ENTRIES, TTL_SECONDS)
+
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "db_evictions": 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def normalize_prompt(message):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return WHITESPACE.sub(" ", message.lower()).strip().rstrip("?!. ")
+
+
+def cache_key(prompt, model, temperature, context=""):
+    """Key for a prompt; ``context`` identifies the conversation history it was asked in"""
+    parts = [prompt, model, round(float(temperature), 3)]
+    if context:
+        # Keys of prompts asked without history stay the same as before sessions existed
+        parts.append(context)
+    raw = json.dumps(parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _prompt_index():
+    from services.similarity_index import get_similarity_index
+    path = current_app.config.get("RESPONSE_CACHE_INDEX_PATH") or os.path.join(current_app.instance_path, "prompt_index")
+    return get_similarity_index(path, PROMPT_INDEX_DIM)
+
+
+def _cutoff():
+    return datetime.utcnow() - timedelta(seconds=TTL_SECONDS)
+
+
+def _near_duplicate(prompt, model, temperature):
+    """Closest cached prompt for the same model and temperature above the similarity threshold"""
+    matches = _prompt_index().query([prompt], k=5, min_similarity=NEAR_DUPLICATE_SIMILARITY)[0]
+    if not matches:
+        return None
+    ids = ",".join(str(int(row_id)) for row_id, _ in matches)
+    rows = {row[0]: row for row in db.session.execute(
+        text(f"SELECT id, response FROM response_cache WHERE id IN ({ids}) "
+             "AND model = :model AND temperature = :temperature AND created_at >= :cutoff"),
+        {"model": model, "temperature": temperature, "cutoff": _cutoff()},
+    )}
+    for row_id, _ in matches:
+        if row_id in rows:
+            return rows[row_id]
+    return None
+
+
+def lookup(message, model, temperature, context=""):
+    """Return the cached response for a prompt, or None on a miss.
+
+    Hits in the persistent tier update its hit counters; the caller commits.
+    """
+    if not CACHE_ENABLED:
+        return None
+    prompt = normalize_prompt(message)
+    key = cache_key(prompt, model, temperature, context)
+
+    response = _memory.get(key)
+    if response is not None:
+        _count("memory_hits")
+        return response
+
+    row = db.session.execute(
+        text("SELECT id, response FROM response_cache WHERE key = :key AND created_at >= :cutoff"),
+        {"key": key, "cutoff": _cutoff()},
+    ).first()
+    if row is not None:
+        _count("db_hits")
+    elif NEAR_DUPLICATE_SIMILARITY > 0 and not context:
+        # A differently worded follow-up may depend on the history, so only standalone prompts match
+        row = _near_duplicate(prompt, model, temperature)
+        if row is not None:
+            _count("similar_hits")
+    if row is None:
+        _count("misses")
+        return None
+
+    db.session.execute(
+        text("UPDATE response_cache SET hits = hits + 1, last_hit_at = :now WHERE id = :id"),
+        {"id": row[0], "now": datetime.utcnow()},
+    )
+    _memory.put(key, row[1])
+    return row[1]
+
+
+def store_many(entries):
+    """Cache (message, model, temperature, response[, context]) tuples; the caller commits.
+
+    A later response for the same prompt replaces the earlier one.
+    """
+    if not CACHE_ENABLED or not entries:
+        return 0
+    now = datetime.utcnow()
+    rows = {}
+    pending = []
+    for message, model, temperature, response, *context in entries:
+        if not response:
+            continue
+        prompt = normalize_prompt(message)
+        key = cache_key(prompt, model, temperature, *context)
+        rows[key] = {"key": key, "prompt": prompt, "model": model, "temperature": temperature,
+                     "response": response, "hits": 0, "created_at": now, "last_hit_at": now}
+        _memory.put(key, response)
+        if not any(context):
+            pending.append(key)
+    if not rows:
+        return 0
+
+    stmt = dialect_insert(CachedResponse)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"response": stmt.excluded.response, "created_at": stmt.excluded.created_at},
+    )
+    db.session.execute(stmt, list(rows.values()))
+
+    if NEAR_DUPLICATE_SIMILARITY > 0 and pending:
+        db.session().info.setdefault("pending_prompts", []).extend(pending)
+
+    with _stats_lock:
+        before = _stats["stores"] // PRUNE_EVERY
+        _stats["stores"] += len(rows)
+        due = _stats["stores"] // PRUNE_EVERY > before
+    if due:
+        prune()
+    return len(rows)
+
+
+def store(message, model, temperature, response, context=""):
+    """Cache one successful response; the caller commits"""
+    return store_many([(message, model, temperature, response, context)])
+
+
+def _index_after_commit(session):
+    """Make committed prompts available to near-duplicate lookups"""
+    keys = session.info.pop("pending_prompts", None)
+    if not keys:
+        return
+    rows = []
+    with db.engine.connect() as conn:
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            placeholders = ",".join(f":k{i}" for i in range(len(chunk)))
+            rows.extend(conn.execute(
+                text(f"SELECT id, prompt FROM response_cache WHERE key IN ({placeholders})"),
+                {f"k{i}": key for i, key in enumerate(chunk)},
+            ))
+    _prompt_index().add([row[0] for row in rows], [row[1] for row in rows])
+
+
+def _discard_pending_prompts(session):
+    session.info.pop("pending_prompts", None)
+
+
+event.listen(db.session, "after_commit", _index_after_commit)
+event.listen(db.session, "after_rollback", _discard_pending_prompts)
+
+
+def prune():
+    """Delete expired rows and the least recently hit rows beyond MAX_ROWS; the caller commits"""
+    removed = db.session.execute(
+        text("DELETE FROM response_cache WHERE created_at < :cutoff"), {"cutoff": _cutoff()}
+    ).rowcount
+    removed += db.session.execute(
+        text("DELETE FROM response_cache WHERE id NOT IN "
+             "(SELECT id FROM response_cache ORDER BY last_hit_at DESC, id DESC LIMIT :keep)"),
+        {"keep": MAX_ROWS},
+    ).rowcount
+    _count("db_evictions", removed)
+    return removed
+
+
+def clear():
+    """Empty both tiers and the near-duplicate prompt index"""
+    _memory.clear()
+    CachedResponse.query.delete()
+    db.session.commit()
+    _prompt_index().reset()
+
+
+def rebuild_prompt_index(batch_size=10000):
+    """Re-index every cached prompt for near-duplicate lookups"""
+    index = _prompt_index()
+    index.reset()
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            text("SELECT id, prompt FROM response_cache WHERE id > :after ORDER BY id LIMIT :limit"),
+            {"after": last_id, "limit": batch_size},
+        ).all()
+        if not rows:
+            break
+        index.add([row[0] for row in rows], [row[1] for row in rows])
+        last_id = rows[-1][0]
+    return len(index)
+
+
+def cache_stats():
+    """Hit/miss counters for this process plus the size of each tier"""
+    with _stats_lock:
+        stats = dict(_stats)
+    hits = stats["memory_hits"] + stats["db_hits"] + stats["similar_hits"]
+    lookups = hits + stats["misses"]
+    stats.update({
+        "enabled": CACHE_ENABLED,
+        "hits": hits,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_entries": len(_memory),
+        "memory_evictions": _memory.evictions,
+        "db_entries": CachedResponse.query.count(),
+        "near_duplicate_similarity": NEAR_DUPLICATE_SIMILARITY,
+    })
+    return stats
+
+
+def _cache_gauges():
+    stats = cache_stats()
+    return {
+        "sequel_response_cache_lookups": ("Response cache lookups by this process, by result", [
+            ({"result": "memory_hit"}, stats["memory_hits"]),
+            ({"result": "db_hit"}, stats["db_hits"]),
+            ({"result": "similar_hit"}, stats["similar_hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        "sequel_response_cache_hit_rate": ("Share of lookups answered from the cache", stats["hit_rate"]),
+        "sequel_response_cache_entries": ("Cached responses per tier", [
+            ({"tier": "memory"}, stats["memory_entries"]),
+            ({"tier": "db"}, stats["db_entries"]),
+        ]),
+        "sequel_response_cache_evictions": ("Entries evicted per tier", [
+            ({"tier": "memory"}, stats["memory_evictions"]),
+            ({"tier": "db"}, stats["db_evictions"]),
+        ]),
+    }
+
+
+register_collector(_cache_gauges)
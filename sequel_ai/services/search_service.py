@@ -0,0 +1,232 @@
+import os
+import re
+
+from sqlalchemy import text
+
+from models.db_model import db
+from models.migrations import CHAT_TSVECTOR
+from services.chat_service import existing_node_ids, find_concepts_batch, link_chat_concepts
+from services.concept_extractor import extraction_pool
+
+MAX_LIMIT = 100
+# Ranked results are paged by offset, which gets slower the deeper it goes
+MAX_OFFSET = 1000
+# Newest full-text matches scored for relevance on SQLite
+RANK_WINDOW = int(os.environ.get("SEARCH_RANK_WINDOW", "2000"))
+# Longest query accepted, in terms
+MAX_TERMS = 16
+
+TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(query):
+    """Turn free text into a safe FTS5 MATCH expression: every term must appear.
+
+    Terms are quoted so user input cannot inject FTS5 operators; a trailing
+    ``*`` makes the last term a prefix match.
+    """
+    terms = TERM.findall(query)[:MAX_TERMS]
+    if not terms:
+        return ""
+    expression = " ".join(f'"{term}"' for term in terms)
+    return expression + "*" if query.rstrip().endswith("*") else expression
+
+
+def _has_fts():
+    return db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'chat_fts'")).first() is not None
+
+
+def _concepts_by_chat(chat_ids):
+    """{chat_id: [label, ...]} for a page of results, in one query"""
+    if not chat_ids:
+        return {}
+    ids = ",".join(str(int(chat_id)) for chat_id in chat_ids)
+    concepts = {}
+    for chat_id, label in db.session.execute(text(
+            f"SELECT cc.chat_id, n.label FROM chat_concept cc JOIN node n ON n.id = cc.node_id "
+            f"WHERE cc.chat_id IN ({ids}) ORDER BY cc.chat_id, n.label")):
+        concepts.setdefault(chat_id, []).append(label)
+    return concepts
+
+
+def _results(rows):
+    concepts = _concepts_by_chat([row.id for row in rows])
+    return [
+        {
+            "id": row.id,
+            "session_id": row.session_id,
+            "message": row.message,
+            "response": row.response,
+            "snippet": row.snippet,
+            "timestamp": str(row.timestamp),
+            "score": None if row.score is None else round(float(row.score), 4),
+            "concepts": concepts.get(row.id, []),
+        }
+        for row in rows
+    ]
+
+
+def _fts_search(params, recent, session_id, before):
+    """SQL for an FTS5 search; every shape reads only the index entries it needs"""
+    snippet = "snippet(chat_fts, -1, '[', ']', '…', 16) AS snippet"
+    columns = "c.id, c.session_id, c.message, c.response, c.timestamp"
+    if session_id:
+        # A session holds few chats, so walk its index and probe the full-text index for each.
+        # BM25 would recount the corpus-wide term frequencies on every probe, so these are
+        # returned newest first without a score.
+        cursor = " AND c.id < :before" if before else ""
+        return (f"SELECT {columns}, NULL AS score, {snippet} "
+                "FROM chat c CROSS JOIN chat_fts ON chat_fts.rowid = c.id "
+                f"WHERE c.session_id = :session{cursor} AND chat_fts MATCH :query "
+                "ORDER BY c.id DESC LIMIT :limit OFFSET :offset")
+    if recent:
+        # rowid order and rowid ranges are answered by the FTS index itself
+        cursor = " AND chat_fts.rowid < :before" if before else ""
+        return (f"SELECT {columns}, -chat_fts.rank AS score, {snippet} "
+                "FROM chat_fts JOIN chat c ON c.id = chat_fts.rowid "
+                f"WHERE chat_fts MATCH :query{cursor} ORDER BY chat_fts.rowid DESC LIMIT :limit OFFSET :offset")
+    # BM25 costs a document read per match, so only the newest RANK_WINDOW matches are scored;
+    # the page is then joined back to build snippets for just its rows
+    params["window"] = RANK_WINDOW
+    return (f"SELECT {columns}, -m.score AS score, {snippet} FROM "
+            "(SELECT id, score FROM (SELECT rowid AS id, bm25(chat_fts) AS score FROM chat_fts "
+            "WHERE chat_fts MATCH :query ORDER BY rowid DESC LIMIT :window) "
+            "ORDER BY score LIMIT :limit OFFSET :offset) m "
+            "CROSS JOIN chat_fts ON chat_fts.rowid = m.id CROSS JOIN chat c ON c.id = m.id "
+            "WHERE chat_fts MATCH :query ORDER BY m.score")
+
+
+def search_chats(query, limit=20, offset=0, sort="rank", before=None, session_id=None):
+    """Full-text search over chat messages and responses.
+
+    sort="rank" orders by relevance (BM25 on SQLite, ts_rank on PostgreSQL;
+    higher scores are better)
+    and pages with offset; on SQLite, relevance is ranked among the newest
+    RANK_WINDOW matches so common terms stay fast, and searches within a
+    session come back newest first. sort="recent" orders newest first and
+    pages with the ``before`` chat id cursor, which stays fast at any depth.
+    Returns {"results": [...], "next": cursor or None}.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    offset = max(0, min(offset, MAX_OFFSET))
+    recent = sort == "recent"
+    params = {"limit": limit, "offset": 0 if recent else offset}
+    if session_id:
+        params["session"] = session_id
+    if recent and before:
+        params["before"] = before
+
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite" and _has_fts():
+        params["query"] = fts_query(query)
+        if not params["query"]:
+            return {"results": [], "next": None}
+        sql = _fts_search(params, recent, session_id, recent and before)
+    else:
+        filters = ""
+        if session_id:
+            filters += " AND c.session_id = :session"
+        if recent and before:
+            filters += " AND c.id < :before"
+        if dialect == "postgresql":
+            params["query"] = query
+            order = "c.id DESC" if recent else "score DESC, c.id DESC"
+            sql = ("SELECT c.id, c.session_id, c.message, c.response, c.timestamp, "
+                   f"ts_rank({CHAT_TSVECTOR}, q) AS score, left(c.response, 200) AS snippet "
+                   "FROM chat c, websearch_to_tsquery('english', :query) q "
+                   f"WHERE {CHAT_TSVECTOR} @@ q{filters} ORDER BY {order} LIMIT :limit OFFSET :offset")
+        else:
+            # No full-text index: scan newest first for a literal match
+            terms = TERM.findall(query)[:MAX_TERMS]
+            if not terms:
+                return {"results": [], "next": None}
+            for i, term in enumerate(terms):
+                filters += f" AND (c.message LIKE :t{i} OR c.response LIKE :t{i})"
+                params[f"t{i}"] = f"%{term}%"
+            sql = ("SELECT c.id, c.session_id, c.message, c.response, c.timestamp, NULL AS score, "
+                   "substr(c.response, 1, 200) AS snippet "
+                   f"FROM chat c WHERE 1 = 1{filters} ORDER BY c.id DESC LIMIT :limit OFFSET :offset")
+
+    rows = db.session.execute(text(sql), params).all()
+    results = _results(rows)
+    if len(rows) < limit:
+        cursor = None
+    elif recent:
+        cursor = rows[-1].id
+    else:
+        cursor = offset + limit if offset + limit <= MAX_OFFSET else None
+    return {"results": results, "next": cursor}
+
+
+def chats_for_concept(node_id=None, label=None, limit=20, before=None):
+    """Conversations that mentioned a concept, newest first, paged by the ``before`` chat id.
+
+    Returns None when the concept does not exist.
+    """
+    if node_id is None:
+        node_id = db.session.execute(text("SELECT id FROM node WHERE label = :label"), {"label": label}).scalar()
+    node = db.session.execute(text("SELECT id, label FROM node WHERE id = :id"), {"id": node_id}).first()
+    if node is None:
+        return None
+    limit = max(1, min(limit, MAX_LIMIT))
+    params = {"node": node.id, "limit": limit}
+    cursor_filter = ""
+    if before:
+        cursor_filter = " AND cc.chat_id < :before"
+        params["before"] = before
+    rows = db.session.execute(text(
+        "SELECT c.id, c.session_id, c.message, c.response, c.timestamp, NULL AS score, NULL AS snippet "
+        "FROM chat_concept cc JOIN chat c ON c.id = cc.chat_id "
+        f"WHERE cc.node_id = :node{cursor_filter} ORDER BY cc.chat_id DESC LIMIT :limit"), params).all()
+    return {
+        "concept": {"id": str(node.id), "label": node.label},
+        "results": _results(rows),
+        "next": rows[-1].id if len(rows) == limit else None,
+    }
+
+
+def backfill_search(batch_size=5000, after=0, progress=None, workers=1):
+    """Index chats stored before search existed; safe to re-run.
+
+    Rebuilds the SQLite full-text index from the chat table (unless resuming),
+    then links every chat after ``after`` that has no concept links yet and
+    is not waiting to be ingested to the existing nodes of its concepts, in
+    batches of batch_size, committing each batch. Ingested chats are skipped
+    so they are neither relinked to different concepts nor counted twice in
+    the document frequencies.
+    ``progress(last_id, chats, links)`` is called after every batch. With
+    workers > 1, concept extraction is spread over that many processes.
+    """
+    if not after and db.engine.dialect.name == "sqlite" and _has_fts():
+        db.session.execute(text("INSERT INTO chat_fts (chat_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+    if workers > 1:
+        with extraction_pool(workers) as pool:
+            return _link_chats(batch_size, after, progress, pool)
+    return _link_chats(batch_size, after, progress, None)
+
+
+def _link_chats(batch_size, after, progress, pool):
+    chats = links = 0
+    last_id = after
+    while True:
+        rows = db.session.execute(
+            text("SELECT id, message, response FROM chat WHERE id > :after "
+                 "AND NOT EXISTS (SELECT 1 FROM chat_concept WHERE chat_concept.chat_id = chat.id) "
+                 "AND NOT EXISTS (SELECT 1 FROM ingest_job WHERE ingest_job.chat_id = chat.id) "
+                 "ORDER BY id LIMIT :limit"),
+            {"after": last_id, "limit": batch_size},
+        ).all()
+        if not rows:
+            break
+        concept_sets = find_concepts_batch([(message, response) for _, message, response in rows], pool)
+        node_ids = existing_node_ids({label for concepts in concept_sets for label in concepts})
+        links += link_chat_concepts([row[0] for row in rows], concept_sets, node_ids)
+        db.session.commit()
+
+        last_id = rows[-1][0]
+        chats += len(rows)
+        if progress:
+            progress(last_id, chats, links)
+    return {"chats": chats, "links": links}
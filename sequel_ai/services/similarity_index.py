@@ -0,0 +1,261 @@
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+# Hashed feature space for concept labels (words plus character trigrams)
+DEFAULT_DIM = 256
+
+# Concepts below this cosine similarity are never linked
+MIN_SIMILARITY = 0.1
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def label_features(label, dim=DEFAULT_DIM):
+    """Hash a label's words and character trigrams into bucket -> count"""
+    features = {}
+    for word in WORD_PATTERN.findall(label.lower()):
+        tokens = [word]
+        padded = f" {word} "
+        tokens.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        for token in tokens:
+            bucket = zlib.crc32(token.encode("utf-8")) % dim
+            features[bucket] = features.get(bucket, 0) + 1
+    return features
+
+
+def label_vectors(labels, dim=DEFAULT_DIM):
+    """Raw term-frequency vectors for labels as a (len(labels), dim) float32 array"""
+    vectors = np.zeros((len(labels), dim), dtype=np.float32)
+    for row, label in enumerate(labels):
+        for bucket, count in label_features(label, dim).items():
+            vectors[row, bucket] = count
+    return vectors
+
+
+class SimilarityIndex:
+    """Persistent, incrementally built TF-IDF index over concept labels.
+
+    Raw term-frequency rows and their node ids live in memory-mapped files
+    that grow by doubling; document frequencies are kept per hash bucket so
+    IDF weights reflect every concept ever added, not just one message.
+    Queries run against an in-memory matrix of normalised TF-IDF rows that
+    is extended on every add and rebuilt once the corpus has grown enough for
+    the IDF weights to have drifted.
+    """
+
+    REWEIGHT_GROWTH = 1.25
+
+    def __init__(self, path, dim=DEFAULT_DIM):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._open()
+
+    # Storage
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        meta_path = self._file("meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.count = meta["count"]
+            self.capacity = meta["capacity"]
+            self.doc_freq = np.asarray(meta["doc_freq"], dtype=np.float64)
+        else:
+            self.count = 0
+            self.capacity = 1024
+            self.doc_freq = np.zeros(self.dim, dtype=np.float64)
+            self._allocate(self.capacity)
+        self._meta_mtime = os.path.getmtime(meta_path) if os.path.exists(meta_path) else None
+        self._map()
+        self._weighted = None
+        self._weighted_count = 0
+        self._weighted_docs = 0
+
+    def _allocate(self, capacity):
+        for name, itemsize in (("vectors.f32", 4 * self.dim), ("ids.i64", 8)):
+            with open(self._file(name), "ab") as f:
+                f.truncate(capacity * itemsize)
+
+    def _map(self):
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.dim))
+        self.ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r+", shape=(self.capacity,))
+
+    def _save_meta(self):
+        self.vectors.flush()
+        self.ids.flush()
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                       "doc_freq": self.doc_freq.astype(np.int64).tolist()}, f)
+        os.replace(tmp, self._file("meta.json"))
+        self._meta_mtime = os.path.getmtime(self._file("meta.json"))
+
+    def _refresh(self):
+        """Reopen if another process has written to the index since we loaded it"""
+        meta_path = self._file("meta.json")
+        if os.path.exists(meta_path) and os.path.getmtime(meta_path) != self._meta_mtime:
+            self._open()
+
+    def _file_lock(self):
+        return _FileLock(self._file("write.lock"))
+
+    # Weighting
+
+    def _idf(self):
+        return (np.log((1.0 + self.count) / (1.0 + self.doc_freq)) + 1.0).astype(np.float32)
+
+    @staticmethod
+    def _normalise(matrix):
+        norms = np.sqrt((matrix ** 2).sum(axis=1, keepdims=True))
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _weighted_matrix(self):
+        """Normalised TF-IDF rows for every indexed concept"""
+        if self._weighted is None or self.count > self._weighted_docs * self.REWEIGHT_GROWTH:
+            self._weighted = np.empty((self.capacity, self.dim), dtype=np.float32)
+            self._weighted_count = 0
+            self._weighted_docs = self.count
+        if self._weighted_count < self.count:
+            if self.count > len(self._weighted):
+                grown = np.empty((self.capacity, self.dim), dtype=np.float32)
+                grown[:self._weighted_count] = self._weighted[:self._weighted_count]
+                self._weighted = grown
+            rows = np.asarray(self.vectors[self._weighted_count:self.count]) * self._idf()
+            self._weighted[self._weighted_count:self.count] = self._normalise(rows)
+            self._weighted_count = self.count
+        return self._weighted[:self.count]
+
+    def weigh(self, labels):
+        """Normalised TF-IDF query vectors for labels under the current corpus statistics"""
+        with self._lock:
+            return self._normalise(label_vectors(labels, self.dim) * self._idf())
+
+    # Public API
+
+    def __len__(self):
+        return self.count
+
+    def add(self, node_ids, labels):
+        """Index new concepts; ids that are already indexed are skipped"""
+        if not node_ids:
+            return 0
+        with self._lock, self._file_lock():
+            self._refresh()
+            node_ids = np.asarray(node_ids, dtype=np.int64)
+            fresh = ~np.isin(node_ids, self.ids[:self.count])
+            if not fresh.any():
+                return 0
+            node_ids = node_ids[fresh]
+            vectors = label_vectors([label for label, keep in zip(labels, fresh) if keep], self.dim)
+
+            needed = self.count + len(node_ids)
+            if needed > self.capacity:
+                capacity = self.capacity
+                while capacity < needed:
+                    capacity *= 2
+                del self.vectors, self.ids
+                self._allocate(capacity)
+                self.capacity = capacity
+                self._map()
+
+            self.vectors[self.count:needed] = vectors
+            self.ids[self.count:needed] = node_ids
+            self.doc_freq += (vectors > 0).sum(axis=0)
+            self.count = needed
+            self._save_meta()
+            return len(node_ids)
+
+    def query(self, labels, k=10, min_similarity=MIN_SIMILARITY, exclude_ids=None):
+        """Batch k-nearest-neighbour lookup.
+
+        Returns one list of (node_id, similarity) pairs per label, best first.
+        """
+        with self._lock:
+            self._refresh()
+            if not labels or self.count == 0:
+                return [[] for _ in labels]
+            matrix = self._weighted_matrix()
+            ids = np.asarray(self.ids[:self.count])
+            queries = self._normalise(label_vectors(labels, self.dim) * self._idf())
+
+        scores = matrix @ queries.T
+        if exclude_ids:
+            scores[np.isin(ids, list(exclude_ids))] = -1.0
+
+        # Only rows above the threshold can be returned, which is usually a tiny fraction
+        results = []
+        for column in range(scores.shape[1]):
+            column_scores = scores[:, column]
+            candidates = np.flatnonzero(column_scores >= min_similarity)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-column_scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-column_scores[candidates])]
+            results.append([(int(ids[row]), float(column_scores[row])) for row in candidates])
+        return results
+
+    def reset(self):
+        """Drop every indexed concept (used when the graph is rebuilt)"""
+        with self._lock, self._file_lock():
+            del self.vectors, self.ids
+            for name in ("vectors.f32", "ids.i64", "meta.json"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._open()
+            self._save_meta()
+
+
+class _FileLock:
+    """Advisory cross-process lock so two processes never append at once"""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.handle = open(self.path, "w")
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+
+
+def pairwise_similarity(index, labels):
+    """Cosine similarities between labels using the index's corpus-wide IDF weights"""
+    vectors = index.weigh(labels)
+    return vectors @ vectors.T
+
+
+def get_similarity_index(path, dim=DEFAULT_DIM):
+    """Process-wide index instance for path"""
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = SimilarityIndex(path, dim)
+            _indexes[path] = index
+        return index
@@ -27,4 +27,9 @@ REM Set Flask environment variables
 set FLASK_APP=app.py
 set FLASK_ENV=development
 
+REM Create the database tables and sample graph
+echo Creating database...
+flask db init
+flask seed
+
 echo Setup complete! You can now run the application with: flask run 
\ No newline at end of file
@@ -27,4 +27,9 @@ pip install -r requirements.txt
 export FLASK_APP=app.py
 export FLASK_ENV=development
 
+# Create the database tables and sample graph
+echo "Creating database..."
+flask db init
+flask seed
+
 echo "Setup complete! You can now run the application with: flask run" 
\ No newline at end of file
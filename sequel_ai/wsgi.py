@@ -0,0 +1,15 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app        (Linux/macOS)
+    python wsgi.py                               (Windows, serves with waitress)
+"""
+import os
+
+from app import app
+
+application = app
+
+if __name__ == '__main__':
+    from waitress import serve
+    serve(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)),
+          threads=int(os.environ.get('WEB_THREADS', 16)))